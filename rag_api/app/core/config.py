@@ -10,17 +10,71 @@ class Settings(BaseSettings):
     QDRANT_PORT: int = 6333
     QDRANT_COLLECTION: str = "imc_corpus_hybrid"
     QDRANT_TIMEOUT: float = 30.0
+    QDRANT_PREFER_GRPC: bool = False
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_POOL_SIZE: int = 32
+
+    # Bulk ingestion
+    UPSERT_BATCH_SIZE: int = 256
+    UPSERT_CONCURRENCY: int = 4
+    UPSERT_WAIT: bool = False
 
     EMBEDDING_MODEL: str = "BAAI/bge-large-en-v1.5"
+    SPARSE_EMBEDDING_MODEL: str = "prithivida/Splade_PP_en_v1"
+
+    # Retrieval mode: "hybrid", "dense", "sparse" or "auto" (keyword-style queries go sparse-only).
+    # Only the models the deployment mode needs are loaded at startup.
+    RETRIEVAL_MODE: str = "hybrid"
+    RETRIEVAL_AUTO_SPARSE_MAX_TERMS: int = 3
+
+    # Query embedding micro-batching
+    EMBED_BATCHING_ENABLED: bool = True
+    EMBED_BATCH_WINDOW_MS: float = 2.0
+    EMBED_MAX_BATCH_SIZE: int = 32
+
+    # Run the dense and sparse models concurrently with split intra-op threads
+    EMBED_PARALLEL: bool = False
+    EMBED_THREADS: int = 0  # total threads for both models, 0 = all cores
+    EMBED_DENSE_THREAD_SHARE: float = 0.75
+    EMBED_PARALLEL_POOL_SIZE: int = 2
+
+    # Bounded executor for query embedding on the async request path
+    EMBED_EXECUTOR_WORKERS: int = 4
+
+    # Query embedding cache (keyed on canonicalized query text)
+    EMBED_CACHE_ENABLED: bool = True
+    EMBED_CACHE_SIZE: int = 4096
+    EMBED_CACHE_TTL_SECONDS: int = 86400
+    EMBED_CACHE_DTYPE: str = "float32"  # "float32" or "float16"
+
+    # Shared embedding server (python -m app.services.embed_server). When set, API
+    # workers send embedding requests over this Unix socket instead of loading models.
+    EMBED_SERVER_SOCKET: str | None = None
+    EMBED_SERVER_POOL_SIZE: int = 4
+    EMBED_SERVER_SHM_BYTES: int = 4 * 1024 * 1024
 
     # LLM general settings
     LLM_PROVIDER: str = "azure_openai"  # "azure_openai" or "ollama"
     TEMPERATURE: float = 0.2
     MAX_TOKENS: int = 1024
 
+    # Pool of generation backends (JSON list); when set it replaces the single provider above, e.g.
+    # [{"provider": "ollama", "base_url": "http://gpu1:11434", "max_concurrency": 4},
+    #  {"provider": "azure_openai", "endpoint": "https://...", "api_key": "...", "model": "gpt-4o-mini"}]
+    LLM_BACKENDS: str | None = None
+    LLM_BACKEND_MAX_CONCURRENCY: int = 4
+    LLM_HEALTH_CHECK_SECONDS: float = 15.0
+
     # Ollama-specific (Left for legacy fallback if ever needed)
     OLLAMA_BASE_URL: str = "http://localhost:11434"
     OLLAMA_MODEL: str = "deepseek-r1:14b"
+    # How long Ollama keeps the model loaded after a request ("30m", "-1" = forever; None = server default)
+    OLLAMA_KEEP_ALIVE: str | None = "30m"
+    # Context window to load the model with (0 = model default); keep it fixed, changing it reloads the model
+    OLLAMA_NUM_CTX: int = 0
+    # Ping the model this often so it (and Ollama's cached prompt prefix) stays loaded through
+    # idle periods; never less often than half of OLLAMA_KEEP_ALIVE (0 disables)
+    LLM_KEEP_WARM_SECONDS: float = 600
 
     # Azure OpenAI-specific
     AZURE_OPENAI_API_KEY: str | None = None
@@ -38,6 +92,80 @@ class Settings(BaseSettings):
     LOG_LEVEL: str = "INFO"
 
     TOP_K: int = 5
+
+    # Prompt context packing: retrieved chunks fill at most CONTEXT_TOKEN_BUDGET tokens in score order,
+    # and chunks scoring below CONTEXT_MIN_SCORE_RATIO x the top hit are left out (0 disables either)
+    CONTEXT_TOKEN_BUDGET: int = 2048
+    CONTEXT_MIN_SCORE_RATIO: float = 0.35
+    # A chunk that doesn't fit is cut down only if at least this many tokens are left
+    CONTEXT_MIN_CHUNK_TOKENS: int = 64
+    # tokenizer.json (Hugging Face tokenizers) for exact counts; without it tokens are estimated
+    CONTEXT_TOKENIZER_PATH: str | None = None
+
+    # /query/batch
+    BATCH_MAX_QUESTIONS: int = 256
+    BATCH_LLM_CONCURRENCY: int = 4
+
+    # Degraded-mode local snapshot of the collection, searched when Qdrant is unreachable
+    LOCAL_INDEX_ENABLED: bool = False
+    LOCAL_INDEX_PATH: str = "/models/local_index"
+    LOCAL_INDEX_DTYPE: str = "float16"  # "float16" or "int8"
+    LOCAL_INDEX_REFRESH_SECONDS: int = 900
+    LOCAL_INDEX_MAX_POINTS: int = 500_000
+    # With a snapshot loaded, give up on Qdrant after this long instead of QDRANT_TIMEOUT
+    LOCAL_INDEX_QDRANT_TIMEOUT: float = 2.0
+
+    # End-to-end budget per request (retrieval + time to first LLM token); 0 disables it
+    REQUEST_DEADLINE_SECONDS: float = 60.0
+    # Circuit breakers around Qdrant and the LLM backend
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_SECONDS: float = 30.0
+    # LLM HTTP timeouts (read = longest gap between streamed bytes)
+    LLM_CONNECT_TIMEOUT: float = 5.0
+    LLM_READ_TIMEOUT: float = 120.0
+    LLM_WRITE_TIMEOUT: float = 30.0
+    LLM_POOL_TIMEOUT: float = 10.0  # wait for a free pooled connection
+    # LLM HTTP connection pool (shared by all requests in a worker)
+    LLM_POOL_MAX_CONNECTIONS: int = 64
+    LLM_POOL_MAX_KEEPALIVE: int = 32
+    LLM_KEEPALIVE_EXPIRY: float = 120.0
+    LLM_HTTP2: bool = False  # Azure OpenAI over TLS; Ollama only speaks HTTP/1.1
+    # Connections opened at startup so the first requests skip TCP/TLS setup (0 disables)
+    LLM_WARMUP_CONNECTIONS: int = 4
+
+    # Corpus version in every cache key. With fingerprinting on it becomes "<INDEX_VERSION>-<fingerprint>"
+    # of the collection (alias target, vector config, point count), re-checked every INDEX_FINGERPRINT_SECONDS
+    INDEX_VERSION: str = "v1"
+    INDEX_FINGERPRINT_ENABLED: bool = True
+    INDEX_FINGERPRINT_SECONDS: int = 60
+
+    # Answer / retrieval caches: bounded by entry count and by measured bytes
+    ANSWER_CACHE_MAX_ENTRIES: int = 4096
+    ANSWER_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = 4096
+    RETRIEVAL_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    # Entries are served fresh for the TTL, then stale (while a background refresh runs) for STALE more seconds
+    ANSWER_CACHE_TTL_SECONDS: int = 3600
+    ANSWER_CACHE_STALE_SECONDS: int = 3600
+    RETRIEVAL_CACHE_TTL_SECONDS: int = 3600
+    RETRIEVAL_CACHE_STALE_SECONDS: int = 1800
+    # "memory" (per process) or "sqlite" (WAL database shared by workers on a node, kept across restarts)
+    CACHE_BACKEND: str = "memory"
+    CACHE_SQLITE_PATH: str = "/models/cache/rag_cache.sqlite3"
+    # The shared tier holds this many times one worker's in-process limits
+    CACHE_BACKEND_SIZE_FACTOR: int = 4
+    # LSH tables for semantic answer-cache lookups (0 = exact scan per context)
+    SEMANTIC_CACHE_ANN_TABLES: int = 0
+    # Track question popularity and pre-generate answers for the top N after a restart / index change
+    WARMER_ENABLED: bool = False
+    WARMER_TOP_N: int = 50
+    WARMER_CONCURRENCY: int = 2
+    WARMER_MAX_TRACKED: int = 10_000
+    WARMER_STATE_PATH: str = "/models/cache/question_stats.json"
+    WARMER_SAVE_SECONDS: int = 300
+    # Without a shared cache backend every worker warms its own cache, each after a random delay up to this long
+    WARMER_JITTER_SECONDS: float = 30
+
     CHUNK_SIZE: int = 800
     CHUNK_OVERLAP: int = 100
 
@@ -10,7 +10,20 @@ from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.routes import query, stream
-from app.services.embeddings import get_models
+from app.services.embeddings import get_models, get_embedding_batcher
+from app.services.qdrant_client import close_async_qdrant, get_async_qdrant
+from app.services.index_version import index_version, check_index_version, run_index_version_monitor
+from app.services.local_index import local_index, run_local_index_refresher
+from app.services.llm import get_llm_client, warmup_llm_client, close_llm_client, run_llm_keep_warm
+from app.services.llm_router import run_llm_health_checks
+from app.services.warmer import cache_warmer, run_cache_warmer
+from app.services.context_packer import context_packer
+from app.utils.embedding_cache import query_embedding_cache
+from app.utils.resilience import qdrant_breaker, llm_breaker
+from app.utils.ttlcache import answer_cache, retrieval_cache
+from app.utils.chunk_store import retrieval_chunk_store
+from app.utils.singleflight import inflight_generations
+from app.utils.generation_metrics import generation_metrics
 
 class JSONFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
@@ -61,7 +74,45 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.critical(f"Critical error pre-loading embedding models: {e}", exc_info=True)
         raise e
+    monitor = None
+    if settings.INDEX_FINGERPRINT_ENABLED:
+        # Fingerprint before serving (and before the warmer runs) so the first answers are cached under the real version
+        try:
+            await asyncio.wait_for(check_index_version(get_async_qdrant()), timeout=5)
+        except Exception as e:
+            logger.warning(f"Initial index fingerprint failed, using version {index_version.current}: {e}")
+        monitor = asyncio.create_task(run_index_version_monitor())
+    if settings.LLM_WARMUP_CONNECTIONS > 0:
+        try:
+            await asyncio.wait_for(warmup_llm_client(), timeout=settings.LLM_CONNECT_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"LLM connection warmup failed: {e}")
+    health_checks = None
+    if settings.LLM_BACKENDS:
+        health_checks = asyncio.create_task(run_llm_health_checks(get_llm_client().inner))
+    keep_warm = None
+    if settings.LLM_KEEP_WARM_SECONDS > 0:
+        keep_warm = asyncio.create_task(run_llm_keep_warm())
+    refresher = None
+    if settings.LOCAL_INDEX_ENABLED:
+        refresher = asyncio.create_task(run_local_index_refresher())
+    warmer = None
+    if settings.WARMER_ENABLED:
+        warmer = asyncio.create_task(run_cache_warmer(stream.warm_chat_answer))
     yield
+    if refresher is not None:
+        refresher.cancel()
+    if warmer is not None:
+        warmer.cancel()
+    if monitor is not None:
+        monitor.cancel()
+    if health_checks is not None:
+        health_checks.cancel()
+    if keep_warm is not None:
+        keep_warm.cancel()
+    get_embedding_batcher().stop()
+    await close_async_qdrant()
+    await close_llm_client()
 
 app = FastAPI(title=settings.APP_NAME, version="1.0.0", lifespan=lifespan)
 
@@ -117,6 +168,24 @@ def stats():
         "indexed_vectors": info.indexed_vectors_count is not None
     })
 
+@app.get("/metrics")
+def metrics():
+    return JSONResponse({
+        "embedding_batcher": get_embedding_batcher().stats(),
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "retrieval_chunk_store": retrieval_chunk_store.stats(),
+        "local_index": local_index.stats(),
+        "circuit_breakers": {"qdrant": qdrant_breaker.stats(), "llm": llm_breaker.stats()},
+        "llm_backends": get_llm_client().stats() if settings.LLM_BACKENDS else {},
+        "inflight_generations": inflight_generations.stats(),
+        "generation": generation_metrics.stats(),
+        "context_packer": context_packer.stats(),
+        "cache_warmer": cache_warmer.stats(),
+        "index_version": index_version.stats(),
+    })
+
 # Mount routes with auth dependency
 # Mount routes with auth dependency
 # app.include_router(ingest.router, dependencies=[Depends(require_api_key)])
@@ -1,17 +1,26 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 from pydantic import BaseModel
 
+RetrievalMode = Literal["hybrid", "dense", "sparse", "auto"]
+
 class IngestRequest(BaseModel):
     path: str  # server-visible path (e.g., /data/docs)
 
 class QueryRequest(BaseModel):
     question: str
     top_k: Optional[int] = None
+    retrieval_mode: Optional[RetrievalMode] = None
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    top_k: Optional[int] = None
+    retrieval_mode: Optional[RetrievalMode] = None
 
 class StreamRequest(BaseModel):
     question: str
     top_k: Optional[int] = None
     trace_id: Optional[str] = None
+    retrieval_mode: Optional[RetrievalMode] = None
 
 class RetrievedChunk(BaseModel):
     source_id: str
@@ -38,6 +47,8 @@ class OpenAIChatCompletionRequest(BaseModel):
     temperature: Optional[float] = None
     max_tokens: Optional[int] = None
     stream: Optional[bool] = False
+    stream_options: Optional[Dict[str, Any]] = None  # {"include_usage": true} adds a final usage chunk
+    retrieval_mode: Optional[RetrievalMode] = None  # extension; ignored by stock OpenAI clients
 
 class OpenAIChatCompletionResponse(BaseModel):
     id: str
@@ -45,4 +56,4 @@ class OpenAIChatCompletionResponse(BaseModel):
     created: int
     model: str
     choices: List[Dict[str, Any]]
-    usage: Optional[Dict[str, int]] = None
\ No newline at end of file
+    usage: Optional[Dict[str, Any]] = None
\ No newline at end of file
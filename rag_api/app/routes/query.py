@@ -1,47 +1,30 @@
 import time
+import json
+import asyncio
 import logging
-from fastapi import APIRouter
-from app.models.schemas import QueryRequest, AnswerResponse, RetrievedChunk
-from app.services.retriever import search_similar
+from typing import Any, Dict, List
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
+from app.models.schemas import QueryRequest, BatchQueryRequest, AnswerResponse, RetrievedChunk
+from app.services.retriever import asearch_similar, asearch_similar_batch
 from app.services.prompt import build_messages
-from app.services.llm import get_llm_client
+from app.services.llm import get_llm_client, LLM_UNAVAILABLE_MSG
+from app.services.semantic_cache import semantic_answer_lookup
+from app.services.index_version import current_index_version
+from app.utils.caching import make_semantic_context, make_semantic_key
+from app.utils.generation_metrics import GenerationTimer, generation_metrics
+from app.utils.resilience import request_deadline
+from app.utils.ttlcache import answer_cache
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="", tags=["query"])
 
-@router.post("/query", response_model=AnswerResponse)
-async def query(req: QueryRequest) -> AnswerResponse:
-    t0 = time.time()
-    top_k = req.top_k or settings.TOP_K
-    try:
-        chunks = search_similar(req.question, top_k=top_k)
-    except Exception as e:
-        logger.error(f"Error during similar search: {e}", exc_info=True)
-        usage = {
-            "top_k": top_k,
-            "latency_ms": int((time.time() - t0) * 1000),
-        }
-        fallback_msg = "I am sorry, but the document database is temporarily unavailable. Please try again later."
-        return AnswerResponse(answer=fallback_msg, sources=[], usage=usage)
-    
-    messages = build_messages(req.question, chunks)
-    
-    client = get_llm_client()
+FALLBACK_MSG = "I am sorry, but the document database is temporarily unavailable. Please try again later."
 
-    resp = await client.chat_once(
-        model=settings.ACTIVE_LLM_MODEL,
-        messages=messages,
-        temperature=settings.TEMPERATURE,
-        max_tokens=settings.MAX_TOKENS
-    )
-    content = resp.get("message", {}).get("content", "")
-    usage = {
-        "top_k": top_k,
-        "latency_ms": int((time.time() - t0) * 1000),
-    }
-    logger.info(f"Query answered in {usage['latency_ms']} ms using top_k={top_k}")
+
+def build_sources(content: str, chunks: List[Dict[str, Any]]) -> List[RetrievedChunk]:
     sources = []
     normalized_content = content.lower()
     if "don't know" not in normalized_content and "do not know" not in normalized_content:
@@ -61,4 +44,138 @@ async def query(req: QueryRequest) -> AnswerResponse:
                 score=c.get("score"),
                 section=c.get("section_path"),
             ))
-    return AnswerResponse(answer=content, sources=sources, usage=usage)
\ No newline at end of file
+    return sources
+
+
+@router.post("/query", response_model=AnswerResponse)
+async def query(req: QueryRequest) -> AnswerResponse:
+    t0 = time.time()
+    deadline = request_deadline()
+    top_k = req.top_k or settings.TOP_K
+    semantic_ctx = make_semantic_context(
+        "query", settings.ACTIVE_LLM_MODEL, settings.TEMPERATURE, settings.MAX_TOKENS, top_k,
+        current_index_version(),
+    )
+    q_vec, cached = await semantic_answer_lookup(req.question, req.retrieval_mode, semantic_ctx, deadline)
+    if cached is not None:
+        usage = {"top_k": top_k, "latency_ms": int((time.time() - t0) * 1000), "cached": True}
+        logger.info(f"Query answered from semantic cache in {usage['latency_ms']} ms")
+        return AnswerResponse(answer=cached["answer"], sources=cached["sources"], usage=usage)
+
+    try:
+        chunks = await asearch_similar(req.question, top_k=top_k, mode=req.retrieval_mode, deadline=deadline)
+    except Exception as e:
+        logger.error(f"Error during similar search: {e}", exc_info=True)
+        usage = {
+            "top_k": top_k,
+            "latency_ms": int((time.time() - t0) * 1000),
+        }
+        return AnswerResponse(answer=FALLBACK_MSG, sources=[], usage=usage)
+    
+    packing: Dict[str, Any] = {}
+    messages = build_messages(req.question, chunks, packing)
+    # Only cite what the model was shown
+    chunks = packing["used_chunks"]
+    
+    client = get_llm_client()
+
+    timer = GenerationTimer()
+    try:
+        resp = await client.chat_once(
+            model=settings.ACTIVE_LLM_MODEL,
+            messages=messages,
+            temperature=settings.TEMPERATURE,
+            max_tokens=settings.MAX_TOKENS,
+            deadline=deadline,
+        )
+    except Exception as e:
+        logger.error(f"Error during LLM call: {e}", exc_info=True)
+        usage = {"top_k": top_k, "latency_ms": int((time.time() - t0) * 1000)}
+        return AnswerResponse(answer=LLM_UNAVAILABLE_MSG, sources=[], usage=usage)
+    timer.finish(resp)
+    generation = timer.usage()
+    generation_metrics.record(generation)
+    content = resp.get("message", {}).get("content", "")
+    usage = {
+        "top_k": top_k,
+        "latency_ms": int((time.time() - t0) * 1000),
+        **generation,
+        "context_tokens": packing["tokens_used"],
+        "context_tokens_saved": packing["tokens_saved"],
+    }
+    logger.info(
+        f"Query answered in {usage['latency_ms']} ms using top_k={top_k}, "
+        f"{usage['prompt_tokens']}+{usage['completion_tokens']} tokens"
+    )
+    sources = build_sources(content, chunks)
+    if q_vec is not None:
+        await answer_cache.set(
+            make_semantic_key(semantic_ctx, req.question),
+            {"answer": content, "sources": sources},
+            emb=q_vec,
+            context_str=semantic_ctx,
+        )
+    return AnswerResponse(answer=content, sources=sources, usage=usage)
+
+
+@router.post("/query/batch")
+async def query_batch(req: BatchQueryRequest):
+    """
+    Answer many questions at once. Retrieval for the whole batch is one embedding
+    pass and one Qdrant batch query; LLM calls run with bounded concurrency and
+    results stream back as NDJSON lines in completion order (each carries its `index`).
+    """
+    if len(req.questions) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.BATCH_MAX_QUESTIONS} questions per batch",
+        )
+    t0 = time.time()
+    top_k = req.top_k or settings.TOP_K
+    try:
+        all_chunks = await asearch_similar_batch(req.questions, top_k=top_k, mode=req.retrieval_mode)
+    except Exception as e:
+        logger.error(f"Error during batch similar search: {e}", exc_info=True)
+        all_chunks = None
+
+    client = get_llm_client()
+    semaphore = asyncio.Semaphore(settings.BATCH_LLM_CONCURRENCY)
+
+    async def answer_one(i: int, question: str) -> Dict[str, Any]:
+        item = {"index": i, "question": question}
+        if all_chunks is None:
+            usage = {"top_k": top_k, "latency_ms": int((time.time() - t0) * 1000)}
+            return {**item, **AnswerResponse(answer=FALLBACK_MSG, sources=[], usage=usage).model_dump()}
+        packing: Dict[str, Any] = {}
+        messages = build_messages(question, all_chunks[i], packing)
+        chunks = packing["used_chunks"]
+        try:
+            async with semaphore:
+                timer = GenerationTimer()
+                resp = await client.chat_once(
+                    model=settings.ACTIVE_LLM_MODEL,
+                    messages=messages,
+                    temperature=settings.TEMPERATURE,
+                    max_tokens=settings.MAX_TOKENS
+                )
+        except Exception as e:
+            logger.error(f"Batch query item {i} failed: {e}", exc_info=True)
+            return {**item, "error": str(e)}
+        timer.finish(resp)
+        generation = timer.usage()
+        generation_metrics.record(generation)
+        content = resp.get("message", {}).get("content", "")
+        usage = {"top_k": top_k, "latency_ms": int((time.time() - t0) * 1000), **generation}
+        return {**item, **AnswerResponse(answer=content, sources=build_sources(content, chunks), usage=usage).model_dump()}
+
+    async def ndjson_generator():
+        tasks = [asyncio.create_task(answer_one(i, q)) for i, q in enumerate(req.questions)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            for t in tasks:
+                t.cancel()
+        logger.info(f"Batch of {len(tasks)} questions answered in {int((time.time() - t0) * 1000)} ms")
+
+    return StreamingResponse(ndjson_generator(), media_type="application/x-ndjson")
\ No newline at end of file
@@ -1,77 +1,148 @@
 import json, time, uuid, asyncio, anyio, re, hashlib, logging
+import orjson
 from urllib.parse import quote
 from typing import AsyncGenerator, Dict, Any
 from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse
 from sse_starlette.sse import EventSourceResponse
 
 from app.models.schemas import StreamRequest, OpenAIChatCompletionRequest
-from app.services.retriever import search_similar
+from app.services.retriever import asearch_similar
 from app.services.prompt import build_messages
-from app.services.llm import get_llm_client
+from app.services.llm import get_llm_client, LLM_UNAVAILABLE_MSG
 from app.core.config import settings
+from app.services.semantic_cache import semantic_answer_lookup
+from app.services.index_version import current_index_version
+from app.services.warmer import cache_warmer
 from app.utils.caching import (
     extract_final_user_message,
+    extract_prior_turns,
     make_retrieval_cache_key,
-    make_cache_key
+    make_cache_key,
+    make_semantic_context,
+    make_semantic_key,
 )
 from app.utils.ttlcache import answer_cache, retrieval_cache
+from app.utils.chunk_store import retrieval_chunk_store
+from app.utils.resilience import request_deadline
+from app.utils.singleflight import inflight_generations
+from app.utils.generation_metrics import GenerationTimer, generation_metrics
+from app.utils.sse import ChunkEncoder, ORJSONResponse, SSE_DONE, sse_frame
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="", tags=["stream"])
 
 
+def _dumps(obj) -> str:
+    return orjson.dumps(obj).decode()
+
+
 @router.post("/stream")
 async def stream(req: StreamRequest):
     top_k = req.top_k or settings.TOP_K
     trace_id = req.trace_id or str(uuid.uuid4())
+    deadline = request_deadline()
+    start = time.time()
+    semantic_ctx = make_semantic_context(
+        "stream", settings.ACTIVE_LLM_MODEL, settings.TEMPERATURE, settings.MAX_TOKENS, top_k,
+        current_index_version(),
+    )
+    q_vec, cached = await semantic_answer_lookup(req.question, req.retrieval_mode, semantic_ctx, deadline)
+    if cached is not None:
+        async def cached_generator() -> AsyncGenerator[Dict[str, Any], None]:
+            yield {
+                "event": "token",
+                "data": _dumps({"delta": cached, "trace_id": trace_id}),
+            }
+            usage = {"top_k": top_k, "latency_ms": int((time.time() - start) * 1000), "cached": True}
+            yield {
+                "event": "complete",
+                "data": _dumps({"complete": True, "usage": usage, "trace_id": trace_id}),
+            }
+        logger.info(f"Serving /stream trace_id={trace_id} from semantic cache")
+        return EventSourceResponse(cached_generator(), media_type="text/event-stream")
+
     try:
-        chunks = search_similar(req.question, top_k=top_k)
+        chunks = await asearch_similar(req.question, top_k=top_k, mode=req.retrieval_mode, deadline=deadline)
     except Exception as e:
         logger.error(f"Error during similar search in /stream: {e}", exc_info=True)
         fallback_msg = "I am sorry, but the document database is temporarily unavailable. Please try again later."
         async def error_generator() -> AsyncGenerator[Dict[str, Any], None]:
             yield {
                 "event": "token",
-                "data": json.dumps({"delta": fallback_msg, "trace_id": trace_id}),
+                "data": _dumps({"delta": fallback_msg, "trace_id": trace_id}),
             }
             yield {
                 "event": "complete",
-                "data": json.dumps(
+                "data": _dumps(
                     {"complete": True, "usage": {"top_k": top_k, "latency_ms": 0}, "trace_id": trace_id}
                 ),
             }
         return EventSourceResponse(error_generator(), media_type="text/event-stream")
 
-    messages = build_messages(req.question, chunks)
+    packing: Dict[str, Any] = {}
+    messages = build_messages(req.question, chunks, packing)
     
     client = get_llm_client()
 
-    start = time.time()
     total_ms = 0
 
     async def event_generator() -> AsyncGenerator[Dict[str, Any], None]:
         # Stream from LLM and forward as SSE
         # Each 'data' is JSON: {"delta":"..."}; final contains usage
         async with asyncio.Semaphore(1):
-            async for ev in client.chat_stream(
-                model=settings.ACTIVE_LLM_MODEL,
-                messages=messages,
-                temperature=settings.TEMPERATURE,
-                max_tokens=settings.MAX_TOKENS,
-            ):
-                delta = ev.get("message", {}).get("content", "")
-                if delta:
+            streamed = False
+            assembled = []
+            timer = GenerationTimer()
+            try:
+                async for ev in client.chat_stream(
+                    model=settings.ACTIVE_LLM_MODEL,
+                    messages=messages,
+                    temperature=settings.TEMPERATURE,
+                    max_tokens=settings.MAX_TOKENS,
+                    deadline=deadline,
+                ):
+                    delta = ev.get("message", {}).get("content", "")
+                    if ev.get("done"):
+                        timer.finish(ev)
+                    if delta:
+                        timer.token()
+                        streamed = True
+                        assembled.append(delta)
+                        yield {
+                            "event": "token",
+                            "data": _dumps({"delta": delta, "trace_id": trace_id}),
+                        }
+            except Exception as e:
+                logger.error(f"LLM stream error in /stream: {e}", exc_info=True)
+                assembled = None
+                if not streamed:
                     yield {
                         "event": "token",
-                        "data": json.dumps({"delta": delta, "trace_id": trace_id}),
+                        "data": _dumps({"delta": LLM_UNAVAILABLE_MSG, "trace_id": trace_id}),
                     }
+            if assembled and q_vec is not None:
+                await answer_cache.set(
+                    make_semantic_key(semantic_ctx, req.question),
+                    "".join(assembled),
+                    emb=q_vec,
+                    context_str=semantic_ctx,
+                )
             total_ms = int((time.time() - start) * 1000)
-            usage = {"top_k": top_k, "latency_ms": total_ms}
+            usage = {
+                "top_k": top_k,
+                "latency_ms": total_ms,
+                "context_tokens": packing["tokens_used"],
+                "context_tokens_saved": packing["tokens_saved"],
+            }
+            if streamed:
+                generation = timer.usage()
+                generation_metrics.record(generation)
+                usage.update(generation)
             yield {
                 "event": "complete",
-                "data": json.dumps(
+                "data": _dumps(
                     {"complete": True, "usage": usage, "trace_id": trace_id}
                 ),
             }
@@ -89,6 +160,25 @@ openai_ws_router = APIRouter(tags=["openai-compat"])
 
 
 INLINE_SOURCE_RE = re.compile(r"\s*\(source:\s*[^)]+\)", flags=re.IGNORECASE)
+SSE_PADDING = b": " + (b" " * 16384) + b"\n\n"
+
+
+def openai_usage(generation: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    OpenAI `usage` object for a generation's counts and timings. Answers served
+    from a cache generated nothing in this request, so they report zero tokens.
+    """
+    usage = {
+        "prompt_tokens": generation.get("prompt_tokens", 0),
+        "completion_tokens": generation.get("completion_tokens", 0),
+        "total_tokens": generation.get("total_tokens", 0),
+    }
+    if "cached_prompt_tokens" in generation:
+        usage["prompt_tokens_details"] = {"cached_tokens": generation["cached_prompt_tokens"]}
+    for name in ("ttft_ms", "inter_token_ms", "tokens_per_second", "generation_ms", "prompt_eval_ms"):
+        if name in generation:
+            usage[name] = generation[name]
+    return usage
 
 
 def collect_sources(chunks):
@@ -192,6 +282,153 @@ def format_sources_block(doc_ids, all_sources):
     return "\n\n---\n> **Sources:**\n" + "\n".join([f"> {line}" for line in lines])
 
 
+async def generate_answer_deltas(
+    client, model, messages, temperature, max_tokens, deadline, chunks, cache_key, q_vec, semantic_ctx, request_id,
+    usage=None,
+) -> AsyncGenerator[str, None]:
+    """
+    Cleaned LLM deltas for one chat turn followed by the Sources block; the full
+    text is cached at the end. Runs once per cache key under `inflight_generations`,
+    however many SSE / WebSocket requests are waiting on it. Token counts and
+    timings of the generation are written into `usage` once it finishes.
+    """
+    assembled = []
+    all_sources = collect_sources(chunks)
+    used_doc_ids = list(all_sources.keys())  # simple choice: include all retrieved
+    llm_failed = False
+    timer = GenerationTimer()
+    try:
+        async for ev in client.chat_stream(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            deadline=deadline,
+        ):
+            if ev.get("done"):
+                timer.finish(ev)
+            raw = ev.get("message", {}).get("content", "")
+            if not raw:
+                continue
+            timer.token()
+
+            clean = INLINE_SOURCE_RE.sub("", raw)
+            if clean:
+                assembled.append(clean)
+                yield clean
+    except Exception as e:
+        logger.error(f"LLM stream error for request id={request_id}: {e}", exc_info=True)
+        llm_failed = True
+        if not assembled:
+            yield LLM_UNAVAILABLE_MSG
+
+    if timer.events:
+        generation = timer.usage()
+        generation_metrics.record(generation)
+        if usage is not None:
+            usage.update(generation)
+
+    # Append final Sources block once
+    assembled_text = "".join(assembled)
+    normalized_assembled = assembled_text.lower()
+    if llm_failed or "don't know" in normalized_assembled or "do not know" in normalized_assembled:
+        sources_block = ""
+    else:
+        sources_block = format_sources_block(used_doc_ids, all_sources)
+    if sources_block:
+        assembled.append("\n\n" + sources_block)
+        yield "\n\n" + sources_block
+
+    # Cache the full assembled text for retries and the follow-up non-streaming call
+    if not llm_failed:
+        await answer_cache.set(cache_key, "".join(assembled), emb=q_vec, context_str=semantic_ctx)
+
+
+def build_turn(last_user, chunks, model, temperature, max_tokens, index_version):
+    """The packed prompt for a chat turn, the chunks it cites and its exact answer-cache key."""
+    packing: Dict[str, Any] = {}
+    messages = build_messages(last_user, chunks, packing)
+    # Only cite what the model was shown
+    chunks = packing["used_chunks"]
+    return messages, chunks, make_cache_key(model, messages, temperature, max_tokens, index_version)
+
+
+async def refresh_retrieval(parsed_message, top_k, index_version, retrieval_mode, deadline=None):
+    chunks = await asearch_similar(parsed_message, top_k=top_k, mode=retrieval_mode, deadline=deadline)
+    await retrieval_cache.set(
+        make_retrieval_cache_key(parsed_message, top_k, index_version, retrieval_mode),
+        retrieval_chunk_store.pack(chunks),
+    )
+    return chunks
+
+
+async def cached_chunks(parsed_message, top_k, index_version, retrieval_mode):
+    """Retrieval cache lookup; a stale hit is served while it is refreshed in the background."""
+    retrieval_key = make_retrieval_cache_key(parsed_message, top_k, index_version, retrieval_mode)
+    chunks, stale = await retrieval_cache.get_allow_stale(retrieval_key)
+    if chunks is not None and stale:
+        retrieval_cache.schedule_refresh(
+            retrieval_key, lambda: refresh_retrieval(parsed_message, top_k, index_version, retrieval_mode)
+        )
+    return chunks
+
+
+async def cached_answer(cache_key, last_user, model, temperature, max_tokens, retrieval_mode):
+    """Answer cache lookup; a stale hit is served while the turn is regenerated in the background."""
+    cached, stale = await answer_cache.get_allow_stale(cache_key)
+    if stale:
+        logger.info(f"Serving stale answer for key {cache_key}, refreshing in background")
+        answer_cache.schedule_refresh(
+            cache_key,
+            lambda: warm_chat_answer(last_user, model, temperature, max_tokens, retrieval_mode, refresh=True),
+        )
+    return cached
+
+
+async def warm_chat_answer(
+    last_user, model=None, temperature=None, max_tokens=None, retrieval_mode=None, refresh=False
+) -> bool:
+    """
+    Generate and cache the chat answer for `last_user` exactly as the endpoints
+    would, without a client attached. Used by the cache warmer and stale-answer
+    refreshes; returns False when a fresh answer was already cached.
+    """
+    parsed_message = extract_final_user_message(last_user)
+    top_k = settings.TOP_K
+    model = model or settings.ACTIVE_LLM_MODEL
+    temperature = temperature or settings.TEMPERATURE
+    max_tokens = max_tokens or settings.MAX_TOKENS
+    index_version = current_index_version()
+    retrieval_mode = retrieval_mode or settings.RETRIEVAL_MODE
+
+    chunks = None if refresh else await retrieval_cache.get(
+        make_retrieval_cache_key(parsed_message, top_k, index_version, retrieval_mode)
+    )
+    if chunks is None:
+        chunks = await refresh_retrieval(parsed_message, top_k, index_version, retrieval_mode)
+    messages, chunks, cache_key = build_turn(last_user, chunks, model, temperature, max_tokens, index_version)
+    if not refresh and await answer_cache.get(cache_key) is not None:
+        return False
+
+    semantic_ctx = make_semantic_context(
+        "chat", model, temperature, max_tokens, top_k, index_version, extract_prior_turns(last_user)
+    )
+    q_vec, _ = await semantic_answer_lookup(parsed_message, retrieval_mode, semantic_ctx)
+    flight_usage: Dict[str, Any] = {}
+    flight, leader = inflight_generations.join(
+        cache_key,
+        lambda: generate_answer_deltas(
+            get_llm_client(), model, messages, temperature, max_tokens, None,
+            chunks, cache_key, q_vec, semantic_ctx, f"warm-{cache_key}", flight_usage,
+        ),
+    )
+    if leader:
+        flight.usage = flight_usage
+    async for _ in flight.subscribe():
+        pass
+    return True
+
+
 @openai_ws_router.websocket("/chat/completions")
 async def websocket_chat_completions(websocket: WebSocket):
     await websocket.accept()
@@ -223,6 +460,7 @@ async def websocket_chat_completions(websocket: WebSocket):
 
         # 2) Build RAG context (similar to HTTP endpoint)
         start = time.time()
+        deadline = request_deadline()
         
         # Safety check for empty messages
         if not req.messages:
@@ -237,65 +475,48 @@ async def websocket_chat_completions(websocket: WebSocket):
             (m.content for m in reversed(req.messages) if m.role == "user"), ""
         )
         top_k = settings.TOP_K
+        model = req.model or settings.ACTIVE_LLM_MODEL
+        temperature = req.temperature or settings.TEMPERATURE
+        max_tokens = req.max_tokens or settings.MAX_TOKENS
+        index_version = current_index_version()
+        retrieval_mode = req.retrieval_mode or settings.RETRIEVAL_MODE
+        cache_warmer.record(
+            last_user, model=req.model, temperature=req.temperature,
+            max_tokens=req.max_tokens, retrieval_mode=req.retrieval_mode,
+        )
 
-        # Retrieval
-        retrieval_key = make_retrieval_cache_key(
-            parsed_message,
-            top_k,
-            getattr(settings, "INDEX_VERSION", "v1"),
+        # Semantic answer cache (shared with the HTTP endpoint)
+        semantic_ctx = make_semantic_context(
+            "chat", model, temperature, max_tokens, top_k, index_version, extract_prior_turns(last_user)
         )
-        chunks = await retrieval_cache.get(retrieval_key)
+        q_vec, semantic_hit = await semantic_answer_lookup(parsed_message, retrieval_mode, semantic_ctx, deadline)
+
+        # Retrieval
+        chunks = [] if semantic_hit is not None else await cached_chunks(parsed_message, top_k, index_version, retrieval_mode)
         if chunks is None:
             try:
-                chunks = search_similar(parsed_message, top_k=top_k)
-                await retrieval_cache.set(retrieval_key, chunks)
+                chunks = await refresh_retrieval(parsed_message, top_k, index_version, retrieval_mode, deadline)
             except Exception as e:
                 logger.error(f"WebSocket similar search error: {e}", exc_info=True)
                 fallback_msg = "I am sorry, but the document database is temporarily unavailable. Please try again later."
-                model = req.model or settings.ACTIVE_LLM_MODEL
-                comp_id = f"chatcmpl-{uuid.uuid4().hex}"
-                created = int(time.time())
-                # Send initial role chunk
-                await websocket.send_text(json.dumps({
-                    "id": comp_id,
-                    "object": "chat.completion.chunk",
-                    "created": created,
-                    "model": model,
-                    "choices": [
-                        {"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}
-                    ],
-                }))
-                # Send error message chunk
-                await websocket.send_text(json.dumps({
-                    "id": comp_id,
-                    "object": "chat.completion.chunk",
-                    "created": int(time.time()),
-                    "model": model,
-                    "choices": [
-                        {
-                            "index": 0,
-                            "delta": {"content": fallback_msg},
-                            "finish_reason": None,
-                        }
-                    ],
-                }))
-                # Send finish chunk
-                await websocket.send_text(json.dumps({
-                    "id": comp_id,
-                    "object": "chat.completion.chunk",
-                    "created": int(time.time()),
-                    "model": model,
-                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
-                }))
+                encoder = ChunkEncoder(f"chatcmpl-{uuid.uuid4().hex}", model)
+                # Send initial role chunk, error message chunk and finish chunk
+                await websocket.send_text(encoder.role().decode())
+                await websocket.send_text(encoder.content(fallback_msg).decode())
+                await websocket.send_text(encoder.stop().decode())
                 await websocket.close()
                 return
 
-        messages = build_messages(last_user, chunks)
-        
+        # Prompt packing is only needed when the answer has to be looked up or generated
+        if semantic_hit is None:
+            messages, chunks, cache_key = build_turn(last_user, chunks, model, temperature, max_tokens, index_version)
+        else:
+            messages, cache_key = None, None
+
         client = get_llm_client()
-        model = req.model or settings.ACTIVE_LLM_MODEL
-        temperature = req.temperature or settings.TEMPERATURE
-        max_tokens = req.max_tokens or settings.MAX_TOKENS
+        cached = semantic_hit if semantic_hit is not None else await cached_answer(
+            cache_key, last_user, model, temperature, max_tokens, retrieval_mode
+        )
         
         comp_id = f"chatcmpl-{uuid.uuid4().hex}"
         created = int(time.time())
@@ -304,83 +525,38 @@ async def websocket_chat_completions(websocket: WebSocket):
 
         # 3) Stream Response
         # Initial role chunk
-        first_chunk = {
-            "id": comp_id,
-            "object": "chat.completion.chunk",
-            "created": created,
-            "model": model,
-            "choices": [
-                {"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}
-            ],
-        }
-        await websocket.send_text(json.dumps(first_chunk))
-        
-        assembled = []
-        all_sources = collect_sources(chunks)
-        used_doc_ids = list(all_sources.keys())
-        
-        async for ev in client.chat_stream(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        ):
-            raw = ev.get("message", {}).get("content", "")
-            if not raw:
-                continue
+        encoder = ChunkEncoder(comp_id, model, created)
+        await websocket.send_text(encoder.role().decode())
 
-            clean = INLINE_SOURCE_RE.sub("", raw)
-            if clean:
-                assembled.append(clean)
-                chunk = {
-                    "id": comp_id,
-                    "object": "chat.completion.chunk",
-                    "created": int(time.time()),
-                    "model": model,
-                    "choices": [
-                        {
-                            "index": 0,
-                            "delta": {"content": clean},
-                            "finish_reason": None,
-                        }
-                    ],
-                }
-                await websocket.send_text(json.dumps(chunk))
-                # Yield control to event loop
-                await asyncio.sleep(0)
-
-        # Sources Block
-        assembled_text = "".join(assembled)
-        normalized_assembled = assembled_text.lower()
-        if "don't know" in normalized_assembled or "do not know" in normalized_assembled:
-            sources_block = ""
+        if cached is not None:
+            logger.info(f"WebSocket Cache HIT for request id={comp_id}")
+            await websocket.send_text(encoder.content(cached).decode())
+            await websocket.send_text(encoder.stop().decode())
+            await websocket.close()
+            return
+        
+        # Identical turns already generating elsewhere are joined, not regenerated
+        flight_usage: Dict[str, Any] = {}
+        flight, leader = inflight_generations.join(
+            cache_key,
+            lambda: generate_answer_deltas(
+                client, model, messages, temperature, max_tokens, deadline,
+                chunks, cache_key, q_vec, semantic_ctx, comp_id, flight_usage,
+            ),
+        )
+        if leader:
+            flight.usage = flight_usage
         else:
-            sources_block = format_sources_block(used_doc_ids, all_sources)
-        if sources_block:
-            chunk = {
-                "id": comp_id,
-                "object": "chat.completion.chunk",
-                "created": int(time.time()),
-                "model": model,
-                "choices": [
-                    {
-                        "index": 0,
-                        "delta": {"content": "\n\n" + sources_block},
-                        "finish_reason": None,
-                    }
-                ],
-            }
-            await websocket.send_text(json.dumps(chunk))
+            logger.info(f"WebSocket request id={comp_id} joined in-flight generation for key {cache_key}")
+        async for delta in flight.subscribe():
+            await websocket.send_text(encoder.content(delta).decode())
+            # Yield control to event loop
+            await asyncio.sleep(0)
 
         # Finish
-        done_chunk = {
-            "id": comp_id,
-            "object": "chat.completion.chunk",
-            "created": int(time.time()),
-            "model": model,
-            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
-        }
-        await websocket.send_text(json.dumps(done_chunk))
+        await websocket.send_text(encoder.stop().decode())
+        if (req.stream_options or {}).get("include_usage"):
+            await websocket.send_text(encoder.usage(openai_usage(flight.usage)).decode())
         await websocket.close()
 
     except WebSocketDisconnect:
@@ -398,6 +574,7 @@ async def websocket_chat_completions(websocket: WebSocket):
 async def openai_chat_completions(req: OpenAIChatCompletionRequest, request: Request):
     # 1) Build RAG context (cacheable)
     start = time.time()
+    deadline = request_deadline()
     total_ms = 0
     parsed_message = extract_final_user_message(
         req.messages[len(req.messages) - 1].content
@@ -407,36 +584,46 @@ async def openai_chat_completions(req: OpenAIChatCompletionRequest, request: Req
     )
     top_k = settings.TOP_K
 
-    logger.debug(
-        f"Non WebSocket:Inital user message for OpenAI chat/completions: {json.dumps({'q': parsed_message, 'k': top_k, 'time taken': int((time.time() - start) * 1000)})}"
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            f"Non WebSocket:Inital user message for OpenAI chat/completions: {json.dumps({'q': parsed_message, 'k': top_k, 'time taken': int((time.time() - start) * 1000)})}"
+        )
+    model = req.model or settings.ACTIVE_LLM_MODEL
+    temperature = req.temperature or settings.TEMPERATURE
+    max_tokens = req.max_tokens or settings.MAX_TOKENS
+    index_version = current_index_version()
+    retrieval_mode = req.retrieval_mode or settings.RETRIEVAL_MODE
+    cache_warmer.record(
+        last_user, model=req.model, temperature=req.temperature,
+        max_tokens=req.max_tokens, retrieval_mode=req.retrieval_mode,
     )
-    # Optional: use retrieval cache
-    retrieval_key = make_retrieval_cache_key(
-        parsed_message,
-        top_k,
-        getattr(settings, "INDEX_VERSION", "v1"),
+
+    # Paraphrases of an already-answered question skip retrieval and the LLM
+    semantic_ctx = make_semantic_context(
+        "chat", model, temperature, max_tokens, top_k, index_version, extract_prior_turns(last_user)
     )
-    chunks = await retrieval_cache.get(retrieval_key)
+    q_vec, semantic_hit = await semantic_answer_lookup(parsed_message, retrieval_mode, semantic_ctx, deadline)
+
+    # Optional: use retrieval cache
+    chunks = [] if semantic_hit is not None else await cached_chunks(parsed_message, top_k, index_version, retrieval_mode)
     if chunks is None:
         try:
-            chunks = search_similar(parsed_message, top_k=top_k)
-            await retrieval_cache.set(retrieval_key, chunks)
+            chunks = await refresh_retrieval(parsed_message, top_k, index_version, retrieval_mode, deadline)
         except Exception as e:
             logger.error(f"Error during similar search: {e}", exc_info=True)
             fallback_msg = "I am sorry, but the document database is temporarily unavailable. Please try again later."
-            model = req.model or settings.ACTIVE_LLM_MODEL
             comp_id = f"chatcmpl-{uuid.uuid4().hex}"
             created = int(time.time())
             
             if req.stream:
+                encoder = ChunkEncoder(comp_id, model, created)
+
                 async def error_gen():
-                    # Yield initial role chunk
-                    yield f"data: {json.dumps({'id': comp_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [{'index': 0, 'delta': {'role': 'assistant'}, 'finish_reason': None}]})}\n\n"
-                    # Yield error message chunk
-                    yield f"data: {json.dumps({'id': comp_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model, 'choices': [{'index': 0, 'delta': {'content': fallback_msg}, 'finish_reason': None}]})}\n\n"
-                    # Yield done chunk
-                    yield f"data: {json.dumps({'id': comp_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
-                    yield "data: [DONE]\n\n"
+                    # Initial role chunk, error message chunk, done chunk
+                    yield sse_frame(encoder.role())
+                    yield sse_frame(encoder.content(fallback_msg))
+                    yield sse_frame(encoder.stop())
+                    yield SSE_DONE
                 
                 return StreamingResponse(
                     error_gen(),
@@ -450,7 +637,7 @@ async def openai_chat_completions(req: OpenAIChatCompletionRequest, request: Req
                     },
                 )
             else:
-                return JSONResponse(content={
+                return ORJSONResponse(content={
                     "id": comp_id,
                     "object": "chat.completion",
                     "created": created,
@@ -462,19 +649,17 @@ async def openai_chat_completions(req: OpenAIChatCompletionRequest, request: Req
                             "finish_reason": "stop",
                         }
                     ],
-                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                    "usage": openai_usage({}),
                 })
 
-    messages = build_messages(last_user, chunks)
+    # 2) Packed prompt and stable cache key for the full request (post-build messages!),
+    # only needed when the semantic cache had no answer
+    if semantic_hit is None:
+        messages, chunks, cache_key = build_turn(last_user, chunks, model, temperature, max_tokens, index_version)
+    else:
+        messages, cache_key = None, None
 
     client = get_llm_client()
-    model = req.model or settings.ACTIVE_LLM_MODEL
-    temperature = req.temperature or settings.TEMPERATURE
-    max_tokens = req.max_tokens or settings.MAX_TOKENS
-    index_version = getattr(settings, "INDEX_VERSION", "v1")  # bump when corpus changes
-
-    # 2) Stable cache key for the full request (post-build messages!)
-    cache_key = make_cache_key(model, messages, temperature, max_tokens, index_version)
 
     created = int(time.time())
     comp_id = f"chatcmpl-{uuid.uuid4().hex}"
@@ -484,146 +669,77 @@ async def openai_chat_completions(req: OpenAIChatCompletionRequest, request: Req
 
     # 3) STREAMING PATH
     if req.stream:
-        logger.info(f"Processing streaming OpenAI chat completion request. Cache key payload: {json.dumps(cache_key)}")
+        logger.info(f"Processing streaming OpenAI chat completion request. Cache key: {cache_key}")
 
         # If this exact turn already completed (rare but possible on retries),
         # you could serve the cached text as a single delta stream.
-        cached = await answer_cache.get(cache_key)
+        cached = semantic_hit if semantic_hit is not None else await cached_answer(
+            cache_key, last_user, model, temperature, max_tokens, retrieval_mode
+        )
         if cached is not None:
             logger.info(f"Stream Cache HIT! Found cached response for key.")
         else:
             logger.info(f"Stream Cache MISS! No cached response found for key.")
 
+        encoder = ChunkEncoder(comp_id, model, created)
+        debug = logger.isEnabledFor(logging.DEBUG)
+        include_usage = bool((req.stream_options or {}).get("include_usage"))
+
         async def gen():
             # Initial padding to force flush any proxy buffers
             # Many proxies buffer the first 1-4KB. We send 16KB (16384 bytes) of comments.
-            yield ": " + (" " * 16384) + "\n\n"
-            
+            yield SSE_PADDING
+
             # Initial role chunk
-            first_chunk = {
-                "id": comp_id,
-                "object": "chat.completion.chunk",
-                "created": created,
-                "model": model,
-                "choices": [
-                    {"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}
-                ],
-            }
-            yield f"data: {json.dumps(first_chunk)}\n\n"
-            logger.debug("Initial role chunk sent. Time taken: %s", int((time.time() - start) * 1000))
+            yield sse_frame(encoder.role())
+            if debug:
+                logger.debug("Initial role chunk sent. Time taken: %s", int((time.time() - start) * 1000))
             await anyio.sleep(0)
 
             if cached is not None:
                 # Serve cached answer as one streaming sequence for UI parity
-                data = {
-                    "id": comp_id,
-                    "object": "chat.completion.chunk",
-                    "created": int(time.time()),
-                    "model": model,
-                    "choices": [
-                        {
-                            "index": 0,
-                            "delta": {"content": cached},
-                            "finish_reason": None,
-                        }
-                    ],
-                }
-                yield f"data: {json.dumps(data)}\n\n"
-                done = {
-                    "id": comp_id,
-                    "object": "chat.completion.chunk",
-                    "created": int(time.time()),
-                    "model": model,
-                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
-                }
-                yield f"data: {json.dumps(done)}\n\n"
-                yield "data: [DONE]\n\n"
+                yield sse_frame(encoder.content(cached))
+                yield sse_frame(encoder.stop())
+                if include_usage:
+                    yield sse_frame(encoder.usage(openai_usage({})))
+                yield SSE_DONE
                 return
 
-            # Not cached yet: tee the live stream into a buffer
-            assembled = []
-            all_sources = collect_sources(chunks)
-            used_doc_ids = list(
-                all_sources.keys()
-            )  # simple choice: include all retrieved
-            logger.debug("Assembling live stream. Time taken: %s", int((time.time() - start) * 1000))
-            async for ev in client.chat_stream(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            ):
-                raw = ev.get("message", {}).get("content", "")
-                if not raw:
-                    continue
-
-                clean = INLINE_SOURCE_RE.sub("", raw)
-                if clean:
-                    assembled.append(clean)
-                    data = {
-                        "id": comp_id,
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": model,
-                        "choices": [
-                            {
-                                "index": 0,
-                                "delta": {"content": clean},
-                                "finish_reason": None,
-                            }
-                        ],
-                    }
-                    logger.debug("Live stream chunk: %s ; Time taken: %s", data, int((time.time() - start) * 1000))
-                    yield f"data: {json.dumps(data)}\n\n"
-                    await anyio.sleep(0)
-
-            # Append final Sources block once
-            assembled_text = "".join(assembled)
-            normalized_assembled = assembled_text.lower()
-            if "don't know" in normalized_assembled or "do not know" in normalized_assembled:
-                sources_block = ""
+            # Not cached yet: lead the generation, or join an identical one already running
+            flight_usage: Dict[str, Any] = {}
+            flight, leader = inflight_generations.join(
+                cache_key,
+                lambda: generate_answer_deltas(
+                    client, model, messages, temperature, max_tokens, deadline,
+                    chunks, cache_key, q_vec, semantic_ctx, comp_id, flight_usage,
+                ),
+            )
+            if leader:
+                flight.usage = flight_usage
             else:
-                sources_block = format_sources_block(used_doc_ids, all_sources)
-            logger.debug("Sources block: %s ; Time taken: %s", sources_block, int((time.time() - start) * 1000))
-            if sources_block:
-                assembled.append("\n\n" + sources_block)
-                tail = {
-                    "id": comp_id,
-                    "object": "chat.completion.chunk",
-                    "created": int(time.time()),
-                    "model": model,
-                    "choices": [
-                        {
-                            "index": 0,
-                            "delta": {"content": "\n\n" + sources_block},
-                            "finish_reason": None,
-                        }
-                    ],
-                }
-                logger.debug("Sources chunk: %s ; Time taken: %s", tail, int((time.time() - start) * 1000))
-                yield f"data: {json.dumps(tail)}\n\n"
+                logger.info(f"Request id={comp_id} joined in-flight generation for key {cache_key}")
+            if debug:
+                logger.debug("Assembling live stream. Time taken: %s", int((time.time() - start) * 1000))
+            async for delta in flight.subscribe():
+                frame = encoder.content(delta)
+                if debug:
+                    logger.debug("Live stream chunk: %s ; Time taken: %s", frame, int((time.time() - start) * 1000))
+                yield sse_frame(frame)
                 await anyio.sleep(0)
 
             # Finish
-            done = {
-                "id": comp_id,
-                "object": "chat.completion.chunk",
-                "created": int(time.time()),
-                "model": model,
-                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
-            }
-            logger.debug("Done chunk: %s ; Time taken: %s", done, int((time.time() - start) * 1000))    
-            yield f"data: {json.dumps(done)}\n\n"
-            yield "data: [DONE]\n\n"
+            if debug:
+                logger.debug("Done chunk sent. Time taken: %s", int((time.time() - start) * 1000))
+            yield sse_frame(encoder.stop())
+            if include_usage:
+                yield sse_frame(encoder.usage(openai_usage(flight.usage)))
+            yield SSE_DONE
 
             total_ms = int((time.time() - start) * 1000)
-            usage = {"top_k": top_k, "latency_ms": total_ms}
             logger.info(
-                f"OpenAI chat/completions request id={comp_id}, model={model}, stream={req.stream} completed in {total_ms} ms"
+                f"OpenAI chat/completions request id={comp_id}, model={model}, stream={req.stream} completed in {total_ms} ms, "
+                f"{flight.usage.get('completion_tokens', 0)} tokens at {flight.usage.get('tokens_per_second', 0)} tokens/s"
             )
-            # Cache the full assembled text for the follow-up non-streaming call
-            final_text = "".join(assembled)
-            await answer_cache.set(cache_key, final_text)
 
         
         return StreamingResponse(
@@ -639,32 +755,47 @@ async def openai_chat_completions(req: OpenAIChatCompletionRequest, request: Req
         )
 
     # 4) NON‑STREAMING PATH — return cached answer if available
-    logger.info(f"Processing non-streaming OpenAI chat completion request. Cache key payload: {json.dumps(cache_key)}")
-    cached = await answer_cache.get(cache_key)
+    logger.info(f"Processing non-streaming OpenAI chat completion request. Cache key: {cache_key}")
+    generation: Dict[str, Any] = {}
+    cached = semantic_hit if semantic_hit is not None else await cached_answer(
+        cache_key, last_user, model, temperature, max_tokens, retrieval_mode
+    )
     if cached is not None:
         logger.info(f"Non-stream Cache HIT! Returning cached response.")
         content = cached
     else:
         # Fallback: run once (this will be rare if the stream path ran first)
         logger.info("Non-stream Cache MISS! No cached answer found, running LLM once.")
-        resp = await client.chat_once(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
-        raw = resp.get("message", {}).get("content", "") or ""
-        content = INLINE_SOURCE_RE.sub("", raw)
-        # Optionally append sources (same rules as streaming)
-        normalized_content = content.lower()
-        if "don't know" in normalized_content or "do not know" in normalized_content:
-            sources_block = ""
+        timer = GenerationTimer()
+        try:
+            resp = await client.chat_once(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                deadline=deadline,
+            )
+        except Exception as e:
+            logger.error(f"LLM error for request id={comp_id}: {e}", exc_info=True)
+            resp = None
+        if resp is None:
+            content = LLM_UNAVAILABLE_MSG
         else:
-            all_sources = collect_sources(chunks)
-            sources_block = format_sources_block(list(all_sources.keys()), all_sources)
-        if sources_block:
-            content = content.rstrip() + "\n\n" + sources_block
-        await answer_cache.set(cache_key, content)  # seed cache for future retries
+            timer.finish(resp)
+            generation = timer.usage()
+            generation_metrics.record(generation)
+            raw = resp.get("message", {}).get("content", "") or ""
+            content = INLINE_SOURCE_RE.sub("", raw)
+            # Optionally append sources (same rules as streaming)
+            normalized_content = content.lower()
+            if "don't know" in normalized_content or "do not know" in normalized_content:
+                sources_block = ""
+            else:
+                all_sources = collect_sources(chunks)
+                sources_block = format_sources_block(list(all_sources.keys()), all_sources)
+            if sources_block:
+                content = content.rstrip() + "\n\n" + sources_block
+            await answer_cache.set(cache_key, content, emb=q_vec, context_str=semantic_ctx)  # seed cache for future retries
 
     data = {
         "id": comp_id,
@@ -678,9 +809,9 @@ async def openai_chat_completions(req: OpenAIChatCompletionRequest, request: Req
                 "finish_reason": "stop",
             }
         ],
-        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        "usage": openai_usage(generation),
     }
-    return JSONResponse(content=data)
+    return ORJSONResponse(content=data)
 
 
 @openai_router.get("/models")
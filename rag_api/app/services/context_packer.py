@@ -0,0 +1,167 @@
+import re
+import math
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and single punctuation marks; a long word counts one token per 4 characters
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=1)
+def _load_tokenizer(path: Optional[str]):
+    if not path:
+        return None
+    try:
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_file(path)
+        tokenizer.no_truncation()
+        logger.info(f"Counting context tokens with tokenizer {path}")
+        return tokenizer
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer {path}, estimating context tokens instead: {e}")
+        return None
+
+
+def _piece_tokens(piece: str) -> int:
+    return max(1, math.ceil(len(piece) / 4))
+
+
+def count_tokens(text: str) -> int:
+    """
+    Token count of `text`: exact with the CONTEXT_TOKENIZER_PATH tokenizer, else
+    a regex estimate that lands close to BPE tokenizers on English prose.
+    """
+    tokenizer = _load_tokenizer(settings.CONTEXT_TOKENIZER_PATH)
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return sum(_piece_tokens(p) for p in _PIECE_RE.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of `text` that fits in `max_tokens`, cut on a token boundary."""
+    if max_tokens <= 0:
+        return ""
+    tokenizer = _load_tokenizer(settings.CONTEXT_TOKENIZER_PATH)
+    if tokenizer is not None:
+        offsets = tokenizer.encode(text, add_special_tokens=False).offsets
+        if len(offsets) <= max_tokens:
+            return text
+        return text[: offsets[max_tokens - 1][1]]
+    used = 0
+    end = 0
+    for m in _PIECE_RE.finditer(text):
+        used += _piece_tokens(m.group())
+        if used > max_tokens:
+            break
+        end = m.end()
+    else:
+        return text
+    return text[:end]
+
+
+class ContextPacker:
+    """
+    Chooses which retrieved chunks go into the prompt.
+
+    Chunks are taken in score order. A chunk scoring below `min_score_ratio`
+    times the top hit is dropped (the ratio adapts the cutoff to each query's
+    score scale, RRF or cosine). The rest fill `token_budget`: a chunk that no
+    longer fits is cut down if at least `min_chunk_tokens` are left, otherwise
+    skipped so a shorter, lower ranked chunk can still fit. A budget or ratio
+    of 0 disables that step.
+    """
+
+    def __init__(self, token_budget: int, min_score_ratio: float, min_chunk_tokens: int = 64):
+        self.token_budget = token_budget
+        self.min_score_ratio = min_score_ratio
+        self.min_chunk_tokens = min_chunk_tokens
+        self.packs = 0
+        self.tokens_in = 0
+        self.tokens_used = 0
+        self.dropped_low_score = 0
+        self.dropped_over_budget = 0
+        self.truncated = 0
+
+    def pack(self, chunks: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Return the chunks to put in the prompt (texts possibly shortened) and a
+        report; `report["used_chunks"]` holds the same chunks unshortened.
+        """
+        ranked = sorted(chunks, key=lambda c: c.get("score") or 0.0, reverse=True)
+        top_score = (ranked[0].get("score") or 0.0) if ranked else 0.0
+        cutoff = top_score * self.min_score_ratio if top_score > 0 else 0.0
+
+        packed: List[Dict[str, Any]] = []
+        used: List[Dict[str, Any]] = []
+        report = {
+            "chunks_in": len(chunks),
+            "chunks_used": 0,
+            "dropped_low_score": 0,
+            "dropped_over_budget": 0,
+            "truncated": 0,
+            "tokens_in": 0,
+            "tokens_used": 0,
+        }
+        remaining = self.token_budget
+        for c in ranked:
+            text = (c.get("text") or "").strip()
+            tokens = count_tokens(text)
+            report["tokens_in"] += tokens
+            if packed and (c.get("score") or 0.0) < cutoff:
+                report["dropped_low_score"] += 1
+                continue
+            if self.token_budget <= 0 or tokens <= remaining:
+                packed.append(c)
+                used.append(c)
+                remaining -= tokens
+                report["tokens_used"] += tokens
+            elif remaining >= self.min_chunk_tokens or not packed:
+                # Always keep (part of) the top hit, however long it is
+                text = truncate_to_tokens(text, remaining)
+                kept = count_tokens(text)
+                packed.append({**c, "text": text})
+                used.append(c)
+                remaining -= kept
+                report["tokens_used"] += kept
+                report["truncated"] += 1
+            else:
+                report["dropped_over_budget"] += 1
+        report["chunks_used"] = len(packed)
+        # The original (untruncated) chunks that made it into the prompt, for citing sources
+        report["used_chunks"] = used
+        report["tokens_saved"] = report["tokens_in"] - report["tokens_used"]
+
+        self.packs += 1
+        self.tokens_in += report["tokens_in"]
+        self.tokens_used += report["tokens_used"]
+        self.dropped_low_score += report["dropped_low_score"]
+        self.dropped_over_budget += report["dropped_over_budget"]
+        self.truncated += report["truncated"]
+        if report["tokens_saved"] and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Context packed {report['chunks_used']}/{report['chunks_in']} chunks, saved {report['tokens_saved']} tokens")
+        return packed, report
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "token_budget": self.token_budget,
+            "min_score_ratio": self.min_score_ratio,
+            "packs": self.packs,
+            "tokens_in": self.tokens_in,
+            "tokens_used": self.tokens_used,
+            "tokens_saved": self.tokens_in - self.tokens_used,
+            "dropped_low_score": self.dropped_low_score,
+            "dropped_over_budget": self.dropped_over_budget,
+            "truncated": self.truncated,
+        }
+
+
+context_packer = ContextPacker(
+    settings.CONTEXT_TOKEN_BUDGET,
+    settings.CONTEXT_MIN_SCORE_RATIO,
+    min_chunk_tokens=settings.CONTEXT_MIN_CHUNK_TOKENS,
+)
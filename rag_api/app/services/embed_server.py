@@ -0,0 +1,268 @@
+"""
+Shared embedding server for multi-worker deployments.
+
+One process owns the dense and sparse models and serves every API worker on
+the node over a Unix socket. Each client connection creates a shared memory
+buffer; the server writes dense vectors straight into it and only sends
+headers and the (small) sparse vectors over the socket. Requests from all
+workers go through one `EmbeddingBatcher`, so concurrent queries from
+different workers share a model pass and memory stays flat as workers are added.
+
+Run it with:
+
+    python -m app.services.embed_server
+
+and set EMBED_SERVER_SOCKET to the same path for the API workers.
+"""
+import os
+import json
+import queue
+import socket
+import struct
+import logging
+import threading
+import socketserver
+from multiprocessing import shared_memory, resource_tracker
+from typing import Any, List, Optional, Tuple
+import numpy as np
+from fastembed import SparseEmbedding
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_LEN = struct.Struct("!I")
+
+
+def _send_frame(sock: socket.socket, body: bytes):
+    sock.sendall(_LEN.pack(len(body)) + body)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("Embedding server connection closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _recv_frame(sock: socket.socket) -> bytes:
+    (n,) = _LEN.unpack(_recv_exact(sock, _LEN.size))
+    return _recv_exact(sock, n)
+
+
+def _attach_shm(name: str) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(name=name)
+    # The client owns the segment; stop our resource tracker from unlinking it when we exit
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+# ------------------ Server ------------------
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock: socket.socket = self.request
+        shm: Optional[shared_memory.SharedMemory] = None
+        try:
+            hello = json.loads(_recv_frame(sock))
+            shm = _attach_shm(hello["shm"])
+            while True:
+                try:
+                    req = json.loads(_recv_frame(sock))
+                except ConnectionError:
+                    return
+                try:
+                    header, payload = self.server.embed(req["texts"], req.get("mode", "hybrid"), shm)
+                except Exception as e:
+                    logger.error(f"Embedding server request failed: {e}", exc_info=True)
+                    header, payload = {"ok": False, "error": str(e)}, b""
+                _send_frame(sock, json.dumps(header).encode("utf-8"))
+                _send_frame(sock, payload)
+        except ConnectionError:
+            return
+        finally:
+            if shm is not None:
+                shm.close()
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, batcher):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.batcher = batcher
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+
+    def embed(self, texts: List[str], mode: str, shm: shared_memory.SharedMemory) -> Tuple[dict, bytes]:
+        # Submit row by row so texts from every worker share batched model passes
+        futures = [self.batcher.submit(t, mode) for t in texts]
+        rows = [f.result() for f in futures]
+
+        header = {"ok": True, "n": len(rows), "dim": 0, "dense_inline": False, "sparse_lens": None}
+        payload = bytearray()
+        if rows and rows[0][0] is not None:
+            dense = np.stack([r[0] for r in rows]).astype(np.float32, copy=False)
+            header["dim"] = int(dense.shape[1])
+            if dense.nbytes <= shm.size:
+                np.ndarray(dense.shape, dtype=np.float32, buffer=shm.buf)[:] = dense
+            else:
+                # Larger than the client's buffer (e.g. bulk ingest); send it over the socket instead
+                header["dense_inline"] = True
+                payload += dense.tobytes()
+        if rows and rows[0][1] is not None:
+            header["sparse_lens"] = [len(r[1].indices) for r in rows]
+            for _, sp in rows:
+                payload += np.asarray(sp.indices, dtype=np.int32).tobytes()
+                payload += np.asarray(sp.values, dtype=np.float32).tobytes()
+        return header, bytes(payload)
+
+
+# ------------------ Client ------------------
+
+class _Connection:
+    def __init__(self, socket_path: str, shm_bytes: int):
+        self.shm = shared_memory.SharedMemory(create=True, size=shm_bytes)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(socket_path)
+            _send_frame(self.sock, json.dumps({"shm": self.shm.name}).encode("utf-8"))
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        try:
+            self.sock.close()
+        finally:
+            self.shm.close()
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class EmbedServerClient:
+    """Thread-safe client with a small pool of connections (one shared memory buffer each)."""
+
+    def __init__(self, socket_path: str, pool_size: int = 4, shm_bytes: int = 4 * 1024 * 1024):
+        self.socket_path = socket_path
+        self.shm_bytes = shm_bytes
+        self._pool: "queue.LifoQueue[_Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def _acquire(self) -> _Connection:
+        self._slots.acquire()
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            try:
+                return _Connection(self.socket_path, self.shm_bytes)
+            except Exception:
+                self._slots.release()
+                raise
+
+    def _release(self, conn: Optional[_Connection]):
+        if conn is not None:
+            self._pool.put(conn)
+        self._slots.release()
+
+    def embed(self, texts: List[str], mode: str = "hybrid") -> Tuple[Optional[np.ndarray], Optional[List[Any]]]:
+        conn = self._acquire()
+        try:
+            _send_frame(conn.sock, json.dumps({"texts": texts, "mode": mode}).encode("utf-8"))
+            header = json.loads(_recv_frame(conn.sock))
+            payload = _recv_frame(conn.sock)
+        except Exception:
+            # Broken connection: drop it so the next call reconnects
+            conn.close()
+            self._release(None)
+            raise
+        try:
+            if not header.get("ok"):
+                raise RuntimeError(f"Embedding server error: {header.get('error')}")
+            return self._decode(conn, header, payload)
+        finally:
+            self._release(conn)
+
+    @staticmethod
+    def _decode(conn: _Connection, header: dict, payload: bytes):
+        n, dim, offset = header["n"], header["dim"], 0
+        dense = None
+        if dim:
+            if header["dense_inline"]:
+                size = n * dim * 4
+                dense = np.frombuffer(payload, dtype=np.float32, count=n * dim).reshape(n, dim).copy()
+                offset = size
+            else:
+                dense = np.ndarray((n, dim), dtype=np.float32, buffer=conn.shm.buf).copy()
+        sparse = None
+        if header["sparse_lens"] is not None:
+            sparse = []
+            for length in header["sparse_lens"]:
+                indices = np.frombuffer(payload, dtype=np.int32, count=length, offset=offset).astype(np.int64)
+                offset += length * 4
+                values = np.frombuffer(payload, dtype=np.float32, count=length, offset=offset).copy()
+                offset += length * 4
+                sparse.append(SparseEmbedding(values=values, indices=indices))
+        return dense, sparse
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_embed_server_client() -> EmbedServerClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = EmbedServerClient(
+                    settings.EMBED_SERVER_SOCKET,
+                    pool_size=settings.EMBED_SERVER_POOL_SIZE,
+                    shm_bytes=settings.EMBED_SERVER_SHM_BYTES,
+                )
+    return _client
+
+
+def main():
+    from app.services.embeddings import get_models, embed_texts_local
+    from app.services.embedding_batcher import EmbeddingBatcher
+
+    logging.basicConfig(
+        level=settings.LOG_LEVEL,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    if not settings.EMBED_SERVER_SOCKET:
+        raise SystemExit("EMBED_SERVER_SOCKET must be set")
+
+    get_models(local=True)
+    batcher = EmbeddingBatcher(
+        embed_texts_local,
+        window_ms=settings.EMBED_BATCH_WINDOW_MS,
+        max_batch_size=settings.EMBED_MAX_BATCH_SIZE,
+    )
+    server = EmbeddingServer(settings.EMBED_SERVER_SOCKET, batcher)
+    logger.info(f"Embedding server listening on {settings.EMBED_SERVER_SOCKET}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        batcher.stop()
+
+
+if __name__ == "__main__":
+    main()
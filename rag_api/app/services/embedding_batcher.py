@@ -0,0 +1,154 @@
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch-size histogram buckets reported by `stats()`.
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching scheduler for query embeddings.
+
+    Callers submit single texts and get a Future back. A worker thread waits
+    for the first queued text, keeps gathering until either `window_ms` has
+    elapsed or `max_batch_size` texts are queued, runs one batched embedding
+    call per retrieval mode in the batch and hands every caller its own row.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str], str], Tuple[Any, Any]],
+        window_ms: float = 2.0,
+        max_batch_size: int = 32,
+    ):
+        self.embed_fn = embed_fn
+        self.window = max(window_ms, 0.0) / 1000.0
+        self.max_batch_size = max(max_batch_size, 1)
+        self._queue: "queue.Queue[Tuple[str, str, Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stopped = False
+
+        # Metrics
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.max_batch_seen = 0
+        self.batch_size_hist = {b: 0 for b in BATCH_SIZE_BUCKETS}
+        self.batch_size_hist["+Inf"] = 0
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopped = False
+                self._worker = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def submit(self, text: str, mode: str = "hybrid") -> Future:
+        """Queue a single text for embedding. Resolves to `(dense_row, sparse_row)`."""
+        self._ensure_worker()
+        fut: Future = Future()
+        self._queue.put((text, mode, fut))
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            with self._stats_lock:
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+        return fut
+
+    def _collect(self) -> List[Tuple[str, str, Future]]:
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Drain whatever is already queued even when the window has elapsed
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopped = True
+                break
+            batch.append(item)
+        return batch
+
+    def _record(self, size: int):
+        with self._stats_lock:
+            self.batches += 1
+            self.items += size
+            self.max_batch_seen = max(self.max_batch_seen, size)
+            for b in BATCH_SIZE_BUCKETS:
+                if size <= b:
+                    self.batch_size_hist[b] += 1
+                    break
+            else:
+                self.batch_size_hist["+Inf"] += 1
+
+    def _run(self):
+        while not self._stopped:
+            batch = self._collect()
+            if not batch:
+                break
+            # Skip callers that gave up (cancelled) before we got to them
+            batch = [(t, m, f) for t, m, f in batch if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            self._record(len(batch))
+            by_mode: Dict[str, List[Tuple[str, Future]]] = {}
+            for text, mode, fut in batch:
+                by_mode.setdefault(mode, []).append((text, fut))
+            for mode, items in by_mode.items():
+                self._embed_group(mode, items)
+
+    def _embed_group(self, mode: str, items: List[Tuple[str, Future]]):
+        texts = [t for t, _ in items]
+        try:
+            dense, sparse = self.embed_fn(texts, mode)
+        except Exception as e:
+            logger.error(f"Batched embedding of {len(texts)} texts failed: {e}")
+            with self._stats_lock:
+                self.errors += 1
+            for _, fut in items:
+                fut.set_exception(e)
+            return
+        for i, (_, fut) in enumerate(items):
+            fut.set_result((
+                dense[i] if dense is not None else None,
+                sparse[i] if sparse is not None else None,
+            ))
+
+    def stop(self):
+        """Stop the worker after the batch in progress. Queued texts are still served first."""
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join(timeout=5)
+        self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "batches": self.batches,
+                "items": self.items,
+                "errors": self.errors,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "batch_size_histogram": {str(k): v for k, v in self.batch_size_hist.items()},
+                "window_ms": self.window * 1000.0,
+                "max_batch_size_limit": self.max_batch_size,
+            }
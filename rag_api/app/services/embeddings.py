@@ -1,62 +1,257 @@
+import os
+import asyncio
 import threading
 import logging
-from typing import List, Tuple, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Any, Optional
 import numpy as np
 from fastembed import TextEmbedding, SparseTextEmbedding
 from app.core.config import settings
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.utils.caching import canonicalize_text
+from app.utils.embedding_cache import query_embedding_cache
+from app.utils.resilience import Deadline, budget
+from app.services.retrieval_modes import HYBRID, needs_dense, needs_sparse
+from app.services.embed_server import get_embed_server_client
 
 logger = logging.getLogger(__name__)
 
 _model_lock = threading.Lock()
 _dense_model = None
 _sparse_model = None
+_batcher = None
+_parallel_pool = None
+_embed_executor = None
 
-def _load_models():
+def _split_threads(total: int) -> Tuple[int, int]:
+    """Split intra-op threads between the dense and sparse sessions so they don't oversubscribe cores."""
+    if total < 2:
+        return 1, 1
+    # bge-large is roughly 3x the compute of the SPLADE (bert-base) model per token
+    dense = max(1, round(total * settings.EMBED_DENSE_THREAD_SHARE))
+    dense = min(dense, total - 1)
+    return dense, total - dense
+
+def _model_threads() -> Tuple[Any, Any]:
+    if not settings.EMBED_PARALLEL:
+        return None, None  # let onnxruntime use its defaults
+    total = settings.EMBED_THREADS or os.cpu_count() or 1
+    return _split_threads(total)
+
+def _load_dense_model():
     try:
-        logger.info(f"Loading dense embedding model: {settings.EMBEDDING_MODEL} (cache_dir={settings.FASTEMBED_CACHE_PATH})")
-        dense = TextEmbedding(model_name=settings.EMBEDDING_MODEL, cache_dir=settings.FASTEMBED_CACHE_PATH)
-        
-        logger.info(f"Loading sparse embedding model: prithivida/Splade_PP_en_v1 (cache_dir={settings.FASTEMBED_CACHE_PATH})")
-        sparse = SparseTextEmbedding(model_name="prithivida/Splade_PP_en_v1", cache_dir=settings.FASTEMBED_CACHE_PATH)
-        
-        return dense, sparse
+        dense_threads, _ = _model_threads()
+        logger.info(f"Loading dense embedding model: {settings.EMBEDDING_MODEL} (cache_dir={settings.FASTEMBED_CACHE_PATH}, threads={dense_threads})")
+        return TextEmbedding(model_name=settings.EMBEDDING_MODEL, cache_dir=settings.FASTEMBED_CACHE_PATH, threads=dense_threads)
+    except Exception as e:
+        logger.error(f"Failed to load dense embedding model: {str(e)}")
+        raise
+
+def _load_sparse_model():
+    try:
+        _, sparse_threads = _model_threads()
+        logger.info(f"Loading sparse embedding model: {settings.SPARSE_EMBEDDING_MODEL} (cache_dir={settings.FASTEMBED_CACHE_PATH}, threads={sparse_threads})")
+        return SparseTextEmbedding(model_name=settings.SPARSE_EMBEDDING_MODEL, cache_dir=settings.FASTEMBED_CACHE_PATH, threads=sparse_threads)
     except Exception as e:
-        logger.error(f"Failed to load embedding models: {str(e)}")
+        logger.error(f"Failed to load sparse embedding model: {str(e)}")
         raise
 
-def get_models():
-    global _dense_model, _sparse_model
-    if _dense_model is None or _sparse_model is None:
+def get_dense_model():
+    global _dense_model
+    if _dense_model is None:
+        with _model_lock:
+            if _dense_model is None:
+                _dense_model = _load_dense_model()
+    return _dense_model
+
+def get_sparse_model():
+    global _sparse_model
+    if _sparse_model is None:
+        with _model_lock:
+            if _sparse_model is None:
+                _sparse_model = _load_sparse_model()
+    return _sparse_model
+
+def get_models(mode: Optional[str] = None, local: bool = False):
+    """
+    Load the models needed by `mode` (default: the deployment's RETRIEVAL_MODE).
+    Models a mode doesn't need are left unloaded and returned as None; they are
+    loaded lazily if a later request asks for them. When EMBED_SERVER_SOCKET is
+    set the models live in the embedding server and nothing is loaded here
+    unless `local` is requested.
+    """
+    if settings.EMBED_SERVER_SOCKET and not local:
+        logger.info(f"Using shared embedding server at {settings.EMBED_SERVER_SOCKET}; not loading models in this worker.")
+        return None, None
+    mode = mode or settings.RETRIEVAL_MODE
+    dense = get_dense_model() if needs_dense(mode) else _dense_model
+    sparse = get_sparse_model() if needs_sparse(mode) else _sparse_model
+    return dense, sparse
+
+def _get_parallel_pool() -> ThreadPoolExecutor:
+    global _parallel_pool
+    if _parallel_pool is None:
         with _model_lock:
-            if _dense_model is None or _sparse_model is None:
-                _dense_model, _sparse_model = _load_models()
-    return _dense_model, _sparse_model
+            if _parallel_pool is None:
+                _parallel_pool = ThreadPoolExecutor(
+                    max_workers=settings.EMBED_PARALLEL_POOL_SIZE,
+                    thread_name_prefix="embed-parallel",
+                )
+    return _parallel_pool
+
+def _embed_dense(dense_model, texts: List[str]) -> np.ndarray:
+    # TextEmbedding.embed returns a generator of numpy arrays
+    dense_gen = dense_model.embed(texts, batch_size=32)
+    embs = np.array(list(dense_gen), dtype=np.float32)
+    
+    # Ensure L2 normalization (BGE model outputs from FastEmbed are pre-normalized, but this acts as a safeguard)
+    norms = np.linalg.norm(embs, axis=1, keepdims=True)
+    return np.divide(embs, norms, out=embs, where=norms > 0)
+
+def _embed_sparse(sparse_model, texts: List[str]) -> List[Any]:
+    return list(sparse_model.embed(texts, batch_size=32))
+
+def embed_texts(texts: List[str], mode: str = HYBRID) -> Tuple[Optional[np.ndarray], Optional[List[Any]]]:
+    """Embed `texts` with the models `mode` needs. The embedding a mode doesn't use is returned as None."""
+    if settings.EMBED_SERVER_SOCKET:
+        try:
+            return get_embed_server_client().embed(texts, mode)
+        except Exception as e:
+            logger.error(f"Error during text embedding via embedding server: {str(e)}")
+            raise
+    return embed_texts_local(texts, mode)
 
-def embed_texts(texts: List[str]) -> Tuple[np.ndarray, List[Any]]:
+def embed_texts_local(texts: List[str], mode: str = HYBRID) -> Tuple[Optional[np.ndarray], Optional[List[Any]]]:
+    """Embed `texts` with the models loaded in this process."""
     try:
-        dense_model, sparse_model = get_models()
-        logger.debug(f"Encoding {len(texts)} texts...")
-        
-        # TextEmbedding.embed returns a generator of numpy arrays
-        dense_gen = dense_model.embed(texts, batch_size=32)
-        embs = np.array(list(dense_gen), dtype=np.float32)
-        
-        # Ensure L2 normalization (BGE model outputs from FastEmbed are pre-normalized, but this acts as a safeguard)
-        norms = np.linalg.norm(embs, axis=1, keepdims=True)
-        embs = np.divide(embs, norms, out=embs, where=norms > 0)
-            
-        sparse_list = list(sparse_model.embed(texts, batch_size=32))
+        logger.debug(f"Encoding {len(texts)} texts (mode={mode})...")
+        if not needs_sparse(mode):
+            return _embed_dense(get_dense_model(), texts), None
+        if not needs_dense(mode):
+            return None, _embed_sparse(get_sparse_model(), texts)
+
+        dense_model, sparse_model = get_dense_model(), get_sparse_model()
+        if settings.EMBED_PARALLEL:
+            # Both ONNX sessions release the GIL, so the models can run side by side
+            pool = _get_parallel_pool()
+            sparse_future = pool.submit(_embed_sparse, sparse_model, texts)
+            embs = _embed_dense(dense_model, texts)
+            return embs, sparse_future.result()
+
+        embs = _embed_dense(dense_model, texts)
+        sparse_list = _embed_sparse(sparse_model, texts)
 
         return embs, sparse_list
     except Exception as e:
         logger.error(f"Error during text embedding: {str(e)}")
         raise
 
-def embed_query(text: str) -> Tuple[np.ndarray, Any]:
+def get_embedding_batcher() -> EmbeddingBatcher:
+    global _batcher
+    if _batcher is None:
+        with _model_lock:
+            if _batcher is None:
+                _batcher = EmbeddingBatcher(
+                    embed_texts,
+                    window_ms=settings.EMBED_BATCH_WINDOW_MS,
+                    max_batch_size=settings.EMBED_MAX_BATCH_SIZE,
+                )
+    return _batcher
+
+def _first_row(dense: Optional[np.ndarray], sparse: Optional[List[Any]]) -> Tuple[Any, Any]:
+    return (
+        dense[0] if dense is not None else None,
+        sparse[0] if sparse is not None else None,
+    )
+
+def embed_query(text: str, mode: str = HYBRID) -> Tuple[Optional[np.ndarray], Any]:
+    try:
+        q = canonicalize_text(text)
+        if settings.EMBED_CACHE_ENABLED:
+            cached = query_embedding_cache.get(q, mode)
+            if cached is not None:
+                return cached
+        if settings.EMBED_BATCHING_ENABLED:
+            # Concurrent queries are coalesced into a single batched model pass
+            dense, sparse = get_embedding_batcher().submit(q, mode).result()
+        else:
+            dense, sparse = _first_row(*embed_texts([q], mode))
+        if settings.EMBED_CACHE_ENABLED:
+            query_embedding_cache.set(q, dense, sparse)
+        return dense, sparse
+    except Exception as e:
+        logger.error(f"Error during query embedding: {str(e)}")
+        raise
+
+def _get_embed_executor() -> ThreadPoolExecutor:
+    global _embed_executor
+    if _embed_executor is None:
+        with _model_lock:
+            if _embed_executor is None:
+                _embed_executor = ThreadPoolExecutor(
+                    max_workers=settings.EMBED_EXECUTOR_WORKERS,
+                    thread_name_prefix="embed-query",
+                )
+    return _embed_executor
+
+async def aembed_query(text: str, mode: str = HYBRID, deadline: Optional[Deadline] = None) -> Tuple[Optional[np.ndarray], Any]:
+    """Embed a query without blocking the event loop, giving up when `deadline` runs out."""
     try:
-        q = text.strip()
-        dense, sparse = embed_texts([q])
-        return dense[0], sparse[0]
+        q = canonicalize_text(text)
+        if settings.EMBED_CACHE_ENABLED:
+            cached = query_embedding_cache.get(q, mode)
+            if cached is not None:
+                return cached
+        if settings.EMBED_BATCHING_ENABLED:
+            # The batcher's worker thread already keeps inference off the loop
+            fut = asyncio.wrap_future(get_embedding_batcher().submit(q, mode))
+            dense, sparse = await asyncio.wait_for(fut, budget(deadline))
+        else:
+            loop = asyncio.get_running_loop()
+            fut = loop.run_in_executor(_get_embed_executor(), embed_texts, [q], mode)
+            dense, sparse = _first_row(*await asyncio.wait_for(fut, budget(deadline)))
+        if settings.EMBED_CACHE_ENABLED:
+            query_embedding_cache.set(q, dense, sparse)
+        return dense, sparse
     except Exception as e:
         logger.error(f"Error during query embedding: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+
+def _embed_queries_with_cache(texts: List[str], mode: str, embed_fn) -> List[Tuple[Any, Any]]:
+    keys = [canonicalize_text(t) for t in texts]
+    rows: List[Any] = [None] * len(keys)
+    if settings.EMBED_CACHE_ENABLED:
+        for i, k in enumerate(keys):
+            rows[i] = query_embedding_cache.get(k, mode)
+    missing = [i for i, r in enumerate(rows) if r is None]
+    if missing:
+        # All cache misses go through a single batched model pass
+        dense, sparse = embed_fn([keys[i] for i in missing], mode)
+        for j, i in enumerate(missing):
+            rows[i] = (
+                dense[j] if dense is not None else None,
+                sparse[j] if sparse is not None else None,
+            )
+            if settings.EMBED_CACHE_ENABLED:
+                query_embedding_cache.set(keys[i], *rows[i])
+    return rows
+
+def embed_queries(texts: List[str], mode: str = HYBRID) -> List[Tuple[Optional[np.ndarray], Any]]:
+    """Embed many queries at once, serving repeats from the query embedding cache."""
+    try:
+        return _embed_queries_with_cache(texts, mode, embed_texts)
+    except Exception as e:
+        logger.error(f"Error during batch query embedding: {str(e)}")
+        raise
+
+async def aembed_queries(texts: List[str], mode: str = HYBRID) -> List[Tuple[Optional[np.ndarray], Any]]:
+    """Async variant of `embed_queries`; the model pass runs on the bounded embedding executor."""
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _get_embed_executor(), _embed_queries_with_cache, texts, mode, embed_texts
+        )
+    except Exception as e:
+        logger.error(f"Error during batch query embedding: {str(e)}")
+        raise
@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.services.warmer import cache_warmer
+from app.utils.ttlcache import answer_cache, retrieval_cache
+
+logger = logging.getLogger(__name__)
+
+
+async def compute_fingerprint(client) -> str:
+    """
+    Short digest of what the collection currently serves: the alias target (if
+    QDRANT_COLLECTION is an alias swapped by the ingest service), the vector
+    config and the point count. Any re-ingest that adds, removes or re-creates
+    points changes it.
+    """
+    name = settings.QDRANT_COLLECTION
+    target = name
+    try:
+        aliases = await client.get_aliases()
+        target = next((a.collection_name for a in aliases.aliases if a.alias_name == name), name)
+    except Exception as e:
+        logger.debug(f"Could not list collection aliases: {e}")
+
+    info = await client.get_collection(target)
+    params = info.config.params
+    state = {
+        "collection": target,
+        "points_count": info.points_count,
+        "params": params.model_dump(mode="json") if hasattr(params, "model_dump") else str(params),
+    }
+    blob = json.dumps(state, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(blob, digest_size=6).hexdigest()
+
+
+class IndexVersion:
+    """
+    The corpus version mixed into every answer / retrieval cache key.
+
+    `settings.INDEX_VERSION` is the manual part; once the collection has been
+    fingerprinted the version becomes `<INDEX_VERSION>-<fingerprint>`. It is
+    derived only from the collection state, so every worker (and a restarted one
+    reading the shared cache backend) arrives at the same version.
+    """
+
+    def __init__(self, base: str):
+        self.base = base
+        self.fingerprint: Optional[str] = None
+        self.changes = 0
+
+    @property
+    def current(self) -> str:
+        return f"{self.base}-{self.fingerprint}" if self.fingerprint else self.base
+
+    def update(self, fingerprint: str) -> bool:
+        """Record a new fingerprint; returns True if the version changed."""
+        if fingerprint == self.fingerprint:
+            return False
+        previous = self.current
+        self.fingerprint = fingerprint
+        self.changes += 1
+        logger.info(f"Index version changed from {previous} to {self.current}")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"version": self.current, "fingerprint": self.fingerprint, "changes": self.changes}
+
+
+index_version = IndexVersion(settings.INDEX_VERSION)
+
+
+def current_index_version() -> str:
+    return index_version.current
+
+
+def on_index_version_change():
+    """
+    Drop this worker's cached answers and retrievals. Keys carry the version, so
+    old entries could never be served again anyway; this frees their memory now.
+    The shared backend is left alone: another worker may already have written
+    entries under the new version, and old rows age out there on their own.
+    """
+    answer_cache.clear(backend=False)
+    retrieval_cache.clear(backend=False)
+    cache_warmer.request_warm()
+
+
+async def check_index_version(client) -> bool:
+    changed = index_version.update(await compute_fingerprint(client))
+    if changed:
+        on_index_version_change()
+    return changed
+
+
+async def run_index_version_monitor():
+    """Background task: re-fingerprint the collection every INDEX_FINGERPRINT_SECONDS."""
+    from app.services.qdrant_client import get_async_qdrant
+
+    while True:
+        await asyncio.sleep(settings.INDEX_FINGERPRINT_SECONDS)
+        try:
+            await check_index_version(get_async_qdrant())
+        except Exception as e:
+            logger.warning(f"Index fingerprint check failed, keeping version {index_version.current}: {e}")
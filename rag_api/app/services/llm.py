@@ -1,27 +1,136 @@
-import json, httpx, logging, threading
-from typing import Protocol, Dict, Any, AsyncIterator, List
+import re, json, httpx, logging, threading, asyncio
+import orjson
+from typing import Protocol, Dict, Any, AsyncIterator, List, Optional
 from app.core.config import settings
+from app.utils.resilience import CircuitBreaker, Deadline, deadline_timeout, llm_breaker
 
 from openai import AsyncAzureOpenAI
 import time
 
 logger = logging.getLogger(__name__)
 
+LLM_UNAVAILABLE_MSG = "I am sorry, but the language model is temporarily unavailable. Please try again later."
+
 class LLMClient(Protocol):
     async def chat_stream(
-        self, model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: int
+        self, model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: int,
+        deadline: Optional[Deadline] = None,
     ) -> AsyncIterator[Dict[str, Any]]:
         ...
 
     async def chat_once(
-        self, model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: int
+        self, model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: int,
+        deadline: Optional[Deadline] = None,
     ) -> Dict[str, Any]:
         ...
 
+def _llm_timeout() -> httpx.Timeout:
+    # No overall timeout (answers can stream for a while), but bound connecting, waiting for
+    # a pooled connection and the gap between streamed bytes so a hung backend can't hold a request forever
+    return httpx.Timeout(
+        None,
+        connect=settings.LLM_CONNECT_TIMEOUT,
+        read=settings.LLM_READ_TIMEOUT,
+        write=settings.LLM_WRITE_TIMEOUT,
+        pool=settings.LLM_POOL_TIMEOUT,
+    )
+
+
+def build_llm_http_client() -> httpx.AsyncClient:
+    """Pooled keep-alive HTTP client for an LLM backend, sized by the LLM_POOL_* settings."""
+    return httpx.AsyncClient(
+        timeout=_llm_timeout(),
+        limits=httpx.Limits(
+            max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        http2=settings.LLM_HTTP2,
+    )
+
+
+async def warm_connections(client: httpx.AsyncClient, url: str, n: int) -> int:
+    """
+    Open up to `n` pooled connections to `url` with concurrent cheap requests, so the
+    first real requests skip TCP/TLS setup. Any HTTP response counts: the connection is
+    what we want. Returns how many requests got a response.
+    """
+    async def one() -> bool:
+        try:
+            await client.get(url)
+            return True
+        except Exception as e:
+            logger.debug(f"LLM connection warmup request failed: {e}")
+            return False
+
+    # One HTTP/2 connection multiplexes every request
+    n = 1 if settings.LLM_HTTP2 else max(n, 0)
+    return sum(await asyncio.gather(*(one() for _ in range(n))))
+
+
+def _ollama_options(temperature: float, max_tokens: int) -> Dict[str, Any]:
+    options = {"temperature": temperature, "num_predict": max_tokens}
+    # A fixed context size: a per-request change would make Ollama reload the model
+    if settings.OLLAMA_NUM_CTX:
+        options["num_ctx"] = settings.OLLAMA_NUM_CTX
+    return options
+
+
+def _ollama_keep_alive() -> Dict[str, Any]:
+    return {"keep_alive": settings.OLLAMA_KEEP_ALIVE} if settings.OLLAMA_KEEP_ALIVE else {}
+
+
+_DURATION_RE = re.compile(r"-?(?:\d+(?:\.\d+)?(?:ms|h|m|s))+")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def _keep_alive_seconds() -> Optional[float]:
+    """OLLAMA_KEEP_ALIVE ("30m", "1h30m", "300", ...) in seconds; None if unset, unparseable or forever (< 0)."""
+    value = (settings.OLLAMA_KEEP_ALIVE or "").strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        if not _DURATION_RE.fullmatch(value):
+            return None
+        seconds = sum(
+            float(n) * _DURATION_UNITS[unit] for n, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+        )
+        if value.startswith("-"):
+            seconds = -seconds
+    return seconds if seconds > 0 else None
+
+
+def keep_warm_interval() -> float:
+    """LLM_KEEP_WARM_SECONDS, shortened to half of Ollama's keep_alive so a ping always lands before it unloads."""
+    interval = settings.LLM_KEEP_WARM_SECONDS
+    keep_alive = _keep_alive_seconds()
+    if interval > 0 and keep_alive is not None:
+        interval = min(interval, keep_alive / 2)
+    return interval
+
+
 class OllamaClient:
     def __init__(self, base_url: str):
         self.base_url = base_url.rstrip("/")
-        self._client = httpx.AsyncClient(timeout=None)
+        self._client = build_llm_http_client()
+
+    async def warmup(self, connections: int) -> int:
+        return await warm_connections(self._client, f"{self.base_url}/api/version", connections)
+
+    async def health(self):
+        r = await self._client.get(f"{self.base_url}/api/version", timeout=settings.LLM_CONNECT_TIMEOUT)
+        r.raise_for_status()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def keep_warm(self, model: str):
+        """Load `model` if Ollama unloaded it and restart its keep_alive timer (a chat with no messages)."""
+        payload = {"model": model, "messages": [], "stream": False, **_ollama_keep_alive()}
+        if settings.OLLAMA_NUM_CTX:
+            payload["options"] = {"num_ctx": settings.OLLAMA_NUM_CTX}
+        r = await self._client.post(f"{self.base_url}/api/chat", json=payload)
+        r.raise_for_status()
 
     async def chat_stream(
         self, model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: int
@@ -29,15 +138,16 @@ class OllamaClient:
         url = f"{self.base_url}/api/chat"
         payload = {
             "model": model, "messages": messages,
-            "options": {"temperature": temperature, "num_predict": max_tokens},
+            "options": _ollama_options(temperature, max_tokens),
             "stream": True,
+            **_ollama_keep_alive(),
         }
         async with self._client.stream("POST", url, json=payload) as r:
             r.raise_for_status()
             async for line in r.aiter_lines():
                 if not line: continue
                 try:
-                    yield json.loads(line)
+                    yield orjson.loads(line)
                 except Exception:
                     logger.warning(f"Failed to parse Ollama stream line: {line}")
                     continue
@@ -48,35 +158,79 @@ class OllamaClient:
         url = f"{self.base_url}/api/chat"
         payload = {
             "model": model, "messages": messages,
-            "options": {"temperature": temperature, "num_predict": max_tokens},
+            "options": _ollama_options(temperature, max_tokens),
             "stream": False,
+            **_ollama_keep_alive(),
         }
         r = await self._client.post(url, json=payload)
         r.raise_for_status()
-        return r.json()
+        return orjson.loads(r.content)
+
+def _cached_tokens(usage) -> Optional[int]:
+    """Prompt tokens Azure served from its prompt cache (reported for prompts of 1024+ tokens)."""
+    details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    return getattr(details, "cached_tokens", None) if details else None
+
+
+# First Azure OpenAI API version (2024-09-01-preview) that accepts `stream_options`; older ones reject it with a 400
+AZURE_STREAM_USAGE_MIN_VERSION = "2024-09-01"
+
+
+def _supports_stream_usage(api_version: str) -> bool:
+    # Versions are dates with an optional "-preview" suffix, so the date prefix orders them
+    return (api_version or "")[:10] >= AZURE_STREAM_USAGE_MIN_VERSION
+
 
 class AzureOpenAIClient:
     def __init__(self, api_key: str, endpoint: str, api_version: str):
+        self.endpoint = endpoint
+        self.stream_usage = _supports_stream_usage(api_version)
+        self._http = build_llm_http_client()
         self.client = AsyncAzureOpenAI(
             api_key=api_key,
             azure_endpoint=endpoint,
-            api_version=api_version
+            api_version=api_version,
+            timeout=_llm_timeout(),
+            http_client=self._http,
         )
 
+    async def warmup(self, connections: int) -> int:
+        return await warm_connections(self._http, self.endpoint, connections)
+
+    async def health(self):
+        # Reachability only: the endpoint root answers 4xx without a path, 5xx when the service is down
+        r = await self._http.get(self.endpoint, timeout=settings.LLM_CONNECT_TIMEOUT)
+        if r.status_code >= 500:
+            r.raise_for_status()
+
+    async def aclose(self):
+        await self.client.close()
+
+    async def keep_warm(self, model: str):
+        # Azure deployments are always loaded; only keep the pooled connections alive
+        await self.health()
+
     async def chat_stream(
         self, model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: int
     ) -> AsyncIterator[Dict[str, Any]]:
         # Azure OpenAI stream implementation
+        # With include_usage the last chunk carries token usage (and no choices). Older API
+        # versions don't send it; the completion count then falls back to the streamed events
+        extra = {"stream_options": {"include_usage": True}} if self.stream_usage else {}
         stream = await self.client.chat.completions.create(
             model=model,
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
-            stream=True
+            stream=True,
+            **extra,
         )
         
         i = 0
+        usage = None
         async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
             if chunk.choices and chunk.choices[0].delta.content is not None:
                 yield {
                     "model": model,
@@ -87,7 +241,14 @@ class AzureOpenAIClient:
                 }
                 i += 1
         
-        yield { "done": True, "message": {"role": "assistant", "content": ""} }
+        # Same field names as Ollama's final frame
+        yield {
+            "done": True,
+            "message": {"role": "assistant", "content": ""},
+            "prompt_eval_count": usage.prompt_tokens if usage else None,
+            "eval_count": usage.completion_tokens if usage else None,
+            "prompt_cached_count": _cached_tokens(usage),
+        }
 
     async def chat_once(
         self, model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: int
@@ -109,10 +270,54 @@ class AzureOpenAIClient:
             "load_duration": 0,
             "prompt_eval_count": response.usage.prompt_tokens if response.usage else 0,
             "eval_count": response.usage.completion_tokens if response.usage else 0,
+            "prompt_cached_count": _cached_tokens(response.usage),
             "eval_duration": 0
         }
 
 
+class GuardedLLMClient:
+    """
+    Wraps a provider client with the LLM circuit breaker and per-request deadlines.
+
+    `chat_once` must finish within the deadline; `chat_stream` must produce its
+    first event within it, after which the provider's read timeout bounds each
+    gap. A stream only counts as a success for the breaker once it completes.
+    Running out of the deadline raises `DeadlineExceeded`, which the breaker
+    doesn't count; the provider's own timeouts do count.
+    """
+
+    def __init__(self, inner: LLMClient, breaker: CircuitBreaker):
+        self.inner = inner
+        self.breaker = breaker
+
+    async def chat_once(
+        self, model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: int,
+        deadline: Optional[Deadline] = None,
+    ) -> Dict[str, Any]:
+        with self.breaker:
+            async with deadline_timeout(deadline):
+                return await self.inner.chat_once(model, messages, temperature, max_tokens)
+
+    async def chat_stream(
+        self, model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: int,
+        deadline: Optional[Deadline] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        with self.breaker:
+            events = self.inner.chat_stream(model, messages, temperature, max_tokens)
+            try:
+                async with deadline_timeout(deadline):
+                    first = await anext(events, None)
+                if first is None:
+                    return
+                yield first
+                async for ev in events:
+                    yield ev
+            finally:
+                await events.aclose()
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
 
 _llm_client = None
 _client_lock = threading.Lock()
@@ -122,16 +327,47 @@ def get_llm_client() -> LLMClient:
     if _llm_client is None:
         with _client_lock:
             if _llm_client is None:
-                if settings.LLM_PROVIDER == "ollama":
-                    _llm_client = OllamaClient(settings.OLLAMA_BASE_URL)
+                if settings.LLM_BACKENDS:
+                    from app.services.llm_router import router_from_settings
+                    client = router_from_settings()
+                elif settings.LLM_PROVIDER == "ollama":
+                    client = OllamaClient(settings.OLLAMA_BASE_URL)
                 elif settings.LLM_PROVIDER == "azure_openai":
                     if not settings.AZURE_OPENAI_API_KEY or not settings.AZURE_OPENAI_ENDPOINT:
                         raise ValueError("AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT must be set.")
-                    _llm_client = AzureOpenAIClient(
+                    client = AzureOpenAIClient(
                         api_key=settings.AZURE_OPENAI_API_KEY, 
                         endpoint=settings.AZURE_OPENAI_ENDPOINT, 
                         api_version=settings.AZURE_OPENAI_API_VERSION
                     )
                 else:
                     raise ValueError(f"Unknown LLM_PROVIDER: {settings.LLM_PROVIDER}")
+                _llm_client = GuardedLLMClient(client, llm_breaker)
     return _llm_client
+
+
+async def warmup_llm_client() -> int:
+    """Pre-open LLM_WARMUP_CONNECTIONS pooled connections to the configured backend."""
+    client = get_llm_client()
+    opened = await client.warmup(settings.LLM_WARMUP_CONNECTIONS)
+    logger.info(f"Warmed {opened} LLM backend connections")
+    return opened
+
+
+async def run_llm_keep_warm():
+    """Background task: ping the model every `keep_warm_interval()` seconds so idle periods don't unload it."""
+    interval = keep_warm_interval()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await get_llm_client().keep_warm(settings.ACTIVE_LLM_MODEL)
+        except Exception as e:
+            logger.warning(f"LLM keep-warm ping failed: {e}")
+
+
+async def close_llm_client():
+    global _llm_client
+    with _client_lock:
+        client, _llm_client = _llm_client, None
+    if client is not None:
+        await client.aclose()
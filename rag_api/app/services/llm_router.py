@@ -0,0 +1,240 @@
+import json
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+from app.core.config import settings
+from app.services.llm import AzureOpenAIClient, LLMClient, OllamaClient
+from app.utils.resilience import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBackend:
+    """One generation backend in an `LLMRouter` pool, with its own cap, breaker and health."""
+
+    def __init__(
+        self,
+        name: str,
+        client: LLMClient,
+        model: Optional[str] = None,
+        max_concurrency: int = 4,
+        weight: float = 1.0,
+    ):
+        self.name = name
+        self.client = client
+        self.model = model  # overrides the request's model (e.g. an Azure deployment name)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.weight = weight if weight > 0 else 1.0
+        self.breaker = CircuitBreaker(
+            f"llm:{name}",
+            failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.BREAKER_RESET_SECONDS,
+        )
+        self.healthy = True
+        self.outstanding = 0
+        self.served = 0
+        self.failovers = 0
+
+    @property
+    def load(self) -> float:
+        return self.outstanding / self.weight
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and self.breaker.state != CircuitBreaker.OPEN
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "served": self.served,
+            "failovers": self.failovers,
+            "breaker": self.breaker.stats(),
+        }
+
+
+class LLMRouter:
+    """
+    `LLMClient` over a pool of backends.
+
+    Each call goes to the backend with the fewest outstanding requests (divided
+    by its `weight`) among those that are healthy, not circuit-broken and below
+    their `max_concurrency`; when every backend is at its cap the call waits for
+    a slot. A backend that fails before producing anything (connection refused,
+    HTTP error, no first token) is skipped and the call fails over to the next
+    one; once a stream has yielded its first event it is committed to that
+    backend. Unhealthy backends are only tried when no healthy one is left.
+    """
+
+    def __init__(self, backends: List[LLMBackend]):
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.backends = backends
+        self._slot_freed: Optional[asyncio.Condition] = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._slot_freed is None:
+            self._slot_freed = asyncio.Condition()
+        return self._slot_freed
+
+    def _pick(self, exclude: set) -> Optional[LLMBackend]:
+        candidates = [b for b in self.backends if b.name not in exclude]
+        preferred = [b for b in candidates if b.available] or candidates
+        free = [b for b in preferred if b.outstanding < b.max_concurrency]
+        return min(free, key=lambda b: b.load) if free else None
+
+    async def _acquire(self, exclude: set) -> Optional[LLMBackend]:
+        """Reserve a slot on the least loaded backend not in `exclude`; None if none are left."""
+        if len(exclude) >= len(self.backends):
+            return None
+        cond = self._condition()
+        async with cond:
+            while True:
+                backend = self._pick(exclude)
+                if backend is not None:
+                    backend.outstanding += 1
+                    return backend
+                await cond.wait()
+
+    async def _release(self, backend: LLMBackend):
+        backend.outstanding -= 1
+        cond = self._condition()
+        async with cond:
+            cond.notify()
+
+    async def chat_stream(
+        self, model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        tried: set = set()
+        last_error: Optional[Exception] = None
+        while True:
+            backend = await self._acquire(tried)
+            if backend is None:
+                raise last_error or RuntimeError("No LLM backend available")
+            tried.add(backend.name)
+            started = False
+            try:
+                with backend.breaker:
+                    events = backend.client.chat_stream(backend.model or model, messages, temperature, max_tokens)
+                    try:
+                        first = await anext(events, None)
+                        # Committed to this backend from here on
+                        started = True
+                        if first is not None:
+                            yield first
+                            async for ev in events:
+                                yield ev
+                    finally:
+                        await events.aclose()
+                backend.served += 1
+                return
+            except Exception as e:
+                if started:
+                    raise
+                backend.failovers += 1
+                last_error = e
+                logger.warning(f"LLM backend {backend.name} failed before the first token, failing over: {e}")
+            finally:
+                await self._release(backend)
+
+    async def chat_once(
+        self, model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: int
+    ) -> Dict[str, Any]:
+        tried: set = set()
+        last_error: Optional[Exception] = None
+        while True:
+            backend = await self._acquire(tried)
+            if backend is None:
+                raise last_error or RuntimeError("No LLM backend available")
+            tried.add(backend.name)
+            try:
+                with backend.breaker:
+                    resp = await backend.client.chat_once(backend.model or model, messages, temperature, max_tokens)
+                backend.served += 1
+                return resp
+            except Exception as e:
+                backend.failovers += 1
+                last_error = e
+                logger.warning(f"LLM backend {backend.name} failed, failing over: {e}")
+            finally:
+                await self._release(backend)
+
+    async def check_health(self):
+        async def one(backend: LLMBackend):
+            try:
+                await backend.client.health()
+                healthy = True
+            except Exception as e:
+                logger.debug(f"LLM backend {backend.name} health check failed: {e}")
+                healthy = False
+            if healthy != backend.healthy:
+                logger.warning(f"LLM backend {backend.name} is now {'healthy' if healthy else 'unhealthy'}")
+            backend.healthy = healthy
+
+        await asyncio.gather(*(one(b) for b in self.backends))
+
+    async def warmup(self, connections: int) -> int:
+        opened = await asyncio.gather(
+            *(b.client.warmup(connections) for b in self.backends), return_exceptions=True
+        )
+        return sum(n for n in opened if isinstance(n, int))
+
+    async def keep_warm(self, model: str):
+        await asyncio.gather(
+            *(b.client.keep_warm(b.model or model) for b in self.backends), return_exceptions=True
+        )
+
+    async def aclose(self):
+        for b in self.backends:
+            await b.client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {b.name: b.stats() for b in self.backends}
+
+
+def backend_from_config(cfg: Dict[str, Any]) -> LLMBackend:
+    """
+    Build a backend from one LLM_BACKENDS entry, e.g.
+    {"provider": "ollama", "base_url": "http://gpu1:11434", "max_concurrency": 4} or
+    {"provider": "azure_openai", "endpoint": "...", "api_key": "...", "model": "gpt-4o-mini"}.
+    """
+    provider = cfg.get("provider", "ollama")
+    if provider == "ollama":
+        base_url = cfg.get("base_url", settings.OLLAMA_BASE_URL)
+        client = OllamaClient(base_url)
+        name = cfg.get("name", base_url)
+    elif provider == "azure_openai":
+        endpoint = cfg.get("endpoint", settings.AZURE_OPENAI_ENDPOINT)
+        api_key = cfg.get("api_key", settings.AZURE_OPENAI_API_KEY)
+        if not endpoint or not api_key:
+            raise ValueError("Azure OpenAI backends need an endpoint and api_key")
+        client = AzureOpenAIClient(
+            api_key=api_key,
+            endpoint=endpoint,
+            api_version=cfg.get("api_version", settings.AZURE_OPENAI_API_VERSION),
+        )
+        name = cfg.get("name", f"{endpoint}:{cfg.get('model', '')}")
+    else:
+        raise ValueError(f"Unknown LLM backend provider: {provider}")
+    return LLMBackend(
+        name,
+        client,
+        model=cfg.get("model"),
+        max_concurrency=int(cfg.get("max_concurrency", settings.LLM_BACKEND_MAX_CONCURRENCY)),
+        weight=float(cfg.get("weight", 1.0)),
+    )
+
+
+def router_from_settings() -> LLMRouter:
+    return LLMRouter([backend_from_config(cfg) for cfg in json.loads(settings.LLM_BACKENDS)])
+
+
+async def run_llm_health_checks(router: LLMRouter):
+    """Background task: probe every backend every LLM_HEALTH_CHECK_SECONDS."""
+    while True:
+        try:
+            await router.check_health()
+        except Exception as e:
+            logger.warning(f"LLM backend health checks failed: {e}")
+        await asyncio.sleep(settings.LLM_HEALTH_CHECK_SECONDS)
@@ -0,0 +1,310 @@
+import os
+import json
+import mmap
+import fcntl
+import time
+import shutil
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SCROLL_BATCH = 1024
+# Rows scored per matmul block, so float16/int8 rows are upcast a block at a time
+SEARCH_BLOCK = 65536
+
+
+class LocalVectorIndex:
+    """
+    Degraded-mode snapshot of the collection for when Qdrant is unreachable.
+
+    Each refresh scrolls the dense vectors and payloads out of Qdrant and writes
+    a new generation directory: a float16 (or int8 + per-row scale) `.npy`
+    matrix that is memory-mapped on load, and the payloads as JSON lines with
+    an offsets array so only the top-k payloads are ever parsed. A `CURRENT`
+    file points at the live generation and is swapped atomically.
+
+    The matrix is preallocated on disk from the collection's point count and
+    filled row by row while scrolling, so a refresh never holds the vectors in
+    memory. Searches only take the lock to pick up the live arrays.
+    """
+
+    def __init__(self, path: str, dtype: str = "float16", max_points: int = 500_000):
+        self.path = path
+        self.dtype = dtype
+        self.max_points = max_points
+        self.lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._payloads: Optional[mmap.mmap] = None
+        self.generation: Optional[str] = None
+        self.refreshed_at: Optional[float] = None
+        self.searches = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._vectors is not None
+
+    def __len__(self) -> int:
+        return 0 if self._vectors is None else self._vectors.shape[0]
+
+    # ------------------ Build ------------------
+
+    def _count(self, client) -> int:
+        total = client.count(collection_name=settings.QDRANT_COLLECTION, exact=True).count
+        if total > self.max_points:
+            logger.warning(f"Local index capped at LOCAL_INDEX_MAX_POINTS={self.max_points}")
+        return min(total, self.max_points)
+
+    def _scroll(self, client, limit: int):
+        offset = None
+        seen = 0
+        while True:
+            points, offset = client.scroll(
+                collection_name=settings.QDRANT_COLLECTION,
+                limit=min(SCROLL_BATCH, limit - seen),
+                offset=offset,
+                with_payload=True,
+                with_vectors=["dense"],
+            )
+            for pt in points:
+                vec = pt.vector.get("dense") if isinstance(pt.vector, dict) else pt.vector
+                if vec is None:
+                    continue
+                yield vec, pt.payload or {}
+                seen += 1
+                if seen >= limit:
+                    return
+            if offset is None:
+                return
+
+    @contextmanager
+    def _refresh_lock(self):
+        """
+        Exclusive lock on the snapshot directory, shared by every worker on the node.
+        Yields False (without waiting) when another worker holds it.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "refresh.lock"), "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _current_generation(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, "CURRENT")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _load_if_changed(self):
+        current = self._current_generation()
+        if current is not None and current != self.generation:
+            self.load()
+
+    def refresh(self, client, min_interval: float = 0) -> int:
+        """
+        Snapshot the collection into a new generation and switch to it.
+
+        Workers sharing `path` take turns: while one refreshes, the others keep
+        (or pick up) the generation `CURRENT` names instead of writing their own,
+        and a generation younger than `min_interval` seconds is adopted rather
+        than rebuilt.
+        """
+        with self._refresh_lock() as acquired:
+            if not acquired:
+                logger.info("Another worker is refreshing the local index, keeping the current snapshot")
+                self._load_if_changed()
+                return len(self)
+            current = self._current_generation()
+            if current is not None and current.isdigit() and time.time() - int(current) / 1000 < min_interval:
+                self._load_if_changed()
+                return len(self)
+            generation = self._write_generation(client)
+            self.load()
+            self._prune_generations()
+        logger.info(f"Local index refreshed: {len(self)} points ({self.dtype}) in generation {generation}")
+        return len(self)
+
+    def _write_generation(self, client) -> str:
+        generation = str(int(time.time() * 1000))
+        gen_dir = os.path.join(self.path, generation)
+        os.makedirs(gen_dir, exist_ok=True)
+        try:
+            capacity = self._count(client)
+            if capacity <= 0:
+                raise ValueError("collection is empty")
+            vectors_path = os.path.join(gen_dir, "vectors.npy")
+            stored = None
+            scales = np.ones(capacity, dtype=np.float32) if self.dtype == "int8" else None
+            offsets = np.empty(capacity + 1, dtype=np.int64)
+            n = 0
+            with open(os.path.join(gen_dir, "payloads.jsonl"), "wb") as f:
+                for vec, payload in self._scroll(client, capacity):
+                    row = np.asarray(vec, dtype=np.float32)
+                    if stored is None:
+                        stored = np.lib.format.open_memmap(
+                            vectors_path, mode="w+",
+                            dtype=np.int8 if scales is not None else np.float16,
+                            shape=(capacity, row.shape[0]),
+                        )
+                    if scales is not None:
+                        scales[n] = float(np.abs(row).max()) / 127.0 or 1.0
+                        stored[n] = np.round(row / scales[n])
+                    else:
+                        stored[n] = row
+                    offsets[n] = f.tell()
+                    f.write(json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n")
+                    n += 1
+                offsets[n] = f.tell()
+
+            if n == 0:
+                raise ValueError("collection is empty")
+            stored.flush()
+            # Points deleted since the count leave unused rows at the end
+            if n < capacity:
+                self._truncate_rows(vectors_path, stored, n)
+            del stored
+            if scales is not None:
+                np.save(os.path.join(gen_dir, "scales.npy"), scales[:n])
+            np.save(os.path.join(gen_dir, "offsets.npy"), offsets[: n + 1])
+
+            tmp = os.path.join(self.path, "CURRENT.tmp")
+            with open(tmp, "w") as f:
+                f.write(generation)
+            os.replace(tmp, os.path.join(self.path, "CURRENT"))
+        except Exception:
+            shutil.rmtree(gen_dir, ignore_errors=True)
+            raise
+        return generation
+
+    @staticmethod
+    def _truncate_rows(path: str, stored: np.ndarray, n: int):
+        """Rewrite the matrix at `path` with only its first `n` rows, a block at a time."""
+        tmp = path + ".tmp"
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=stored.dtype, shape=(n, stored.shape[1]))
+        for start in range(0, n, SEARCH_BLOCK):
+            out[start:start + SEARCH_BLOCK] = stored[start:min(start + SEARCH_BLOCK, n)]
+        out.flush()
+        del out
+        os.replace(tmp, path)
+
+    def _prune_generations(self):
+        """Delete old generations (caller holds the refresh lock); never the one `CURRENT` names."""
+        keep = {self._current_generation(), self.generation}
+        for name in os.listdir(self.path):
+            full = os.path.join(self.path, name)
+            if name not in keep and name.isdigit() and os.path.isdir(full):
+                shutil.rmtree(full, ignore_errors=True)
+
+    # ------------------ Load / search ------------------
+
+    def load(self) -> bool:
+        """Memory-map the generation `CURRENT` points at. Returns False if there is none."""
+        for attempt in range(3):
+            generation = self._current_generation()
+            if generation is None:
+                return False
+            try:
+                return self._load_generation(generation)
+            except FileNotFoundError:
+                # Another worker switched CURRENT and pruned this generation while we read it
+                if attempt == 2 or self._current_generation() == generation:
+                    raise
+        return False
+
+    def _load_generation(self, generation: str) -> bool:
+        gen_dir = os.path.join(self.path, generation)
+        vectors = np.load(os.path.join(gen_dir, "vectors.npy"), mmap_mode="r")
+        scales_path = os.path.join(gen_dir, "scales.npy")
+        scales = np.load(scales_path) if os.path.exists(scales_path) else None
+        offsets = np.load(os.path.join(gen_dir, "offsets.npy"))
+        # The map keeps its own descriptor, so the file can be closed right away
+        with open(os.path.join(gen_dir, "payloads.jsonl"), "rb") as payload_file:
+            payloads = mmap.mmap(payload_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Searches in flight keep their references to the old arrays and payload
+        # map, which are unmapped once the last of them finishes
+        with self.lock:
+            self._vectors, self._scales, self._offsets = vectors, scales, offsets
+            self._payloads = payloads
+            self.generation = generation
+            self.refreshed_at = os.path.getmtime(os.path.join(self.path, "CURRENT"))
+        return True
+
+    def search(self, q_dense: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        # Only the swap of the live generation is serialized; scoring runs concurrently
+        with self.lock:
+            vectors, scales, offsets, payloads = self._vectors, self._scales, self._offsets, self._payloads
+            if vectors is None:
+                raise RuntimeError("Local index is not loaded")
+            self.searches += 1
+        q = np.asarray(q_dense, dtype=np.float32)
+        n = vectors.shape[0]
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SEARCH_BLOCK):
+            block = vectors[start:start + SEARCH_BLOCK].astype(np.float32)
+            scores[start:start + SEARCH_BLOCK] = block @ q
+        if scales is not None:
+            scores *= scales
+
+        k = min(top_k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        out = []
+        for i in top:
+            payload = json.loads(payloads[offsets[i]:offsets[i + 1]])
+            payload["score"] = float(scores[i])
+            out.append(payload)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "points": len(self),
+            "dtype": self.dtype,
+            "generation": self.generation,
+            "refreshed_at": self.refreshed_at,
+            "searches": self.searches,
+        }
+
+
+local_index = LocalVectorIndex(
+    settings.LOCAL_INDEX_PATH,
+    dtype=settings.LOCAL_INDEX_DTYPE,
+    max_points=settings.LOCAL_INDEX_MAX_POINTS,
+)
+
+
+async def run_local_index_refresher():
+    """Background task: load the last snapshot, then refresh it every LOCAL_INDEX_REFRESH_SECONDS."""
+    from app.services.qdrant_client import get_qdrant
+
+    try:
+        if await asyncio.to_thread(local_index.load):
+            logger.info(f"Loaded local index snapshot with {len(local_index)} points")
+    except Exception as e:
+        logger.warning(f"Could not load existing local index snapshot: {e}")
+
+    while True:
+        try:
+            # Another worker's snapshot from the last half interval is adopted, not rebuilt
+            await asyncio.to_thread(
+                lambda: local_index.refresh(get_qdrant(), min_interval=settings.LOCAL_INDEX_REFRESH_SECONDS / 2)
+            )
+        except Exception as e:
+            logger.warning(f"Local index refresh failed: {e}")
+        await asyncio.sleep(settings.LOCAL_INDEX_REFRESH_SECONDS)
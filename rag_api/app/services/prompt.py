@@ -1,7 +1,11 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
+from app.services.context_packer import context_packer
 
 
+# Kept byte-for-byte constant (nothing per request goes in here) so it is the
+# shared prefix that Ollama's KV cache and Azure prompt caching reuse
 SYSTEM_PROMPT = """You are a helpful assistant using retrieved context to answer questions.
+Answer the question at the end of the user message using the context before it.
 Rules:
 - Use only the provided context for factual claims.
 - If the context is insufficient, say you don't know.
@@ -11,23 +15,29 @@ Rules:
 - Do NOT mention filenames (e.g. 'source: file.pdf') in your answer.
 """
 
+
+def _chunk_order(c: Dict) -> tuple:
+    return (str(c.get("source_id") or ""), str(c.get("chunk_id") or ""), c.get("text") or "")
+
+
 def build_context(chunks: List[Dict]) -> str:
     lines = []
-    for i, c in enumerate(chunks, 1):
-        # We can just provide the text. If we want inline referencing we could prefix with [i].
-        # For now, let's keep it simple.
+    # Ordered by chunk id, not score, so the same chunks always render the same
+    # text and a repeated or overlapping retrieval keeps a longer cached prefix
+    for i, c in enumerate(sorted(chunks, key=_chunk_order), 1):
         lines.append(f"Context [{i}]: {c.get('text','').strip()}")
     return "\n".join(lines)
 
 
-def build_messages(question: str, chunks: List[Dict]) -> list:
-    ctx = build_context(chunks)
-    user_prompt = f"""Answer the question using the context below.
-        Context:
-        {ctx}
-
-        Question: {question}
-        """
+def build_messages(question: str, chunks: List[Dict], report: Optional[Dict] = None) -> list:
+    # Only the chunks that fit the context token budget (and score close enough to the top hit) go in.
+    # `report` receives the packing report; cite sources from its "used_chunks", not from `chunks`
+    packed, packing = context_packer.pack(chunks)
+    if report is not None:
+        report.update(packing)
+    ctx = build_context(packed)
+    # Most stable first: context, then the question that differs on every turn
+    user_prompt = f"Context:\n{ctx}\n\nQuestion: {question}"
     return [
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": user_prompt},
@@ -1,5 +1,6 @@
 import logging
-from qdrant_client import QdrantClient
+import httpx
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.models import Distance, VectorParams, BinaryQuantization, BinaryQuantizationConfig, OptimizersConfigDiff, SparseVectorParams
 from app.core.config import settings
 from functools import lru_cache
@@ -23,8 +24,56 @@ def get_qdrant() -> QdrantClient:
         logger.error(f"Failed to connect to Qdrant: {str(e)}")
         raise
 
+@lru_cache(maxsize=1)
+def get_async_qdrant() -> AsyncQdrantClient:
+    """Return the shared async Qdrant client (pooled keep-alive connections, optional gRPC)."""
+    logger.info(
+        f"Creating async Qdrant client for {settings.QDRANT_URL}:{settings.QDRANT_PORT} "
+        f"(prefer_grpc={settings.QDRANT_PREFER_GRPC}, pool_size={settings.QDRANT_POOL_SIZE})"
+    )
+    kwargs = {}
+    if settings.QDRANT_PREFER_GRPC:
+        # gRPC multiplexes over a pool of channels
+        kwargs["pool_size"] = settings.QDRANT_POOL_SIZE
+    else:
+        # qdrant-client disables keep-alive for localhost unless limits are given explicitly
+        kwargs["limits"] = httpx.Limits(
+            max_connections=settings.QDRANT_POOL_SIZE,
+            max_keepalive_connections=settings.QDRANT_POOL_SIZE,
+        )
+    return AsyncQdrantClient(
+        url=settings.QDRANT_URL,
+        port=settings.QDRANT_PORT,
+        grpc_port=settings.QDRANT_GRPC_PORT,
+        prefer_grpc=settings.QDRANT_PREFER_GRPC,
+        timeout=int(settings.QDRANT_TIMEOUT),
+        **kwargs,
+    )
+
+async def close_async_qdrant():
+    if get_async_qdrant.cache_info().currsize:
+        await get_async_qdrant().close()
+        get_async_qdrant.cache_clear()
+
 _collection_ensured = False
 
+def _create_collection_kwargs() -> dict:
+    return dict(
+        collection_name=settings.QDRANT_COLLECTION,
+        vectors_config={"dense": VectorParams(
+            size=settings.VECTOR_SIZE,
+            distance=Distance.COSINE,
+        )},
+        sparse_vectors_config={"sparse": SparseVectorParams()},
+        quantization_config=BinaryQuantization(
+            binary=BinaryQuantizationConfig(always_ram=True)
+        ),
+        optimizers_config=OptimizersConfigDiff(
+            default_segment_number=2,
+            memmap_threshold=10000,
+        ),
+    )
+
 def ensure_collection(client: QdrantClient):
     """Check if collection exists and create it if not."""
     global _collection_ensured
@@ -34,25 +83,30 @@ def ensure_collection(client: QdrantClient):
         collections = [c.name for c in client.get_collections().collections]
         if settings.QDRANT_COLLECTION not in collections:
             logger.info(f"Collection '{settings.QDRANT_COLLECTION}' not found. Creating...")
-            client.create_collection(
-                collection_name=settings.QDRANT_COLLECTION,
-                vectors_config={"dense": VectorParams(
-                    size=settings.VECTOR_SIZE,
-                    distance=Distance.COSINE,
-                )},
-                sparse_vectors_config={"sparse": SparseVectorParams()},
-                quantization_config=BinaryQuantization(
-                    binary=BinaryQuantizationConfig(always_ram=True)
-                ),
-                optimizers_config=OptimizersConfigDiff(
-                    default_segment_number=2,
-                    memmap_threshold=10000,
-                ),
-            )
+            client.create_collection(**_create_collection_kwargs())
+            logger.info(f"Collection '{settings.QDRANT_COLLECTION}' created successfully.")
+        else:
+            logger.debug(f"Collection '{settings.QDRANT_COLLECTION}' already exists.")
+        _collection_ensured = True
+    except Exception as e:
+        logger.error(f"Error ensuring Qdrant collection: {str(e)}")
+        raise
+
+async def aensure_collection(client: AsyncQdrantClient):
+    """Async variant of `ensure_collection`."""
+    global _collection_ensured
+    if _collection_ensured:
+        return
+    try:
+        response = await client.get_collections()
+        collections = [c.name for c in response.collections]
+        if settings.QDRANT_COLLECTION not in collections:
+            logger.info(f"Collection '{settings.QDRANT_COLLECTION}' not found. Creating...")
+            await client.create_collection(**_create_collection_kwargs())
             logger.info(f"Collection '{settings.QDRANT_COLLECTION}' created successfully.")
         else:
             logger.debug(f"Collection '{settings.QDRANT_COLLECTION}' already exists.")
         _collection_ensured = True
     except Exception as e:
         logger.error(f"Error ensuring Qdrant collection: {str(e)}")
-        raise
\ No newline at end of file
+        raise
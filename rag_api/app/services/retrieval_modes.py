@@ -0,0 +1,51 @@
+import re
+from typing import Optional
+from app.core.config import settings
+
+HYBRID = "hybrid"
+DENSE = "dense"
+SPARSE = "sparse"
+AUTO = "auto"
+
+RETRIEVAL_MODES = (HYBRID, DENSE, SPARSE)
+
+QUESTION_WORDS = {
+    "what", "why", "how", "when", "where", "who", "whom", "which", "whose",
+    "can", "could", "should", "would", "is", "are", "do", "does", "did", "may", "explain", "describe",
+}
+
+_TERM_RE = re.compile(r"[\w'-]+")
+
+
+def needs_dense(mode: str) -> bool:
+    return mode in (HYBRID, DENSE, AUTO)
+
+
+def needs_sparse(mode: str) -> bool:
+    return mode in (HYBRID, SPARSE, AUTO)
+
+
+def route_query(query: str) -> str:
+    """
+    Pick a retrieval mode for `auto`.
+    Short keyword-style lookups ("FMLA policy", "form W-4") are served well by
+    SPLADE alone; natural-language questions go to hybrid search.
+    """
+    terms = _TERM_RE.findall(query.lower())
+    if not terms:
+        return HYBRID
+    if "?" in query or terms[0] in QUESTION_WORDS:
+        return HYBRID
+    if len(terms) <= settings.RETRIEVAL_AUTO_SPARSE_MAX_TERMS:
+        return SPARSE
+    return HYBRID
+
+
+def resolve_retrieval_mode(query: str, requested: Optional[str] = None) -> str:
+    """Resolve the per-request mode (falling back to RETRIEVAL_MODE) to one of `RETRIEVAL_MODES`."""
+    mode = (requested or settings.RETRIEVAL_MODE).lower()
+    if mode == AUTO:
+        return route_query(query)
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    return mode
@@ -1,25 +1,53 @@
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
 import uuid
-from qdrant_client.models import Filter, FieldCondition, MatchValue, SearchParams, QuantizationSearchParams, SparseVector, Prefetch, FusionQuery, Fusion
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from qdrant_client.models import QueryRequest, SearchParams, QuantizationSearchParams, SparseVector, Prefetch, FusionQuery, Fusion
 from app.core.config import settings
-from app.services.qdrant_client import get_qdrant, ensure_collection
-from app.services.embeddings import embed_texts, embed_query
+from app.services.qdrant_client import get_qdrant, ensure_collection, get_async_qdrant, aensure_collection
+from app.services.embeddings import embed_texts, embed_query, aembed_query, embed_queries, aembed_queries
+from app.services.retrieval_modes import DENSE, SPARSE, resolve_retrieval_mode
+from app.services.local_index import local_index
+from app.utils.resilience import Deadline, deadline_timeout, qdrant_breaker
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _point_id(payload: Dict[str, Any]) -> str:
+    # Qdrant requires point IDs to be unsigned ints or UUIDs.
+    # Convert deterministic string `hash` into a UUIDv5 for stable, valid IDs.
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, payload["hash"]))
+
+
+def _existing_point_ids(client, ids: List[str]) -> set:
+    """Look up which of `ids` are already stored, one batched `retrieve` per UPSERT_BATCH_SIZE IDs."""
+    existing = set()
+    size = settings.UPSERT_BATCH_SIZE
+    for start in range(0, len(ids), size):
+        found = client.retrieve(
+            collection_name=settings.QDRANT_COLLECTION,
+            ids=ids[start:start + size],
+            with_payload=False,
+            with_vectors=False,
+        )
+        existing.update(str(pt.id) for pt in found)
+    return existing
+
+
 def upsert_payloads(payloads: List[Dict[str, Any]], vectors):
     try:
         client = get_qdrant()
         ensure_collection(client)
 
-        # Deduplicate by 'hash'
+        # Deduplicate by 'hash' via its deterministic point ID (also within this call)
+        ids = [_point_id(p) for p in payloads]
+        existing = _existing_point_ids(client, ids)
         to_insert_indices = []
-        for i, p in enumerate(payloads):
-            flt = Filter(must=[FieldCondition(key="hash", match=MatchValue(value=p["hash"]))])
-            scroll = client.scroll(collection_name=settings.QDRANT_COLLECTION, scroll_filter=flt, limit=1)
-            if len(scroll[0]) == 0:
+        for i, point_id in enumerate(ids):
+            if point_id not in existing:
+                existing.add(point_id)
                 to_insert_indices.append(i)
 
         if not to_insert_indices:
@@ -27,29 +55,34 @@ def upsert_payloads(payloads: List[Dict[str, Any]], vectors):
             return 0
 
         dense_vectors, sparse_vectors_list = vectors
-        # Prepare
-        points = []
-        for i in to_insert_indices:
-            p = payloads[i]
-            # Qdrant requires point IDs to be unsigned ints or UUIDs.
-            # Convert deterministic string `hash` into a UUIDv5 for stable, valid IDs.
-            point_id = str(uuid.uuid5(uuid.NAMESPACE_URL, p["hash"]))
-            points.append(
-                {
-                    "id": point_id,
-                    "vector": {
-                        "dense": dense_vectors[i].tolist(),
-                        "sparse": SparseVector(
-                            indices=sparse_vectors_list[i].indices.tolist(),
-                            values=sparse_vectors_list[i].values.tolist()
-                        )
-                    },
-                    "payload": p
-                }
-            )
-        
-        logger.info(f"Upserting {len(points)} points to '{settings.QDRANT_COLLECTION}'...")
-        client.upsert(collection_name=settings.QDRANT_COLLECTION, points=points)
+        dense_vectors = np.asarray(dense_vectors, dtype=np.float32)
+
+        def _upsert_batch(batch: List[int]):
+            # One C-level conversion per batch instead of a .tolist() per point
+            dense_rows = dense_vectors[batch].tolist()
+            points = []
+            for row, i in zip(dense_rows, batch):
+                points.append(
+                    {
+                        "id": ids[i],
+                        "vector": {
+                            "dense": row,
+                            "sparse": SparseVector(
+                                indices=sparse_vectors_list[i].indices.tolist(),
+                                values=sparse_vectors_list[i].values.tolist()
+                            )
+                        },
+                        "payload": payloads[i]
+                    }
+                )
+            client.upsert(collection_name=settings.QDRANT_COLLECTION, points=points, wait=settings.UPSERT_WAIT)
+
+        size = settings.UPSERT_BATCH_SIZE
+        batches = [to_insert_indices[j:j + size] for j in range(0, len(to_insert_indices), size)]
+        logger.info(f"Upserting {len(to_insert_indices)} points to '{settings.QDRANT_COLLECTION}' in {len(batches)} batches...")
+        with ThreadPoolExecutor(max_workers=settings.UPSERT_CONCURRENCY) as pool:
+            # list() re-raises the first failed batch
+            list(pool.map(_upsert_batch, batches))
         logger.info("Upsert completed successfully.")
         return len(to_insert_indices)
     except Exception as e:
@@ -89,67 +122,187 @@ def _extract_payload_and_score(item: Any) -> Tuple[Dict[str, Any], float]:
     return payload, score
 
 
-def search_similar(query: str, top_k: int) -> List[Dict[str, Any]]:
-    try:
-        client = get_qdrant()
-        ensure_collection(client)
-        
-        logger.debug(f"Searching for similar points: '{query[:50]}...'")
-        q_dense, q_sparse = embed_query(query)
-        
+def _dense_search_params() -> SearchParams:
+    return SearchParams(
+        hnsw_ef=128,
+        quantization=QuantizationSearchParams(
+            ignore=False,
+            rescore=True,
+            oversampling=3.0
+        )
+    )
+
+
+def _sparse_query(q_sparse: Any) -> SparseVector:
+    return SparseVector(
+        indices=q_sparse.indices.tolist(),
+        values=q_sparse.values.tolist()
+    )
+
+
+def _query_kwargs(mode: str, q_dense: Any, q_sparse: Any, top_k: int) -> Dict[str, Any]:
+    """Build the `query_points` arguments for the given retrieval mode."""
+    kwargs = dict(
+        collection_name=settings.QDRANT_COLLECTION,
+        limit=top_k,
+        with_payload=True,
+        with_vectors=False
+    )
+    if mode == DENSE:
+        kwargs.update(query=q_dense.tolist(), using="dense", search_params=_dense_search_params())
+    elif mode == SPARSE:
+        kwargs.update(query=_sparse_query(q_sparse), using="sparse")
+    else:
         # Advanced Hybrid Search with Prefetch and Reciprocal Rank Fusion
-        results = client.query_points(
-            collection_name=settings.QDRANT_COLLECTION,
+        kwargs.update(
             prefetch=[
                 Prefetch(
                     query=q_dense.tolist(),
                     using="dense",
                     limit=top_k * 2,
-                    params=SearchParams(
-                        hnsw_ef=128,
-                        quantization=QuantizationSearchParams(
-                            ignore=False,
-                            rescore=True,
-                            oversampling=3.0
-                        )
-                    ),
+                    params=_dense_search_params(),
                 ),
                 Prefetch(
-                    query=SparseVector(
-                        indices=q_sparse.indices.tolist(),
-                        values=q_sparse.values.tolist()
-                    ),
+                    query=_sparse_query(q_sparse),
                     using="sparse",
                     limit=top_k * 2,
                 )
             ],
             query=FusionQuery(fusion=Fusion.RRF),
-            limit=top_k,
-            with_payload=True,
-            with_vectors=False
         )
+    return kwargs
 
-        # `query_points` may return a QueryResponse with `.result` or a plain list.
-        if hasattr(results, "result"):
-            iterable = results.result
-        elif hasattr(results, "points"):
-            iterable = results.points
-        else:
-            iterable = results
-
-        out = []
-        for r in iterable:
-            payload, score = _extract_payload_and_score(r)
+
+def _collect_results(results: Any) -> List[Dict[str, Any]]:
+    # `query_points` may return a QueryResponse with `.result` or a plain list.
+    if hasattr(results, "result"):
+        iterable = results.result
+    elif hasattr(results, "points"):
+        iterable = results.points
+    else:
+        iterable = results
+
+    out = []
+    for r in iterable:
+        payload, score = _extract_payload_and_score(r)
+        
+        if not payload:
+            logger.warning("Retrieved item with empty payload: %s", r)
+            continue
             
-            if not payload:
-                logger.warning("Retrieved item with empty payload: %s", r)
-                continue
-                
-            payload["score"] = score
-            out.append(payload)
-            logger.debug("Retrieved: %s (score=%.4f)", payload.get("source_id"), score)
-
-        return out
+        payload["score"] = score
+        out.append(payload)
+        logger.debug("Retrieved: %s (score=%.4f)", payload.get("source_id"), score)
+
+    return out
+
+
+def _local_index_available() -> bool:
+    return settings.LOCAL_INDEX_ENABLED and local_index.ready
+
+
+def search_similar(query: str, top_k: int, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+    mode = resolve_retrieval_mode(query, mode)
+    logger.debug(f"Searching for similar points (mode={mode}): '{query[:50]}...'")
+    q_dense, q_sparse = embed_query(query, mode)
+    try:
+        with qdrant_breaker:
+            client = get_qdrant()
+            ensure_collection(client)
+            results = client.query_points(**_query_kwargs(mode, q_dense, q_sparse, top_k))
+        return _collect_results(results)
     except Exception as e:
         logger.error(f"Error during similar search: {str(e)}")
-        raise
\ No newline at end of file
+        if not _local_index_available():
+            raise
+    logger.warning("Qdrant unavailable; serving search from the local index snapshot")
+    if q_dense is None:
+        q_dense, _ = embed_query(query, DENSE)
+    return local_index.search(q_dense, top_k)
+
+
+async def asearch_similar(
+    query: str, top_k: int, mode: Optional[str] = None, deadline: Optional[Deadline] = None
+) -> List[Dict[str, Any]]:
+    """Async variant of `search_similar` that keeps embedding and Qdrant I/O off the event loop."""
+    mode = resolve_retrieval_mode(query, mode)
+    # With a snapshot to fall back on there is no point waiting out the full QDRANT_TIMEOUT
+    timeout = settings.LOCAL_INDEX_QDRANT_TIMEOUT if _local_index_available() else None
+    logger.debug(f"Searching for similar points (mode={mode}): '{query[:50]}...'")
+    q_dense, q_sparse = await aembed_query(query, mode, deadline=deadline)
+    try:
+        with qdrant_breaker:
+            client = get_async_qdrant()
+            async with deadline_timeout(deadline, timeout):
+                await aensure_collection(client)
+            async with deadline_timeout(deadline, timeout):
+                results = await client.query_points(**_query_kwargs(mode, q_dense, q_sparse, top_k))
+        return _collect_results(results)
+    except Exception as e:
+        logger.error(f"Error during similar search: {str(e) or type(e).__name__}")
+        if not _local_index_available():
+            raise
+    # The snapshot only holds dense vectors, so every mode degrades to dense search
+    logger.warning("Qdrant unavailable; serving search from the local index snapshot")
+    if q_dense is None:
+        q_dense, _ = await aembed_query(query, DENSE, deadline=deadline)
+    return await asyncio.to_thread(local_index.search, q_dense, top_k)
+
+
+def _query_request(mode: str, q_dense: Any, q_sparse: Any, top_k: int) -> QueryRequest:
+    """Same search as `_query_kwargs`, expressed as one entry of a `query_batch_points` call."""
+    kwargs = _query_kwargs(mode, q_dense, q_sparse, top_k)
+    kwargs.pop("collection_name")
+    if "search_params" in kwargs:
+        kwargs["params"] = kwargs.pop("search_params")
+    kwargs["with_vector"] = kwargs.pop("with_vectors")
+    return QueryRequest(**kwargs)
+
+
+def _group_by_mode(queries: List[str], mode: Optional[str]) -> Dict[str, List[int]]:
+    groups: Dict[str, List[int]] = {}
+    for i, q in enumerate(queries):
+        groups.setdefault(resolve_retrieval_mode(q, mode), []).append(i)
+    return groups
+
+
+def search_similar_batch(queries: List[str], top_k: int, mode: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+    """Retrieve for many queries: one batched embedding pass per mode and one `query_batch_points` request."""
+    try:
+        client = get_qdrant()
+        ensure_collection(client)
+
+        requests: List[Any] = [None] * len(queries)
+        for m, idxs in _group_by_mode(queries, mode).items():
+            rows = embed_queries([queries[i] for i in idxs], m)
+            for i, (q_dense, q_sparse) in zip(idxs, rows):
+                requests[i] = _query_request(m, q_dense, q_sparse, top_k)
+
+        logger.debug(f"Batch searching {len(queries)} queries")
+        with qdrant_breaker:
+            responses = client.query_batch_points(collection_name=settings.QDRANT_COLLECTION, requests=requests)
+        return [_collect_results(r) for r in responses]
+    except Exception as e:
+        logger.error(f"Error during batch similar search: {str(e)}")
+        raise
+
+
+async def asearch_similar_batch(queries: List[str], top_k: int, mode: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+    """Async variant of `search_similar_batch`."""
+    try:
+        client = get_async_qdrant()
+        await aensure_collection(client)
+
+        requests: List[Any] = [None] * len(queries)
+        for m, idxs in _group_by_mode(queries, mode).items():
+            rows = await aembed_queries([queries[i] for i in idxs], m)
+            for i, (q_dense, q_sparse) in zip(idxs, rows):
+                requests[i] = _query_request(m, q_dense, q_sparse, top_k)
+
+        logger.debug(f"Batch searching {len(queries)} queries")
+        with qdrant_breaker:
+            responses = await client.query_batch_points(collection_name=settings.QDRANT_COLLECTION, requests=requests)
+        return [_collect_results(r) for r in responses]
+    except Exception as e:
+        logger.error(f"Error during batch similar search: {str(e)}")
+        raise
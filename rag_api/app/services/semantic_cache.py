@@ -0,0 +1,34 @@
+import logging
+from typing import Any, Optional, Tuple
+import numpy as np
+from app.services.embeddings import aembed_query
+from app.services.retrieval_modes import needs_dense, resolve_retrieval_mode
+from app.utils.resilience import Deadline
+from app.utils.ttlcache import answer_cache
+
+logger = logging.getLogger(__name__)
+
+
+async def semantic_answer_lookup(
+    question: str, mode: Optional[str], context_str: str, deadline: Optional[Deadline] = None
+) -> Tuple[Optional[np.ndarray], Optional[Any]]:
+    """
+    Embed `question` and look for a cached answer to a near-identical question
+    under the same `context_str`.
+
+    The embedding is made with the request's retrieval mode, so the retrieval that
+    follows a miss is served from the query embedding cache instead of running the
+    model again. Returns `(query_vector, cached_answer)`; the vector is None when the
+    mode has no dense half or embedding failed, in which case nothing is cached either.
+    """
+    try:
+        resolved = resolve_retrieval_mode(question, mode)
+        if not needs_dense(resolved):
+            return None, None
+        q_dense, _ = await aembed_query(question, resolved, deadline=deadline)
+    except Exception as e:
+        logger.warning(f"Skipping semantic answer cache, query embedding failed: {e}")
+        return None, None
+    if q_dense is None:
+        return None, None
+    return q_dense, await answer_cache.get_semantically(q_dense, context_str)
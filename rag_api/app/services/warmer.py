@@ -0,0 +1,246 @@
+import os
+import time
+import random
+import fcntl
+import tempfile
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import orjson
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# warm_fn(question, **params) -> True if it generated a new answer, False if one was already cached
+WarmFn = Callable[..., Awaitable[bool]]
+
+
+class CacheWarmer:
+    """
+    Counts how often each chat question is asked and pre-generates answers for
+    the most popular ones, so they stay at cache-hit latency after a restart or
+    an index version change.
+
+    Counts are kept per raw user message together with the last request
+    parameters seen for it (model, temperature, ...), and persisted to
+    `path` so popularity survives restarts. When more than `max_tracked`
+    questions are known, the least asked half is dropped and the remaining
+    counts are halved so old favourites fade.
+
+    Every worker on a node records its own requests. `save` merges the counts
+    recorded since the last save into the shared file under a file lock, so no
+    worker's popularity overwrites another's.
+
+    With `shared_cache` (a cache backend all workers read) only one worker
+    warms: the one holding `<path>.leader`; the others take over if it exits.
+    Otherwise each worker warms its own in-process cache, after a random delay
+    of up to `jitter_seconds` so the workers don't all hit the LLM at once.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        top_n: int = 50,
+        max_tracked: int = 10_000,
+        concurrency: int = 2,
+        shared_cache: bool = False,
+        jitter_seconds: float = 0,
+    ):
+        self.path = path
+        self.top_n = top_n
+        self.max_tracked = max_tracked
+        self.concurrency = max(concurrency, 1)
+        self.shared_cache = shared_cache
+        self.jitter_seconds = jitter_seconds
+        self.counts: Dict[str, Dict[str, Any]] = {}
+        # Counts recorded by this process since its last save
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self.warm_runs = 0
+        self.warmed = 0
+        self.last_warm_ms = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._warm_requested = False
+        self._leader_file = None
+
+    def record(self, question: str, **params):
+        if not question.strip():
+            return
+        for table in (self.counts, self._pending):
+            entry = table.get(question)
+            if entry is None:
+                entry = table[question] = {"count": 0, "params": {}}
+            entry["count"] += 1
+            entry["params"] = params
+        if len(self.counts) > self.max_tracked:
+            self.counts = self._compact(self.counts)
+        if len(self._pending) > self.max_tracked:
+            self._pending = self._compact(self._pending)
+
+    def _compact(self, counts: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        keep = sorted(counts.items(), key=lambda kv: kv[1]["count"], reverse=True)[: self.max_tracked // 2]
+        return {q: {"count": max(e["count"] // 2, 1), "params": e["params"]} for q, e in keep}
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1]["count"], reverse=True)
+        return [(q, e["params"]) for q, e in ranked[: n or self.top_n]]
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        with open(self.path, "rb") as f:
+            return orjson.loads(f.read())
+
+    def load(self) -> int:
+        try:
+            self.counts = self._read()
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logger.warning(f"Could not load question stats from {self.path}: {e}")
+            return 0
+        return len(self.counts)
+
+    @staticmethod
+    def _merge(into: Dict[str, Dict[str, Any]], counts: Dict[str, Dict[str, Any]]):
+        for q, e in counts.items():
+            entry = into.setdefault(q, {"count": 0, "params": {}})
+            entry["count"] += e["count"]
+            entry["params"] = e["params"]
+
+    def save(self):
+        """Merge this process's new counts into the shared file and adopt the merged totals."""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        pending, self._pending = self._pending, {}
+        try:
+            with open(f"{self.path}.lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    merged = self._read()
+                except FileNotFoundError:
+                    merged = {}
+                except Exception as e:
+                    logger.warning(f"Question stats in {self.path} are unreadable, starting them over: {e}")
+                    merged = {}
+                self._merge(merged, pending)
+                if len(merged) > self.max_tracked:
+                    merged = self._compact(merged)
+                # A private temp file per save: concurrent writers never share one
+                fd, tmp = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(self.path)}.", suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(orjson.dumps(merged))
+                    os.replace(tmp, self.path)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+        except BaseException:
+            # Keep the unsaved counts for the next attempt
+            self._merge(self._pending, pending)
+            raise
+        # Every worker's totals, plus whatever was recorded here while saving
+        self._merge(merged, self._pending.copy())
+        self.counts = merged
+
+    def _try_lead(self) -> bool:
+        """Become (or stay) the one process on the node that warms; the lock is held until exit."""
+        if self._leader_file is not None:
+            return True
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        f = open(f"{self.path}.leader", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self._leader_file = f
+        return True
+
+    def _may_warm(self) -> bool:
+        # One warmer fills a shared cache for every worker; an in-process cache needs its own
+        return self._try_lead() if self.shared_cache else True
+
+    def _resign(self):
+        if self._leader_file is not None:
+            self._leader_file.close()
+            self._leader_file = None
+
+    def request_warm(self):
+        """Ask the running warmer to pre-generate the top questions again (e.g. after an index change)."""
+        self._warm_requested = True
+        if self._wake is not None:
+            self._wake.set()
+
+    async def warm(self, warm_fn: WarmFn) -> int:
+        """Pre-generate answers for the current top questions; returns how many were generated."""
+        t0 = time.time()
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def one(question: str, params: Dict[str, Any]) -> bool:
+            async with sem:
+                try:
+                    return await warm_fn(question, **params)
+                except Exception as e:
+                    logger.warning(f"Cache warmer failed for a question: {e}")
+                    return False
+
+        top = self.top()
+        generated = sum(await asyncio.gather(*(one(q, p) for q, p in top)))
+        self.warm_runs += 1
+        self.warmed += generated
+        self.last_warm_ms = int((time.time() - t0) * 1000)
+        logger.info(f"Cache warmer generated {generated} of the top {len(top)} answers in {self.last_warm_ms} ms")
+        return generated
+
+    async def run(self, warm_fn: WarmFn, save_seconds: float):
+        """Warm once at startup, then save stats periodically and re-warm whenever asked to."""
+        self._wake = asyncio.Event()
+        loaded = await asyncio.to_thread(self.load)
+        logger.info(f"Cache warmer loaded stats for {loaded} questions")
+        self._warm_requested = True
+        try:
+            while True:
+                # Followers keep the request and retry, so they take over if the leader exits
+                if self._warm_requested and self._may_warm():
+                    self._warm_requested = False
+                    if not self.shared_cache and self.jitter_seconds > 0:
+                        await asyncio.sleep(random.uniform(0, self.jitter_seconds))
+                    await self.warm(warm_fn)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=save_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                try:
+                    await asyncio.to_thread(self.save)
+                except Exception as e:
+                    logger.warning(f"Could not save question stats to {self.path}: {e}")
+        finally:
+            self._resign()
+            try:
+                self.save()
+            except Exception as e:
+                logger.warning(f"Could not save question stats to {self.path}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked_questions": len(self.counts),
+            "leader": self._leader_file is not None,
+            "top_n": self.top_n,
+            "warm_runs": self.warm_runs,
+            "warmed": self.warmed,
+            "last_warm_ms": self.last_warm_ms,
+        }
+
+
+cache_warmer = CacheWarmer(
+    settings.WARMER_STATE_PATH,
+    top_n=settings.WARMER_TOP_N,
+    max_tracked=settings.WARMER_MAX_TRACKED,
+    concurrency=settings.WARMER_CONCURRENCY,
+    shared_cache=settings.CACHE_BACKEND != "memory",
+    jitter_seconds=settings.WARMER_JITTER_SECONDS,
+)
+
+
+async def run_cache_warmer(warm_fn: WarmFn):
+    await cache_warmer.run(warm_fn, settings.WARMER_SAVE_SECONDS)
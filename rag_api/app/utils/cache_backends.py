@@ -0,0 +1,214 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+import numpy as np
+import orjson
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (key, context_hash or None, value, embedding or None, expires_at)
+CacheRow = Tuple[str, Optional[bytes], Any, Optional[np.ndarray], float]
+
+
+class CacheBackend(Protocol):
+    """Shared second tier behind a `SemanticTTLCache`'s in-process shards."""
+
+    def get(self, key: str) -> Optional[CacheRow]:
+        ...
+
+    def set(self, key: str, ctx: Optional[bytes], value: Any, emb: Optional[np.ndarray], expires_at: float):
+        ...
+
+    def changes_since(self, seq: int, limit: int) -> Tuple[List[CacheRow], int]:
+        ...
+
+    def delete_prefix(self, prefix: str):
+        ...
+
+    def clear(self):
+        ...
+
+
+def _default(obj: Any) -> Any:
+    # Pydantic models (e.g. RetrievedChunk in /query answers) are stored as plain dicts
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Cannot serialize {type(obj).__name__} for the cache backend")
+
+
+def _dumps(value: Any) -> bytes:
+    return orjson.dumps(value, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+class SQLiteCacheBackend:
+    """
+    One table of a SQLite database in WAL mode, shared by every worker on the
+    node and kept across restarts.
+
+    Values are orjson-encoded, embeddings stored as raw float32. Every write gets
+    a new `seq`, so workers pick up each other's entries by polling
+    `changes_since`. Reads refresh `last_access`, and every `prune_every` writes
+    the table is trimmed to unexpired rows within `max_entries` / `max_bytes`,
+    least recently accessed first.
+
+    A read doesn't write: hits are remembered in memory and their `last_access`
+    updates go out together in one transaction, with the next write, after
+    `touch_batch` hits or after `touch_interval` seconds, whichever comes first.
+    This keeps cache hits from queueing on SQLite's single writer lock. The
+    methods block, so async callers run them in a thread.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        table: str,
+        max_entries: int = 100_000,
+        max_bytes: Optional[int] = None,
+        prune_every: int = 256,
+        touch_batch: int = 64,
+        touch_interval: float = 30.0,
+    ):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid cache table name: {table}")
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.prune_every = prune_every
+        self._writes = 0
+        self.touch_batch = touch_batch
+        self.touch_interval = touch_interval
+        self._touched: Dict[str, float] = {}
+        self._pending_hits = 0
+        self._last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Short busy timeout: a cache write that has to wait long is better dropped
+        self.conn = sqlite3.connect(path, timeout=0.2, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key TEXT NOT NULL UNIQUE,"
+            " ctx BLOB,"
+            " value BLOB NOT NULL,"
+            " emb BLOB,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+
+    @staticmethod
+    def _row(key, ctx, value, emb, expires_at) -> CacheRow:
+        vec = np.frombuffer(emb, dtype=np.float32) if emb is not None else None
+        return key, ctx, orjson.loads(value), vec, expires_at
+
+    def get(self, key: str) -> Optional[CacheRow]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT key, ctx, value, emb, expires_at FROM {self.table} WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                return None
+            self._touched[key] = now
+            self._pending_hits += 1
+            if self._pending_hits >= self.touch_batch or time.monotonic() - self._last_flush >= self.touch_interval:
+                self._flush_touches()
+        return self._row(*row)
+
+    def _flush_touches(self):
+        """Write the pending `last_access` updates in one transaction (caller holds the lock)."""
+        self._last_flush = time.monotonic()
+        self._pending_hits = 0
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        try:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                f"UPDATE {self.table} SET last_access = ? WHERE key = ?",
+                [(at, key) for key, at in touched.items()],
+            )
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            # Recency is only a pruning hint; losing a batch under contention is fine
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            logger.debug(f"Dropped {len(touched)} cache access-time updates: {e}")
+
+    def set(self, key: str, ctx: Optional[bytes], value: Any, emb: Optional[np.ndarray], expires_at: float):
+        blob = _dumps(value)
+        emb_blob = np.asarray(emb, dtype=np.float32).tobytes() if emb is not None else None
+        size = len(key) + len(blob) + (len(emb_blob) if emb_blob is not None else 0)
+        with self.lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, ctx, value, emb, size, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, ctx, blob, emb_blob, size, expires_at, time.time()),
+            )
+            self._touched.pop(key, None)
+            # Already paying for a write, so send the pending access times along
+            self._flush_touches()
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune()
+
+    def _prune(self):
+        self.conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+        count, total = self.conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        if count <= self.max_entries and (self.max_bytes is None or total <= self.max_bytes):
+            return
+        drop, freed = [], 0
+        for seq, size in self.conn.execute(f"SELECT seq, size FROM {self.table} ORDER BY last_access"):
+            if count - len(drop) <= self.max_entries and (self.max_bytes is None or total - freed <= self.max_bytes):
+                break
+            drop.append((seq,))
+            freed += size
+        self.conn.executemany(f"DELETE FROM {self.table} WHERE seq = ?", drop)
+
+    def changes_since(self, seq: int, limit: int) -> Tuple[List[CacheRow], int]:
+        """Unexpired rows written after `seq` (newest `limit` of them) and the new high-water mark."""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT seq, key, ctx, value, emb, expires_at FROM {self.table}"
+                " WHERE seq > ? AND expires_at > ? ORDER BY seq DESC LIMIT ?",
+                (seq, time.time(), limit),
+            ).fetchall()
+            if not rows:
+                return [], seq
+        # Oldest first, so replaying them into an LRU leaves the newest most recent
+        return [self._row(*r[1:]) for r in reversed(rows)], rows[0][0]
+
+    def delete_prefix(self, prefix: str):
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        with self.lock:
+            self.conn.execute(f"DELETE FROM {self.table} WHERE key LIKE ? ESCAPE '\\'", (escaped + "%",))
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute(f"DELETE FROM {self.table}")
+
+
+def make_cache_backend(table: str, max_entries: int, max_bytes: Optional[int]) -> Optional[CacheBackend]:
+    """Backend selected by CACHE_BACKEND; None keeps the cache purely in-process."""
+    if settings.CACHE_BACKEND == "memory":
+        return None
+    if settings.CACHE_BACKEND == "sqlite":
+        # The shared tier holds more than one worker's in-process share
+        return SQLiteCacheBackend(
+            settings.CACHE_SQLITE_PATH,
+            table,
+            max_entries=max_entries * settings.CACHE_BACKEND_SIZE_FACTOR,
+            max_bytes=max_bytes * settings.CACHE_BACKEND_SIZE_FACTOR if max_bytes is not None else None,
+        )
+    raise ValueError(f"Unknown CACHE_BACKEND: {settings.CACHE_BACKEND}")
@@ -10,10 +10,11 @@ def make_cache_key(
     temperature: float,
     max_tokens: int,
     index_version: Optional[str] = None,  # bump this when your corpus changes
-) -> dict:
+) -> str:
     """
-    Returns a dictionary payload rather than just a hash, 
-    so the semantic cache can extract the exact user prompt to embed.
+    Hash the full request (including the retrieved context inside `messages`)
+    into a fixed-size hex digest, computed once per request, so caches never
+    hold or re-serialize the prompt itself.
     """
     payload = {
         "model": model,
@@ -22,7 +23,8 @@ def make_cache_key(
         "max_tokens": max_tokens,
         "index_version": index_version or "v1",
     }
-    return payload
+    s = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(s.encode("utf-8"), digest_size=16).hexdigest()
 
 
 def canonicalize_text(text: str) -> str:
@@ -64,16 +66,79 @@ def extract_final_user_message(raw_input: str) -> str:
     return canonicalize_text(raw_input)
 
 
+def extract_prior_turns(raw_input: str) -> str:
+    """
+    Everything in a <chat_history> wrapped input except the final user message:
+    the instructions and earlier turns the LLM also sees. Empty for a plain question.
+    """
+    chat_block = re.search(
+        r"<chat_history>(.*?)</chat_history>",
+        raw_input,
+        flags=re.DOTALL | re.IGNORECASE,
+    )
+    if not chat_block:
+        return ""
+    last = None
+    for last in re.finditer(
+        r"USER:\s*(.*?)(?=\nASSISTANT:|\Z)",
+        chat_block.group(1),
+        flags=re.DOTALL | re.IGNORECASE,
+    ):
+        pass
+    if last is None:
+        return canonicalize_text(raw_input)
+    start = chat_block.start(1) + last.start(1)
+    end = chat_block.start(1) + last.end(1)
+    return canonicalize_text(raw_input[:start] + "\x00" + raw_input[end:])
+
+
 def make_retrieval_cache_key(
     question: str,
     top_k: int,
     index_version: Optional[str] = None,
+    mode: Optional[str] = None,
 ) -> str:
     """Create a stable cache key for retrieval results."""
     payload = {
         "q": extract_final_user_message(question),
         "k": top_k,
         "index_version": index_version or "v1",
+        "mode": mode or "hybrid",
     }
     s = json.dumps(payload, sort_keys=True, ensure_ascii=False)
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+
+def make_semantic_context(
+    endpoint: str,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    top_k: int,
+    index_version: Optional[str] = None,
+    history: Optional[str] = None,
+) -> str:
+    """
+    Scope for semantic answer-cache matches. A cached answer is only reused for a
+    paraphrased question when it was generated by the same endpoint (response
+    shape), model, sampling settings and corpus version, and after the same
+    earlier turns (`history`, see `extract_prior_turns`), since only the final
+    user message is embedded.
+    """
+    payload = {
+        "endpoint": endpoint,
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "k": top_k,
+        "index_version": index_version or "v1",
+    }
+    if history:
+        payload["history"] = hashlib.blake2b(history.encode("utf-8"), digest_size=16).hexdigest()
+    return json.dumps(payload, sort_keys=True)
+
+
+def make_semantic_key(context_str: str, question: str) -> str:
+    """Exact key under which a semantically cached answer is stored."""
+    s = context_str + "\x00" + canonicalize_text(question)
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
@@ -0,0 +1,124 @@
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+import orjson
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_id(payload: Dict[str, Any]) -> str:
+    """
+    Store key for a retrieved payload: its ingest `hash` (the point ID is derived
+    from it), or a digest of the payload for points ingested without one.
+    """
+    if payload.get("hash"):
+        return str(payload["hash"])
+    blob = orjson.dumps({k: v for k, v in payload.items() if k != "score"}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+
+class ChunkStore:
+    """
+    Reference-counted store of retrieved chunk payloads, shared by every cached
+    retrieval result.
+
+    A cached result is just `{"ids": [...], "scores": [...]}`; each payload is
+    held once, orjson-encoded, however many results reference it. The cache
+    calls `acquire` when it stores a result and `release` when it drops one, and
+    a payload is freed when its last reference goes.
+
+    A result written to a shared cache backend carries its payloads (`expand`),
+    so another worker or a restarted process can rebuild it (`adopt`). A result
+    whose payloads are not held here (e.g. a backend row from an older version)
+    doesn't resolve and is counted in `unresolved`.
+    """
+
+    def __init__(self):
+        # id -> [encoded payload or None, refcount]
+        self._chunks: Dict[str, List[Any]] = {}
+        self.nbytes = 0
+        self.unresolved = 0
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def pack(self, chunks: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+        """Store the payloads of a search result and return its compact form."""
+        ids, scores = [], []
+        for c in chunks:
+            payload = {k: v for k, v in c.items() if k != "score"}
+            cid = chunk_id(payload)
+            entry = self._chunks.setdefault(cid, [None, 0])
+            if entry[0] is None:
+                entry[0] = orjson.dumps(payload)
+                self.nbytes += len(entry[0])
+            ids.append(cid)
+            scores.append(c.get("score", 0.0))
+        return {"ids": ids, "scores": scores}
+
+    def unpack(self, value: Any) -> Optional[List[Dict[str, Any]]]:
+        """Search result for a cached value, or None if a payload is not held here."""
+        if value is None or isinstance(value, list):
+            return value
+        out = []
+        for cid, score in zip(value["ids"], value["scores"]):
+            entry = self._chunks.get(cid)
+            if entry is None or entry[0] is None:
+                self.unresolved += 1
+                return None
+            payload = orjson.loads(entry[0])
+            payload["score"] = score
+            out.append(payload)
+        return out
+
+    def expand(self, value: Any) -> Any:
+        """Self-contained form of a packed result, with its payloads, for the cache backend."""
+        if not isinstance(value, dict):
+            return value
+        payloads = []
+        for cid in value["ids"]:
+            entry = self._chunks.get(cid)
+            if entry is None or entry[0] is None:
+                return value
+            payloads.append(orjson.loads(entry[0]))
+        return {**value, "payloads": payloads}
+
+    def adopt(self, value: Any) -> Any:
+        """Store the payloads of an expanded result (read from the backend) and return its packed form."""
+        if not isinstance(value, dict) or "payloads" not in value:
+            return value
+        for cid, payload in zip(value["ids"], value["payloads"]):
+            entry = self._chunks.setdefault(cid, [None, 0])
+            if entry[0] is None:
+                entry[0] = orjson.dumps(payload)
+                self.nbytes += len(entry[0])
+        return {"ids": value["ids"], "scores": value["scores"]}
+
+    def acquire(self, value: Any):
+        if isinstance(value, dict):
+            for cid in value["ids"]:
+                self._chunks.setdefault(cid, [None, 0])[1] += 1
+
+    def release(self, value: Any):
+        if not isinstance(value, dict):
+            return
+        for cid in value["ids"]:
+            entry = self._chunks.get(cid)
+            if entry is None:
+                continue
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._chunks[cid]
+                if entry[0] is not None:
+                    self.nbytes -= len(entry[0])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chunks": len(self._chunks),
+            "bytes": self.nbytes,
+            "references": sum(entry[1] for entry in self._chunks.values()),
+            "unresolved": self.unresolved,
+        }
+
+
+retrieval_chunk_store = ChunkStore()
@@ -0,0 +1,120 @@
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from fastembed import SparseEmbedding
+from app.core.config import settings
+from app.services.retrieval_modes import HYBRID, needs_dense, needs_sparse
+
+
+class EmbeddingCache:
+    """
+    LRU + TTL cache of query embeddings, keyed on canonicalized query text.
+
+    Dense vectors live in one preallocated matrix (float32 or float16) and are
+    addressed by slot; sparse vectors are kept as compact int32 indices plus
+    values in the same dtype. An entry may hold only the dense or only the
+    sparse half when it was produced by a single-model retrieval mode.
+    Thread-safe, since embedding runs off the event loop.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl_seconds: int = 86400, dtype: str = "float32"):
+        self.maxsize = max(maxsize, 1)
+        self.ttl = ttl_seconds
+        self.dtype = np.dtype(dtype)
+        # store: { text: (timestamp, slot or -1, sparse_indices or None, sparse_values or None) }
+        self.store: "OrderedDict[str, Tuple[float, int, Any, Any]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None  # allocated on first insert, once the dimension is known
+        self._free_slots = list(range(self.maxsize - 1, -1, -1))
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str, mode: str = HYBRID) -> Optional[Tuple[Optional[np.ndarray], Optional[SparseEmbedding]]]:
+        with self.lock:
+            entry = self.store.get(text)
+            if entry is None:
+                self.misses += 1
+                return None
+            ts, slot, indices, values = entry
+            if time.time() - ts > self.ttl:
+                self._evict(text)
+                self.misses += 1
+                return None
+            if (needs_dense(mode) and slot < 0) or (needs_sparse(mode) and indices is None):
+                self.misses += 1
+                return None
+            self.store.move_to_end(text)
+            self.hits += 1
+            # Copy out: the slot can be reused as soon as the lock is released
+            dense = self._matrix[slot].astype(np.float32) if needs_dense(mode) else None
+        sparse = None
+        if needs_sparse(mode):
+            sparse = SparseEmbedding(values=values.astype(np.float32), indices=indices.astype(np.int64))
+        return dense, sparse
+
+    def set(self, text: str, dense: Optional[np.ndarray], sparse: Any):
+        with self.lock:
+            if dense is not None:
+                dense = np.asarray(dense)
+                if self._matrix is None:
+                    self._matrix = np.zeros((self.maxsize, dense.shape[-1]), dtype=self.dtype)
+                elif dense.shape[-1] != self._matrix.shape[1]:
+                    return  # embedding model changed under us; don't mix dimensions
+
+            indices = values = None
+            if sparse is not None:
+                indices = np.asarray(sparse.indices, dtype=np.int32)
+                values = np.asarray(sparse.values, dtype=self.dtype)
+
+            slot = -1
+            if text in self.store:
+                # Keep whichever half the previous entry had and this one doesn't
+                _, slot, old_indices, old_values = self.store.pop(text)
+                if indices is None:
+                    indices, values = old_indices, old_values
+            if dense is not None and slot < 0:
+                while not self._free_slots:
+                    self._evict(next(iter(self.store)))
+                slot = self._free_slots.pop()
+            if dense is not None:
+                self._matrix[slot] = dense
+            self.store[text] = (time.time(), slot, indices, values)
+            # Sparse-only entries don't take a slot, so bound the entry count too
+            while len(self.store) > self.maxsize:
+                self._evict(next(iter(self.store)))
+
+    def _evict(self, text: str):
+        _, slot, _, _ = self.store.pop(text)
+        if slot >= 0:
+            self._free_slots.append(slot)
+
+    def clear(self):
+        with self.lock:
+            self.store.clear()
+            self._free_slots = list(range(self.maxsize - 1, -1, -1))
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            sparse_bytes = sum(i.nbytes + v.nbytes for _, _, i, v in self.store.values() if i is not None)
+            return {
+                "size": len(self.store),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "dtype": self.dtype.name,
+                "dense_bytes": self._matrix.nbytes if self._matrix is not None else 0,
+                "sparse_bytes": sparse_bytes,
+            }
+
+
+query_embedding_cache = EmbeddingCache(
+    maxsize=settings.EMBED_CACHE_SIZE,
+    ttl_seconds=settings.EMBED_CACHE_TTL_SECONDS,
+    dtype=settings.EMBED_CACHE_DTYPE,
+)
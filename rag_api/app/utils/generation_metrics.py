@@ -0,0 +1,134 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+
+class GenerationTimer:
+    """
+    Token counts and timings of one LLM generation.
+
+    Call `token()` for every streamed content event and `finish(ev)` with the
+    provider's final event (or the `chat_once` response), which carries
+    `prompt_eval_count` / `eval_count` for both Ollama and Azure OpenAI, plus
+    `prompt_cached_count` when Azure served part of the prompt from its prompt
+    cache. Ollama's `prompt_eval_duration` becomes `prompt_eval_ms`: Ollama only
+    evaluates the part of the prompt not already in its KV cache, so a reused
+    prefix shows up as fewer prompt tokens and a shorter prompt eval. When the provider reports no completion count (e.g. the stream broke
+    off), the number of content events is used instead, close to one per token.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.events = 0
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.cached_prompt_tokens: Optional[int] = None
+        self.eval_duration_ns: Optional[int] = None
+        self.prompt_eval_duration_ns: Optional[int] = None
+
+    def token(self):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_token_at = now
+        self.events += 1
+
+    def finish(self, ev: Optional[Dict[str, Any]] = None):
+        self.finished_at = time.perf_counter()
+        if not ev:
+            return
+        if ev.get("prompt_eval_count") is not None:
+            self.prompt_tokens = int(ev["prompt_eval_count"])
+        if ev.get("eval_count") is not None:
+            self.completion_tokens = int(ev["eval_count"])
+        if ev.get("prompt_cached_count") is not None:
+            self.cached_prompt_tokens = int(ev["prompt_cached_count"])
+        if ev.get("eval_duration"):
+            self.eval_duration_ns = int(ev["eval_duration"])
+        if ev.get("prompt_eval_duration"):
+            self.prompt_eval_duration_ns = int(ev["prompt_eval_duration"])
+
+    def usage(self) -> Dict[str, Any]:
+        prompt = self.prompt_tokens or 0
+        completion = self.completion_tokens if self.completion_tokens is not None else self.events
+        usage: Dict[str, Any] = {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_tokens": prompt + completion,
+        }
+        if self.cached_prompt_tokens is not None:
+            usage["cached_prompt_tokens"] = self.cached_prompt_tokens
+        if self.prompt_eval_duration_ns:
+            usage["prompt_eval_ms"] = round(self.prompt_eval_duration_ns / 1e6, 2)
+        end = self.finished_at or self.last_token_at or time.perf_counter()
+        usage["generation_ms"] = int((end - self.started_at) * 1000)
+        if self.first_token_at is not None:
+            usage["ttft_ms"] = int((self.first_token_at - self.started_at) * 1000)
+            if self.events > 1:
+                gap = (self.last_token_at - self.first_token_at) / (self.events - 1)
+                usage["inter_token_ms"] = round(gap * 1000, 2)
+
+        # Decode speed: Ollama measures it server-side, otherwise time it from the first token
+        if self.eval_duration_ns:
+            seconds = self.eval_duration_ns / 1e9
+        elif self.first_token_at is not None:
+            seconds = end - self.first_token_at
+        else:
+            seconds = end - self.started_at
+        if completion and seconds > 0:
+            usage["tokens_per_second"] = round(completion / seconds, 1)
+        return usage
+
+
+class GenerationMetrics:
+    """Process-wide token totals and recent TTFT / inter-token / tokens-per-second / prompt eval distributions."""
+
+    def __init__(self, window: int = 1000):
+        self.generations = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+        self._recent: Dict[str, Deque[float]] = {
+            "ttft_ms": deque(maxlen=window),
+            "inter_token_ms": deque(maxlen=window),
+            "tokens_per_second": deque(maxlen=window),
+            "prompt_eval_ms": deque(maxlen=window),
+        }
+
+    def record(self, usage: Dict[str, Any]):
+        self.generations += 1
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.completion_tokens += usage.get("completion_tokens", 0)
+        self.cached_prompt_tokens += usage.get("cached_prompt_tokens", 0)
+        for name, values in self._recent.items():
+            if usage.get(name) is not None:
+                values.append(usage[name])
+
+    @staticmethod
+    def _summary(values: Deque[float]) -> Dict[str, Any]:
+        if not values:
+            return {"p50": None, "p95": None, "mean": None}
+        ordered = sorted(values)
+        return {
+            "p50": ordered[len(ordered) // 2],
+            "p95": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+            "mean": round(sum(ordered) / len(ordered), 2),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "generations": self.generations,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "prompt_cache_hit_ratio": (
+                round(self.cached_prompt_tokens / self.prompt_tokens, 3) if self.prompt_tokens else None
+            ),
+            **{name: self._summary(values) for name, values in self._recent.items()},
+        }
+
+
+generation_metrics = GenerationMetrics()
@@ -0,0 +1,179 @@
+import time
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The request's end-to-end deadline ran out before or during a dependency call."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+
+class Deadline:
+    """
+    Absolute end-to-end budget for one request, created in the route and passed
+    down to embedding, Qdrant and LLM calls so every hop waits only for what is left.
+    """
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Seconds the next call may take: what is left of the deadline, optionally capped."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+        return remaining if cap is None else min(remaining, cap)
+
+
+def budget(deadline: Optional[Deadline], cap: Optional[float] = None) -> Optional[float]:
+    """Timeout for the next call; `cap` alone (possibly None) when there is no deadline."""
+    return cap if deadline is None else deadline.timeout(cap)
+
+
+@asynccontextmanager
+async def deadline_timeout(deadline: Optional[Deadline], cap: Optional[float] = None) -> AsyncIterator[None]:
+    """
+    `asyncio.timeout(budget(deadline, cap))`, except that when what is left of
+    the request's deadline (not `cap`) set the limit, running out raises
+    `DeadlineExceeded`: the caller ran out of time, the dependency didn't fail,
+    so circuit breakers don't count it.
+    """
+    limit = budget(deadline, cap)
+    by_deadline = deadline is not None and (cap is None or deadline.remaining() <= cap)
+    try:
+        async with asyncio.timeout(limit):
+            yield
+    except TimeoutError as e:
+        if by_deadline and not isinstance(e, DeadlineExceeded):
+            raise DeadlineExceeded("Request deadline exceeded") from e
+        raise
+
+
+def request_deadline() -> Optional[Deadline]:
+    return Deadline(settings.REQUEST_DEADLINE_SECONDS) if settings.REQUEST_DEADLINE_SECONDS > 0 else None
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker.
+
+    Use as a context manager around a dependency call. After `failure_threshold`
+    consecutive failures the breaker opens and every call fails fast with
+    `CircuitOpenError`. After `reset_timeout` seconds it half-opens and lets up to
+    `half_open_max_calls` probes through; one success closes it, one failure
+    re-opens it. Cancellation and early generator exit count as neither.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = max(half_open_max_calls, 1)
+        self.lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def allow(self):
+        """Raise `CircuitOpenError` unless a call may go through now."""
+        with self.lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} circuit breaker is open")
+
+    def record_success(self):
+        with self.lock:
+            if self._state != self.CLOSED:
+                logger.info(f"{self.name} circuit breaker closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def record_failure(self):
+        with self.lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.trips += 1
+                    logger.warning(f"{self.name} circuit breaker opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probes = 0
+
+    def _release_probe(self):
+        with self.lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def __enter__(self):
+        self.allow()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.record_success()
+        elif issubclass(exc_type, (asyncio.CancelledError, GeneratorExit, DeadlineExceeded)):
+            self._release_probe()
+        else:
+            self.record_failure()
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+qdrant_breaker = CircuitBreaker(
+    "qdrant",
+    failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.BREAKER_RESET_SECONDS,
+)
+llm_breaker = CircuitBreaker(
+    "llm",
+    failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.BREAKER_RESET_SECONDS,
+)
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """
+    One in-flight generation and every text delta it has produced so far.
+
+    Subscribers replay the deltas already emitted and then follow the live ones,
+    so a request that joins late still receives the complete answer.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.deltas: List[str] = []
+        self.done = False
+        self.subscribers = 0
+        # Token counts and timings, filled in by the leader's producer when it finishes
+        self.usage: Dict[str, Any] = {}
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        # Wake everyone waiting on the current event and hand out a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, delta: str):
+        self.deltas.append(delta)
+        self._notify()
+
+    def finish(self):
+        self.done = True
+        self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        self.subscribers += 1
+        i = 0
+        while True:
+            while i < len(self.deltas):
+                yield self.deltas[i]
+                i += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent generations.
+
+    The first caller for a key starts `producer()` in its own task; it keeps
+    running if that caller disconnects, so later callers (and the answer cache
+    it fills) still get the result. Callers that arrive while it runs subscribe
+    to the same stream of deltas instead of starting another generation.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def join(self, key: str, producer: Callable[[], AsyncIterator[str]]) -> Tuple[Flight, bool]:
+        """Return the flight for `key` and whether this call started it."""
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            return flight, False
+
+        flight = self._flights[key] = Flight(key)
+        self.started += 1
+        flight.task = asyncio.create_task(self._run(flight, producer))
+        return flight, True
+
+    async def _run(self, flight: Flight, producer: Callable[[], AsyncIterator[str]]):
+        try:
+            async for delta in producer():
+                flight.publish(delta)
+        except Exception as e:
+            logger.error(f"Single-flight producer for key {flight.key} failed: {e}", exc_info=True)
+        finally:
+            # Drop the key first so a request arriving after this point starts fresh
+            # (or, more likely, hits the answer cache the producer just filled)
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            flight.finish()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+
+inflight_generations = SingleFlight()
@@ -0,0 +1,53 @@
+import time
+from typing import Any, Dict, Optional
+import orjson
+from fastapi.responses import JSONResponse
+
+SSE_DONE = b"data: [DONE]\n\n"
+
+
+def sse_frame(payload: bytes) -> bytes:
+    return b"data: " + payload + b"\n\n"
+
+
+class ChunkEncoder:
+    """
+    Encodes the OpenAI `chat.completion.chunk` objects of one completion.
+
+    Everything but the delta (id, object, created, model, choice index) is the
+    same for every chunk, so it is serialized once up front; each token then
+    costs one orjson call on the delta text and a few byte concatenations. As
+    with OpenAI, all chunks of a completion share its `created` timestamp.
+    """
+
+    def __init__(self, comp_id: str, model: str, created: Optional[int] = None):
+        self.created = created if created is not None else int(time.time())
+        prefix = (
+            b'{"id":' + orjson.dumps(comp_id)
+            + b',"object":"chat.completion.chunk","created":' + str(self.created).encode()
+            + b',"model":' + orjson.dumps(model)
+        )
+        self._head = prefix + b',"choices":[{"index":0,"delta":'
+        self._head_usage = prefix + b',"choices":[],"usage":'
+        self._role = self._head + b'{"role":"assistant"},"finish_reason":null}]}'
+        self._stop = self._head + b'{},"finish_reason":"stop"}]}'
+
+    def role(self) -> bytes:
+        return self._role
+
+    def content(self, delta: str) -> bytes:
+        return self._head + b'{"content":' + orjson.dumps(delta) + b'},"finish_reason":null}]}'
+
+    def stop(self) -> bytes:
+        return self._stop
+
+    def usage(self, usage: Dict[str, Any]) -> bytes:
+        """The trailing chunk sent when the client asked for `stream_options.include_usage`."""
+        return self._head_usage + orjson.dumps(usage) + b"}"
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson, for handlers that return plain dicts."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
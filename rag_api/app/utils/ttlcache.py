@@ -1,92 +1,568 @@
+import sys
 import time
 import asyncio, json
+import hashlib
+import logging
 import numpy as np
 from collections import OrderedDict
-from typing import Any, Optional, Tuple
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.utils.cache_backends import CacheBackend, make_cache_backend
+from app.utils.chunk_store import retrieval_chunk_store
+
+logger = logging.getLogger(__name__)
+
+
+def _context_hash(context_str: str) -> bytes:
+    return hashlib.blake2b(context_str.encode("utf-8"), digest_size=8).digest()
+
+
+def _deep_sizeof(obj: Any, _seen: Optional[Set[int]] = None) -> int:
+    """Approximate bytes held by `obj` and everything it references, counting shared objects once."""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None), np.ndarray)):
+        return size
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, _seen) + _deep_sizeof(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(x, _seen) for x in obj)
+    elif hasattr(obj, "__dict__"):
+        size += _deep_sizeof(vars(obj), _seen)
+    return size
+
+
+class _LSHIndex:
+    """
+    Random-hyperplane LSH over one partition: `tables` hash tables of `bits`-bit
+    codes, probed at the query's bucket and every bucket one bit away.
+    """
+
+    def __init__(self, planes: np.ndarray, tables: int, bits: int):
+        self.planes = planes  # (tables * bits, dim), shared by every partition of a cache
+        self.tables = tables
+        self.bits = bits
+        self._weights = (1 << np.arange(bits)).astype(np.int64)
+        self.buckets: List[Dict[int, Set[str]]] = [{} for _ in range(tables)]
+
+    def codes(self, v: np.ndarray) -> List[int]:
+        signs = (self.planes @ v > 0).reshape(self.tables, self.bits)
+        return [int(c) for c in signs @ self._weights]
+
+    def add(self, key: str, codes: List[int]):
+        for table, code in zip(self.buckets, codes):
+            table.setdefault(code, set()).add(key)
+
+    def remove(self, key: str, codes: List[int]):
+        for table, code in zip(self.buckets, codes):
+            bucket = table.get(code)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del table[code]
+
+    def candidates(self, codes: List[int]) -> Set[str]:
+        found: Set[str] = set()
+        for table, code in zip(self.buckets, codes):
+            for probe in [code] + [code ^ (1 << b) for b in range(self.bits)]:
+                bucket = table.get(probe)
+                if bucket:
+                    found |= bucket
+        return found
+
+
+class _Partition:
+    """
+    Embeddings of every entry sharing one context, packed into a contiguous
+    float32 block. Rows are reused by swap-remove, so a lookup is a single
+    matrix-vector product over the first `len(keys)` rows.
+    """
+
+    def __init__(self, dim: int, capacity: int = 64, lsh: Optional[_LSHIndex] = None):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.keys: List[str] = []
+        self.pos: Dict[str, int] = {}
+        self.lsh = lsh
+        self.codes: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str, emb: np.ndarray):
+        n = len(self.keys)
+        if n == self.vectors.shape[0]:
+            grown = np.zeros((n * 2, self.vectors.shape[1]), dtype=np.float32)
+            grown[:n] = self.vectors
+            self.vectors = grown
+        self.vectors[n] = emb
+        self.keys.append(key)
+        self.pos[key] = n
+        if self.lsh is not None:
+            self.codes[key] = self.lsh.codes(emb)
+            self.lsh.add(key, self.codes[key])
+
+    def remove(self, key: str):
+        i = self.pos.pop(key)
+        last = len(self.keys) - 1
+        if i != last:
+            moved = self.keys[last]
+            self.vectors[i] = self.vectors[last]
+            self.keys[i] = moved
+            self.pos[moved] = i
+        self.keys.pop()
+        if self.lsh is not None:
+            self.lsh.remove(key, self.codes.pop(key))
+
+    def best(self, q: np.ndarray, exact_below: int, codes: Optional[List[int]] = None) -> Tuple[Optional[str], float]:
+        n = len(self.keys)
+        if n == 0:
+            return None, -1.0
+        if self.lsh is not None and n >= exact_below:
+            candidates = self.lsh.candidates(codes if codes is not None else self.lsh.codes(q))
+            if not candidates:
+                return None, -1.0
+            rows = np.fromiter((self.pos[k] for k in candidates), dtype=np.int64, count=len(candidates))
+            scores = self.vectors[rows] @ q
+            i = int(np.argmax(scores))
+            return self.keys[rows[i]], float(scores[i])
+        scores = self.vectors[:n] @ q
+        i = int(np.argmax(scores))
+        return self.keys[i], float(scores[i])
+
+
+class _Shard:
+    """
+    One lock's worth of a `SemanticTTLCache`.
+
+    `store` is in LRU order; `expiry` holds the same keys in insertion order.
+    The TTL is fixed, so insertion order is expiry order and a purge only ever
+    pops expired keys off the front of `expiry`.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        max_bytes: Optional[int] = None,
+        on_evict: Optional[Callable[[Any], None]] = None,
+        shared_bytes: Optional[Callable[[], float]] = None,
+    ):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.shared_bytes = shared_bytes
+        self.nbytes = 0
+        # store: { hash_key: (context_hash or None, value, measured entry size) }
+        self.store: "OrderedDict[str, Tuple[Optional[bytes], Any, int]]" = OrderedDict()
+        # expiry: { hash_key: expires_at }
+        self.expiry: "OrderedDict[str, float]" = OrderedDict()
+        self.partitions: Dict[bytes, _Partition] = {}
+        self.lock = asyncio.Lock()
+
+    def purge_expired(self):
+        now = time.time()
+        while self.expiry:
+            key, expires_at = next(iter(self.expiry.items()))
+            if expires_at > now:
+                break
+            self.remove(key)
+
+    def remove(self, key: str):
+        ctx, value, size = self.store.pop(key)
+        del self.expiry[key]
+        self.nbytes -= size
+        if self.on_evict is not None:
+            self.on_evict(value)
+        if ctx is not None:
+            part = self.partitions[ctx]
+            part.remove(key)
+            if not part:
+                del self.partitions[ctx]
+
+    def over_budget(self) -> bool:
+        if len(self.store) > self.maxsize:
+            return True
+        if self.max_bytes is None:
+            return False
+        shared = self.shared_bytes() if self.shared_bytes is not None else 0
+        return self.nbytes + shared > self.max_bytes
+
+    def clear(self):
+        if self.on_evict is not None:
+            for _, value, _ in self.store.values():
+                self.on_evict(value)
+        self.store.clear()
+        self.expiry.clear()
+        self.partitions.clear()
+        self.nbytes = 0
 
 
 class SemanticTTLCache:
-    def __init__(self, maxsize: int = 512, ttl_seconds: int = 300, similarity_threshold: float = 0.95):
+    """
+    LRU + TTL cache with exact-key lookups and, for entries stored with an
+    embedding, nearest-neighbour lookups within the same context.
+
+    Embeddings are partitioned by a hash of `context_str`, so a semantic lookup
+    only scores entries whose system prompt / history / parameters match. Set
+    `ann_tables` > 0 to add an LSH index per partition; partitions smaller than
+    `ann_min_size` are still scanned exactly.
+
+    Keys are spread over `shards` independently locked shards, each holding
+    `maxsize / shards` entries, so LRU eviction is per shard. Expiry work is
+    proportional to the number of expired entries, not the cache size.
+
+    With `max_bytes` set, each shard also evicts LRU entries until the measured
+    size of its keys, values and embeddings fits its share of the budget. Dict
+    keys are hashed to a fixed-size digest; pass string digests (see
+    `make_cache_key`) to skip that step.
+
+    An optional `backend` (see `cache_backends`) is a shared second tier: every
+    set is written through to it, exact-key misses fall back to it, and
+    semantic lookups first pull in entries other workers have written since
+    the last poll (at most every `sync_interval` seconds). A new process warms
+    itself from the backend on its first lookup.
+
+    With `stale_seconds` > 0 an entry outlives its TTL by that long as a stale
+    value: `get` and semantic lookups ignore it, `get_allow_stale` returns it
+    flagged as stale so the caller can serve it while `schedule_refresh`
+    rebuilds it in the background.
+
+    `on_insert(value)` / `on_evict(value)` are called whenever a value enters or
+    leaves this process's shards (set, backend sync, replacement, eviction,
+    expiry, clear), e.g. to reference-count data the values point to. When
+    values point to data held outside the cache:
+
+    - `shared_bytes()` is the size of that data, counted against `max_bytes`
+      (each shard takes an equal share);
+    - `to_backend(value)` / `from_backend(value)` convert a value into a
+      self-contained form for the backend and back;
+    - `resolve(value)` turns a value into what lookups return; a value that
+      resolves to None counts as a miss.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 512,
+        ttl_seconds: int = 300,
+        similarity_threshold: float = 0.95,
+        ann_tables: int = 0,
+        ann_bits: int = 14,
+        ann_min_size: int = 2048,
+        shards: int = 8,
+        max_bytes: Optional[int] = None,
+        backend: Optional[CacheBackend] = None,
+        sync_interval: float = 1.0,
+        stale_seconds: float = 0,
+        on_insert: Optional[Callable[[Any], None]] = None,
+        on_evict: Optional[Callable[[Any], None]] = None,
+        shared_bytes: Optional[Callable[[], int]] = None,
+        to_backend: Optional[Callable[[Any], Any]] = None,
+        from_backend: Optional[Callable[[Any], Any]] = None,
+        resolve: Optional[Callable[[Any], Optional[Any]]] = None,
+    ):
         self.maxsize = maxsize
+        self.max_bytes = max_bytes
         self.ttl = ttl_seconds
+        self.stale_seconds = stale_seconds
         self.similarity_threshold = similarity_threshold
-        # store: { hash_key: (timestamp, vector_emb, messages_context, value) }
-        self.store: "OrderedDict[str, Tuple[float, Any, str, Any]]" = OrderedDict()
-        self.lock = asyncio.Lock()
+        self.ann_tables = ann_tables
+        self.ann_bits = ann_bits
+        self.ann_min_size = ann_min_size
+        n = max(1, min(shards, maxsize))
+        shard_bytes = -(-max_bytes // n) if max_bytes is not None else None
+        self.on_insert = on_insert
+        self.shared_bytes = shared_bytes
+        self.to_backend = to_backend
+        self.from_backend = from_backend
+        self.resolve = resolve
+        shard_share = (lambda: shared_bytes() / n) if shared_bytes is not None else None
+        self.shards = [_Shard(-(-maxsize // n), shard_bytes, on_evict, shard_share) for _ in range(n)]
+        self._dim: Optional[int] = None
+        self._planes: Optional[np.ndarray] = None
+        self.hits = 0
+        self.misses = 0
+        self.backend = backend
+        self.sync_interval = sync_interval
+        self._synced_seq = 0
+        self._last_sync = float("-inf")
+        self.stale_hits = 0
+        self.refreshes = 0
+        self._refreshing: Dict[str, asyncio.Task] = {}
 
-    def _purge_expired(self):
-        now = time.time()
-        keys_to_delete = [k for k, (ts, _, _, _) in self.store.items() if now - ts > self.ttl]
-        for k in keys_to_delete:
-            self.store.pop(k, None)
+    def __len__(self) -> int:
+        return sum(len(shard.store) for shard in self.shards)
+
+    def _shard(self, key: str) -> _Shard:
+        return self.shards[hash(key) % len(self.shards)]
+
+    def _new_partition(self) -> _Partition:
+        lsh = None
+        if self.ann_tables > 0:
+            if self._planes is None:
+                rng = np.random.default_rng(0)
+                self._planes = rng.standard_normal((self.ann_tables * self.ann_bits, self._dim)).astype(np.float32)
+            lsh = _LSHIndex(self._planes, self.ann_tables, self.ann_bits)
+        return _Partition(self._dim, capacity=min(64, max(self.maxsize, 1)), lsh=lsh)
+
+    @staticmethod
+    def _as_vector(emb: Any) -> np.ndarray:
+        v = np.asarray(emb, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    def _put(self, shard: _Shard, key: str, value: Any, v: Optional[np.ndarray], ctx: Optional[bytes], expires_at: float):
+        """Insert into `shard` (caller holds its lock) and evict down to its budget."""
+        # Take the new value's references before the old value (often sharing them) releases its own
+        if self.on_insert is not None:
+            self.on_insert(value)
+        if key in shard.store:
+            shard.remove(key)
+        # The embedding row lives in a partition block but is counted against the entry
+        size = _deep_sizeof(key) + _deep_sizeof(value) + (v.nbytes if v is not None else 0)
+        if v is not None and ctx is not None:
+            if self._dim is None:
+                self._dim = v.shape[0]
+            if v.shape[0] == self._dim:
+                part = shard.partitions.get(ctx)
+                if part is None:
+                    part = shard.partitions[ctx] = self._new_partition()
+                part.add(key, v)
+            else:
+                ctx = None
+        else:
+            ctx = None
+
+        shard.store[key] = (ctx, value, size)
+        shard.expiry[key] = expires_at
+        shard.nbytes += size
+
+        # An entry bigger than the whole shard budget evicts everything, itself last
+        while shard.store and shard.over_budget():
+            shard.remove(next(iter(shard.store)))
+
+    async def _sync(self):
+        """Pull entries other workers wrote to the backend since the last poll."""
+        now = time.monotonic()
+        if self.backend is None or now - self._last_sync < self.sync_interval:
+            return
+        self._last_sync = now
+        try:
+            rows, self._synced_seq = await asyncio.to_thread(self.backend.changes_since, self._synced_seq, self.maxsize)
+        except Exception as e:
+            logger.warning(f"Cache backend sync failed: {e}")
+            return
+        for key, ctx, value, emb, expires_at in rows:
+            shard = self._shard(key)
+            async with shard.lock:
+                if key not in shard.store:
+                    self._put(shard, key, self._from_backend(value), emb, ctx, expires_at)
 
     async def get_semantically(self, query_emb: Any, context_str: str) -> Optional[Any]:
-        # Fast brute-force cosine similarity over at most 512 items
-        async with self.lock:
-            self._purge_expired()
-            
-            best_match_key = None
-            best_score = -1
-            
-            for k, (ts, v_emb, v_context, val) in self.store.items():
-                if v_context != context_str:
-                    continue # only match if system/history parameters are identical
-                
-                # Cosine similarity (assuming normalized vectors)
-                score = float(np.dot(query_emb, v_emb))
-                if score > best_score:
-                    best_score = score
-                    best_match_key = k
-            
-            if best_match_key and best_score >= self.similarity_threshold:
-                # Cache Hit! Refresh LRU
-                ts, v_emb, v_context, val = self.store.pop(best_match_key)
-                self.store[best_match_key] = (ts, v_emb, v_context, val)
-                print(f"Semantic Cache Hit! Score: {best_score:.4f}")
-                return val
-                
+        q = self._as_vector(query_emb)
+        await self._sync()
+        if q.shape[0] != self._dim:
+            return None
+        ctx = _context_hash(context_str)
+        codes = None
+        best_score, best_shard, best_key = -1.0, None, None
+        for shard in self.shards:
+            async with shard.lock:
+                shard.purge_expired()
+                part = shard.partitions.get(ctx)
+                if part is None:
+                    continue
+                if part.lsh is not None and codes is None:
+                    codes = part.lsh.codes(q)  # planes are shared, so hash the query once
+                key, score = part.best(q, self.ann_min_size, codes)
+                if key is not None and score > best_score:
+                    best_score, best_shard, best_key = score, shard, key
+
+        if best_shard is None or best_score < self.similarity_threshold:
+            self.misses += 1
             return None
+        async with best_shard.lock:
+            entry = best_shard.store.get(best_key)
+            if entry is None or best_shard.expiry[best_key] - self.stale_seconds <= time.time():
+                self.misses += 1
+                return None  # evicted, expired or only stale
+            value = self._resolve(entry[1])
+            if value is None:
+                self.misses += 1
+                return None
+            # Cache Hit! Refresh LRU
+            best_shard.store.move_to_end(best_key)
+            self.hits += 1
+            logger.debug(f"Semantic cache hit (score {best_score:.4f})")
+            return value
 
     def _normalize_key(self, key: Any) -> str:
         if isinstance(key, str):
             return key
         if isinstance(key, dict):
-            return json.dumps(key, sort_keys=True)
+            s = json.dumps(key, sort_keys=True, ensure_ascii=False)
+            return hashlib.blake2b(s.encode("utf-8"), digest_size=16).hexdigest()
         return str(key)
 
     async def get(self, key: Any) -> Optional[Any]:
-        normalized_key = self._normalize_key(key)
-        async with self.lock:
-            self._purge_expired()
-            if normalized_key in self.store:
-                ts, v_emb, c_str, val = self.store.pop(normalized_key)
-                self.store[normalized_key] = (ts, v_emb, c_str, val)
-                return val
+        value, expires_at = await self._lookup(key)
+        if value is None or expires_at - self.stale_seconds <= time.time():
+            self.misses += 1
             return None
+        value = self._resolve(value)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    async def get_allow_stale(self, key: Any) -> Tuple[Optional[Any], bool]:
+        """`(value, is_stale)`; a stale value is past its TTL but inside `stale_seconds`."""
+        value, expires_at = await self._lookup(key)
+        value = self._resolve(value)
+        if value is None:
+            self.misses += 1
+            return None, False
+        if expires_at - self.stale_seconds > time.time():
+            self.hits += 1
+            return value, False
+        self.stale_hits += 1
+        return value, True
+
+    async def _lookup(self, key: Any) -> Tuple[Optional[Any], float]:
+        """Unexpired value for `key` (fresh or stale) and its hard expiry, from L1 or the backend."""
+        normalized_key = self._normalize_key(key)
+        shard = self._shard(normalized_key)
+        async with shard.lock:
+            shard.purge_expired()
+            entry = shard.store.get(normalized_key)
+            # Entries synced from the backend can sit out of expiry order, so check this one too
+            if entry is not None and shard.expiry[normalized_key] > time.time():
+                shard.store.move_to_end(normalized_key)
+                return entry[1], shard.expiry[normalized_key]
+
+        row = None
+        if self.backend is not None:
+            try:
+                # SQLite blocks (and may wait on another worker's write), so keep it off the loop
+                row = await asyncio.to_thread(self.backend.get, normalized_key)
+            except Exception as e:
+                logger.warning(f"Cache backend read failed: {e}")
+        if row is None:
+            return None, 0.0
+        _, ctx, value, emb, expires_at = row
+        value = self._from_backend(value)
+        async with shard.lock:
+            self._put(shard, normalized_key, value, emb, ctx, expires_at)
+        return value, expires_at
+
+    def _from_backend(self, value: Any) -> Any:
+        return self.from_backend(value) if self.from_backend is not None else value
+
+    def _resolve(self, value: Optional[Any]) -> Optional[Any]:
+        if value is None or self.resolve is None:
+            return value
+        return self.resolve(value)
+
+    def schedule_refresh(self, key: Any, refresh: Callable[[], Awaitable[Any]]) -> bool:
+        """
+        Run `refresh()` in the background to rebuild a stale entry, at most once
+        per key at a time. `refresh` writes whatever it rebuilds itself. Returns
+        whether a new refresh was started.
+        """
+        normalized_key = self._normalize_key(key)
+        if normalized_key in self._refreshing:
+            return False
+
+        async def run():
+            try:
+                await refresh()
+            except Exception as e:
+                logger.warning(f"Background refresh of stale cache entry failed: {e}")
+            finally:
+                self._refreshing.pop(normalized_key, None)
+
+        self.refreshes += 1
+        self._refreshing[normalized_key] = asyncio.create_task(run())
+        return True
 
     async def set(self, key: Any, value: Any, emb: Any = None, context_str: str = ""):
         normalized_key = self._normalize_key(key)
-        async with self.lock:
-            self._purge_expired()
-            if normalized_key in self.store:
-                self.store.pop(normalized_key, None)
-            
-            self.store[normalized_key] = (time.time(), emb, context_str, value)
-            
-            while len(self.store) > self.maxsize:
-                self.store.popitem(last=False)
+        v = self._as_vector(emb) if emb is not None else None
+        ctx = _context_hash(context_str) if v is not None else None
+        expires_at = time.time() + self.ttl + self.stale_seconds
+        shard = self._shard(normalized_key)
+        async with shard.lock:
+            shard.purge_expired()
+            self._put(shard, normalized_key, value, v, ctx, expires_at)
+
+        if self.backend is not None:
+            if self.to_backend is not None:
+                value = self.to_backend(value)
+            try:
+                await asyncio.to_thread(self.backend.set, normalized_key, ctx, value, v, expires_at)
+            except Exception as e:
+                logger.warning(f"Cache backend write failed: {e}")
 
     async def invalidate_prefix(self, prefix: str):
         # Optional helper if you want to drop a subset
-        async with self.lock:
-            for k in list(self.store.keys()):
-                if k.startswith(prefix):
-                    self.store.pop(k, None)
+        for shard in self.shards:
+            async with shard.lock:
+                for k in [k for k in shard.store if k.startswith(prefix)]:
+                    shard.remove(k)
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.delete_prefix, prefix)
+
+    def clear(self, backend: bool = True):
+        for shard in self.shards:
+            shard.clear()
+        if backend and self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "maxsize": self.maxsize,
+            "bytes": sum(shard.nbytes for shard in self.shards) + (self.shared_bytes() if self.shared_bytes else 0),
+            "max_bytes": self.max_bytes,
+            "embedding_block_bytes": sum(
+                part.vectors.nbytes for shard in self.shards for part in shard.partitions.values()
+            ),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stale_hits": self.stale_hits,
+            "refreshes": self.refreshes,
+            "backend": type(self.backend).__name__ if self.backend is not None else "memory",
+        }
 
 
 # Global caches
 answer_cache = SemanticTTLCache(
-    maxsize=512, ttl_seconds=600, similarity_threshold=0.96
+    maxsize=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    stale_seconds=settings.ANSWER_CACHE_STALE_SECONDS,
+    similarity_threshold=0.96,
+    ann_tables=settings.SEMANTIC_CACHE_ANN_TABLES,
+    max_bytes=settings.ANSWER_CACHE_MAX_BYTES,
+    backend=make_cache_backend("answer_cache", settings.ANSWER_CACHE_MAX_ENTRIES, settings.ANSWER_CACHE_MAX_BYTES),
 )  # final assistant message per request
 
-retrieval_cache = SemanticTTLCache(maxsize=512, ttl_seconds=600)  # optional: cached RAG chunks
+retrieval_cache = SemanticTTLCache(
+    maxsize=settings.RETRIEVAL_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RETRIEVAL_CACHE_TTL_SECONDS,
+    stale_seconds=settings.RETRIEVAL_CACHE_STALE_SECONDS,
+    max_bytes=settings.RETRIEVAL_CACHE_MAX_BYTES,
+    backend=make_cache_backend("retrieval_cache", settings.RETRIEVAL_CACHE_MAX_ENTRIES, settings.RETRIEVAL_CACHE_MAX_BYTES),
+    # Values are {"ids", "scores"}; each payload is held once in retrieval_chunk_store,
+    # counted against the byte budget, and written along with the result to the backend
+    on_insert=retrieval_chunk_store.acquire,
+    on_evict=retrieval_chunk_store.release,
+    shared_bytes=lambda: retrieval_chunk_store.nbytes,
+    to_backend=retrieval_chunk_store.expand,
+    from_backend=retrieval_chunk_store.adopt,
+    resolve=retrieval_chunk_store.unpack,
+)  # optional: cached RAG chunks
@@ -0,0 +1,66 @@
+"""
+Microbenchmark for SemanticTTLCache: per-operation cost of get / set /
+get_semantically as maxsize grows. With insertion-ordered expiry the get/set
+columns should stay flat; the semantic column grows with the matching
+context's partition size (or stays near-flat with --ann-tables).
+
+    python scripts/bench_ttlcache.py --sizes 512 4096 32768 --dim 1024
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rag_api"))
+from app.utils.ttlcache import SemanticTTLCache  # noqa: E402
+
+
+async def bench(maxsize: int, dim: int, ops: int, contexts: int, ann_tables: int, ann_bits: int, shards: int):
+    rng = np.random.default_rng(0)
+    cache = SemanticTTLCache(maxsize=maxsize, ttl_seconds=3600, ann_tables=ann_tables, ann_bits=ann_bits, ann_min_size=1024, shards=shards)
+    vecs = rng.standard_normal((maxsize, dim)).astype(np.float32)
+    for i in range(maxsize):
+        await cache.set(f"key-{i}", i, emb=vecs[i], context_str=f"ctx-{i % contexts}")
+
+    keys = [f"key-{i}" for i in rng.integers(0, maxsize, ops)]
+    t0 = time.perf_counter()
+    for k in keys:
+        await cache.get(k)
+    get_us = (time.perf_counter() - t0) / ops * 1e6
+
+    t0 = time.perf_counter()
+    for i, k in enumerate(keys):
+        await cache.set(k, i)
+    set_us = (time.perf_counter() - t0) / ops * 1e6
+
+    queries = vecs[rng.integers(0, maxsize, ops)]
+    t0 = time.perf_counter()
+    for i, q in enumerate(queries):
+        await cache.get_semantically(q, f"ctx-{i % contexts}")
+    sem_us = (time.perf_counter() - t0) / ops * 1e6
+    return get_us, set_us, sem_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 4096, 32768])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--contexts", type=int, default=4)
+    parser.add_argument("--ann-tables", type=int, default=0)
+    parser.add_argument("--ann-bits", type=int, default=14)
+    parser.add_argument("--shards", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'maxsize':>8} {'get (us)':>10} {'set (us)':>10} {'semantic (us)':>14}")
+    for size in args.sizes:
+        get_us, set_us, sem_us = asyncio.run(
+            bench(size, args.dim, args.ops, args.contexts, args.ann_tables, args.ann_bits, args.shards)
+        )
+        print(f"{size:>8} {get_us:>10.2f} {set_us:>10.2f} {sem_us:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import json
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+from fastapi.testclient import TestClient
+
+@pytest.fixture(autouse=True)
+def mock_lifespan_and_deps():
+    """Mock core components to prevent starting real model loading or Qdrant connections."""
+    with patch("rag_api.app.main.get_models"), \
+         patch("app.services.qdrant_client.get_qdrant") as mock_qdrant:
+        yield mock_qdrant
+
+@pytest.fixture
+def client():
+    from rag_api.app.main import app
+    return TestClient(app)
+
+def make_chunks(doc):
+    return [{
+        "source_id": doc,
+        "chunk_id": "chunk_1",
+        "text": f"Text from {doc}.",
+        "source_path": f"data/docs/{doc}",
+        "score": 0.9,
+    }]
+
+class CountingLLMClient:
+    """Answers with the question it was asked and tracks how many calls overlap."""
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+
+    async def chat_once(self, model, messages, temperature, max_tokens, deadline=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        question = messages[-1]["content"].rsplit("Question:", 1)[-1].strip()
+        return {"message": {"content": f"Answer to {question}"}}
+
+def parse_ndjson(text):
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def test_query_batch_streams_one_line_per_question(client):
+    questions = [f"Question {i}?" for i in range(6)]
+    llm = CountingLLMClient()
+    with patch("app.routes.query.asearch_similar_batch", new_callable=AsyncMock) as mock_search, \
+         patch("app.routes.query.get_llm_client", return_value=llm), \
+         patch("app.routes.query.settings.BATCH_LLM_CONCURRENCY", 2):
+        mock_search.return_value = [make_chunks(f"doc{i}.pdf") for i in range(6)]
+        response = client.post(
+            "/query/batch",
+            json={"questions": questions, "top_k": 1},
+            headers={"Authorization": "Bearer local-key"},
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    items = sorted(parse_ndjson(response.text), key=lambda x: x["index"])
+    assert [it["question"] for it in items] == questions
+    for i, it in enumerate(items):
+        assert questions[i] in it["answer"]
+        assert it["sources"][0]["source_id"] == f"doc{i}.pdf"
+    # Retrieval happened in one batched call and LLM concurrency stayed bounded
+    mock_search.assert_awaited_once()
+    assert llm.max_active <= 2
+
+def test_query_batch_fallback_when_search_fails(client):
+    with patch("app.routes.query.asearch_similar_batch", new_callable=AsyncMock) as mock_search:
+        mock_search.side_effect = Exception("Qdrant down")
+        response = client.post(
+            "/query/batch",
+            json={"questions": ["a?", "b?"]},
+            headers={"Authorization": "Bearer local-key"},
+        )
+    assert response.status_code == 200
+    items = parse_ndjson(response.text)
+    assert len(items) == 2
+    assert all("temporarily unavailable" in it["answer"] for it in items)
@@ -0,0 +1,111 @@
+import time
+import asyncio
+import numpy as np
+
+try:
+    from app.utils.ttlcache import SemanticTTLCache
+    from app.utils.cache_backends import SQLiteCacheBackend
+except ModuleNotFoundError:
+    from rag_api.app.utils.ttlcache import SemanticTTLCache
+    from rag_api.app.utils.cache_backends import SQLiteCacheBackend
+
+
+def _unit(v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def _cache(path, **kwargs):
+    backend = SQLiteCacheBackend(str(path), "answer_cache")
+    return SemanticTTLCache(maxsize=10, ttl_seconds=60, backend=backend, sync_interval=0, **kwargs)
+
+
+def test_entries_are_shared_between_workers(tmp_path):
+    db = tmp_path / "cache.sqlite3"
+    worker_a, worker_b = _cache(db), _cache(db)
+    emb = _unit([1.0, 0.0, 0.0])
+
+    async def scenario():
+        await worker_a.set("k1", {"answer": "from a", "sources": []}, emb=emb, context_str="ctx")
+        exact = await worker_b.get("k1")
+        semantic = await _cache(db).get_semantically(_unit([0.99, 0.05, 0.0]), "ctx")
+        return exact, semantic
+
+    exact, semantic = asyncio.run(scenario())
+    assert exact == {"answer": "from a", "sources": []}
+    assert semantic == {"answer": "from a", "sources": []}
+
+
+def test_entries_survive_restart(tmp_path):
+    db = tmp_path / "cache.sqlite3"
+    asyncio.run(_cache(db).set("k1", "v1"))
+
+    restarted = _cache(db)
+    assert len(restarted) == 0
+    assert asyncio.run(restarted.get("k1")) == "v1"
+    assert len(restarted) == 1
+
+
+def test_expired_and_cleared_entries_are_not_served(tmp_path):
+    db = tmp_path / "cache.sqlite3"
+    backend = SQLiteCacheBackend(str(db), "answer_cache")
+    backend.set("old", None, "stale", None, time.time() - 1)
+    cache = _cache(db)
+    assert asyncio.run(cache.get("old")) is None
+
+    asyncio.run(cache.set("prefix:1", "v1"))
+    asyncio.run(cache.set("other", "v2"))
+    asyncio.run(cache.invalidate_prefix("prefix:"))
+    assert asyncio.run(_cache(db).get("prefix:1")) is None
+    assert asyncio.run(_cache(db).get("other")) == "v2"
+
+    cache.clear()
+    assert asyncio.run(_cache(db).get("other")) is None
+
+
+def test_backend_prunes_least_recently_used(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), "answer_cache", max_entries=3, prune_every=1)
+    for i in range(5):
+        backend.set(f"k{i}", None, i, None, time.time() + 60)
+    assert backend.get("k0") is None
+    assert [row[0] for row in backend.changes_since(0, 10)[0]] == ["k2", "k3", "k4"]
+
+
+def test_reads_batch_access_time_updates(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), "answer_cache", touch_batch=3, touch_interval=3600)
+    backend.set("k", None, "v", None, time.time() + 60)
+
+    def last_access():
+        return backend.conn.execute("SELECT last_access FROM answer_cache WHERE key = 'k'").fetchone()[0]
+
+    written = last_access()
+    time.sleep(0.01)
+    backend.get("k")
+    backend.get("k")
+    assert last_access() == written  # reads alone don't write yet
+    backend.get("k")
+    assert last_access() > written
+
+
+def test_cache_reads_and_writes_backend_off_the_event_loop(tmp_path):
+    import threading
+
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), "answer_cache")
+    threads = []
+    for name in ("get", "set"):
+        method = getattr(backend, name)
+
+        def recording(*args, _method=method):
+            threads.append(threading.get_ident())
+            return _method(*args)
+
+        setattr(backend, name, recording)
+    cache = SemanticTTLCache(maxsize=10, ttl_seconds=60, backend=backend, sync_interval=3600)
+
+    async def scenario():
+        await cache.set("k", "v")
+        cache.clear(backend=False)
+        return await cache.get("k")
+
+    assert asyncio.run(scenario()) == "v"
+    assert len(threads) == 2 and threading.get_ident() not in threads
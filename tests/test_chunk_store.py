@@ -0,0 +1,113 @@
+import asyncio
+
+try:
+    from app.utils.chunk_store import ChunkStore
+    from app.utils.ttlcache import SemanticTTLCache
+    from app.utils.cache_backends import SQLiteCacheBackend
+except ModuleNotFoundError:
+    from rag_api.app.utils.chunk_store import ChunkStore
+    from rag_api.app.utils.ttlcache import SemanticTTLCache
+    from rag_api.app.utils.cache_backends import SQLiteCacheBackend
+
+
+def chunk(i, score):
+    return {"hash": f"h{i}", "source_id": f"doc{i}", "text": f"chunk text {i} " * 20, "score": score}
+
+
+def make_cache(store, maxsize=2, **kwargs):
+    return SemanticTTLCache(
+        maxsize=maxsize, ttl_seconds=60, shards=1, on_insert=store.acquire, on_evict=store.release,
+        shared_bytes=lambda: store.nbytes, to_backend=store.expand, from_backend=store.adopt,
+        resolve=store.unpack, **kwargs,
+    )
+
+
+def test_shared_chunks_are_stored_once_and_unpacked_with_scores():
+    store = ChunkStore()
+    cache = make_cache(store)
+
+    async def scenario():
+        await cache.set("q1", store.pack([chunk(1, 0.9), chunk(2, 0.8)]))
+        await cache.set("q2", store.pack([chunk(2, 0.7), chunk(3, 0.6)]))
+        return await cache.get("q1"), await cache.get("q2")
+
+    first, second = asyncio.run(scenario())
+    assert [(c["source_id"], c["score"]) for c in first] == [("doc1", 0.9), ("doc2", 0.8)]
+    assert [(c["source_id"], c["score"]) for c in second] == [("doc2", 0.7), ("doc3", 0.6)]
+    assert first[1] is not second[0]  # every hit gets its own dicts
+    assert store.stats()["chunks"] == 3
+    assert store.stats()["references"] == 4
+
+
+def test_payloads_are_freed_with_their_last_reference():
+    store = ChunkStore()
+    cache = make_cache(store)
+
+    async def scenario():
+        await cache.set("q1", store.pack([chunk(1, 0.9), chunk(2, 0.8)]))
+        await cache.set("q2", store.pack([chunk(2, 0.7)]))
+        # Replacing q2 with a result sharing chunk 2 must not free it in between
+        await cache.set("q2", store.pack([chunk(2, 0.5)]))
+        assert (await cache.get("q2"))[0]["score"] == 0.5
+        await cache.set("q3", store.pack([chunk(3, 0.4)]))  # evicts q1 (LRU)
+
+    asyncio.run(scenario())
+    assert sorted(store._chunks) == ["h2", "h3"]
+
+    cache.clear()
+    assert store.stats() == {"chunks": 0, "bytes": 0, "references": 0, "unresolved": 0}
+
+
+def test_results_without_local_payloads_do_not_resolve():
+    store = ChunkStore()
+    value = {"ids": ["elsewhere"], "scores": [0.9]}
+    store.acquire(value)  # e.g. a backend row written without its payloads
+    assert store.unpack(value) is None
+    store.release(value)
+    assert len(store) == 0
+
+
+def test_results_are_shared_through_the_backend(tmp_path):
+    db = str(tmp_path / "cache.sqlite3")
+    store_a, store_b = ChunkStore(), ChunkStore()
+    worker_a = make_cache(store_a, backend=SQLiteCacheBackend(db, "retrieval_cache"), sync_interval=0)
+    worker_b = make_cache(store_b, backend=SQLiteCacheBackend(db, "retrieval_cache"), sync_interval=0)
+
+    async def scenario():
+        await worker_a.set("q1", store_a.pack([chunk(1, 0.9), chunk(2, 0.8)]))
+        return await worker_b.get("q1")
+
+    chunks = asyncio.run(scenario())
+    assert [(c["source_id"], c["score"]) for c in chunks] == [("doc1", 0.9), ("doc2", 0.8)]
+    # Worker B holds the payloads once, and its L1 entry only the ids
+    assert store_b.stats()["chunks"] == 2 and store_b.stats()["references"] == 2
+    assert set(worker_b.shards[0].store["q1"][1]) == {"ids", "scores"}
+    assert worker_b.stats()["hits"] == 1
+
+
+def test_unresolved_results_count_as_misses():
+    store = ChunkStore()
+    cache = make_cache(store)
+
+    async def scenario():
+        await cache.set("q1", {"ids": ["elsewhere"], "scores": [0.9]})
+        return await cache.get("q1"), await cache.get_allow_stale("q1")
+
+    assert asyncio.run(scenario()) == (None, (None, False))
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 2
+    assert store.stats()["unresolved"] == 2
+
+
+def test_payload_bytes_count_against_the_byte_budget():
+    store = ChunkStore()
+    cache = make_cache(store, maxsize=100, max_bytes=4000)
+
+    async def scenario():
+        for i in range(20):
+            await cache.set(f"q{i}", store.pack([chunk(i, 0.9)]))
+
+    asyncio.run(scenario())
+    stats = cache.stats()
+    assert stats["bytes"] <= 4000
+    assert stats["bytes"] - sum(shard.nbytes for shard in cache.shards) == store.nbytes > 0
+    assert stats["entries"] < 20
@@ -0,0 +1,117 @@
+from unittest.mock import patch
+
+try:
+    from app.services import context_packer as packer_mod
+    from app.services.context_packer import ContextPacker, count_tokens, truncate_to_tokens
+    from app.services.prompt import build_messages
+except ModuleNotFoundError:
+    from rag_api.app.services import context_packer as packer_mod
+    from rag_api.app.services.context_packer import ContextPacker, count_tokens, truncate_to_tokens
+    from rag_api.app.services.prompt import build_messages
+
+
+def chunk(i, score, words):
+    return {"source_id": f"doc{i}.pdf", "chunk_id": f"c{i}", "text": " ".join(["rule"] * words), "score": score}
+
+
+def test_low_scoring_chunks_dropped_relative_to_top_hit():
+    packer = ContextPacker(token_budget=0, min_score_ratio=0.5)
+    packed, report = packer.pack([chunk(1, 0.9, 5), chunk(2, 0.6, 5), chunk(3, 0.3, 5)])
+    assert [c["chunk_id"] for c in packed] == ["c1", "c2"]
+    assert report["dropped_low_score"] == 1
+    assert report["tokens_saved"] == 5
+
+
+def test_budget_filled_in_score_order_with_truncation():
+    packer = ContextPacker(token_budget=100, min_score_ratio=0, min_chunk_tokens=10)
+    chunks = [chunk(3, 0.2, 30), chunk(1, 0.9, 60), chunk(2, 0.5, 80)]
+    packed, report = packer.pack(chunks)
+    assert [c["chunk_id"] for c in packed] == ["c1", "c2"]
+    assert report["truncated"] == 1 and report["dropped_over_budget"] == 1
+    assert report["tokens_used"] == 100
+    assert report["tokens_in"] == 170 and report["tokens_saved"] == 70
+    # The input chunks are not modified
+    assert chunks[2]["text"].count("rule") == 80
+
+
+def test_top_hit_is_kept_even_when_longer_than_budget():
+    packer = ContextPacker(token_budget=10, min_score_ratio=0.5, min_chunk_tokens=64)
+    packed, report = packer.pack([chunk(1, 0.9, 50), chunk(2, 0.8, 5)])
+    assert [c["chunk_id"] for c in packed] == ["c1"]
+    assert count_tokens(packed[0]["text"]) == 10
+
+
+def test_estimate_and_truncation_agree():
+    text = "Employees accrue 1.25 days of annual leave per month, up to 15 days."
+    n = count_tokens(text)
+    assert 15 <= n <= 25
+    assert truncate_to_tokens(text, n) == text
+    assert count_tokens(truncate_to_tokens(text, 5)) <= 5
+
+
+def test_exact_counts_with_tokenizer_file(tmp_path):
+    from tokenizers import Tokenizer, models, pre_tokenizers
+
+    tokenizer = Tokenizer(models.WordLevel({"[UNK]": 0, "leave": 1, "days": 2}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    path = str(tmp_path / "tokenizer.json")
+    tokenizer.save(path)
+
+    packer_mod._load_tokenizer.cache_clear()
+    try:
+        with patch.object(packer_mod.settings, "CONTEXT_TOKENIZER_PATH", path):
+            assert count_tokens("fifteen leave days, paid") == 5
+            assert truncate_to_tokens("fifteen leave days, paid", 3) == "fifteen leave days"
+    finally:
+        packer_mod._load_tokenizer.cache_clear()
+
+
+def test_build_messages_reports_packing():
+    report = {}
+    with patch.object(packer_mod.context_packer, "min_score_ratio", 0.5):
+        messages = build_messages("How much leave?", [chunk(1, 0.9, 3), chunk(2, 0.1, 3)], report)
+    assert "Context [1]" in messages[1]["content"] and "Context [2]" not in messages[1]["content"]
+    assert report["chunks_used"] == 1 and report["tokens_saved"] == 3
+
+
+def test_sources_only_cite_packed_chunks():
+    from unittest.mock import AsyncMock
+    from fastapi.testclient import TestClient
+    from app.utils.ttlcache import answer_cache, retrieval_cache
+
+    retrieved = [
+        {**chunk(1, 0.9, 3), "source_path": "doc1.pdf", "page": 1},
+        {**chunk(2, 0.1, 3), "source_path": "doc2.pdf", "page": 2},
+    ]
+
+    class LLM:
+        async def chat_once(self, model, messages, temperature, max_tokens, deadline=None):
+            return {"message": {"content": "Fifteen days."}}
+
+    answer_cache.clear()
+    retrieval_cache.clear()
+    with patch("rag_api.app.main.get_models"), \
+         patch("app.services.qdrant_client.get_qdrant"), \
+         patch("app.services.semantic_cache.aembed_query", new_callable=AsyncMock, side_effect=RuntimeError("no model")), \
+         patch("app.routes.query.asearch_similar", new_callable=AsyncMock, return_value=retrieved), \
+         patch("app.routes.query.get_llm_client", return_value=LLM()), \
+         patch("app.routes.stream.asearch_similar", new_callable=AsyncMock, return_value=retrieved), \
+         patch("app.routes.stream.get_llm_client", return_value=LLM()), \
+         patch.object(packer_mod.context_packer, "min_score_ratio", 0.5):
+        from rag_api.app.main import app
+        client = TestClient(app)
+        headers = {"Authorization": "Bearer local-key"}
+        query = client.post("/query", json={"question": "How much leave?"}, headers=headers).json()
+        chat = client.post(
+            "/v1/chat/completions",
+            json={"messages": [{"role": "user", "content": "How much leave?"}]},
+            headers=headers,
+        ).json()
+    answer_cache.clear()
+    retrieval_cache.clear()
+
+    assert [s["source_id"] for s in query["sources"]] == ["doc1.pdf"]
+    # The full chunk text is cited, not the prompt's shortened copy
+    assert query["sources"][0]["text"] == retrieved[0]["text"]
+    content = chat["choices"][0]["message"]["content"]
+    assert "doc1.pdf" in content and "doc2.pdf" not in content
@@ -1,24 +1,25 @@
 import pytest
 import json
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from fastapi.testclient import TestClient
 
 @pytest.fixture(autouse=True)
 def mock_lifespan_and_deps():
     """Mock core components to prevent starting real model loading or Qdrant connections."""
     with patch("rag_api.app.main.get_models"), \
-         patch("app.services.qdrant_client.get_qdrant") as mock_qdrant:
+         patch("app.services.qdrant_client.get_qdrant") as mock_qdrant, \
+         patch("app.services.semantic_cache.aembed_query", new_callable=AsyncMock, side_effect=RuntimeError("no embedding model in tests")):
         yield mock_qdrant
 
 @pytest.fixture(autouse=True)
 def clear_caches():
     """Clear global caches before and after each test to ensure test isolation."""
     from app.utils.ttlcache import answer_cache, retrieval_cache
-    answer_cache.store.clear()
-    retrieval_cache.store.clear()
+    answer_cache.clear()
+    retrieval_cache.clear()
     yield
-    answer_cache.store.clear()
-    retrieval_cache.store.clear()
+    answer_cache.clear()
+    retrieval_cache.clear()
 
 @pytest.fixture
 def client():
@@ -42,12 +43,12 @@ class MockLLMClient:
     def __init__(self, response_text: str):
         self.response_text = response_text
 
-    async def chat_once(self, model, messages, temperature, max_tokens):
+    async def chat_once(self, model, messages, temperature, max_tokens, deadline=None):
         return {
             "message": {"content": self.response_text}
         }
 
-    async def chat_stream(self, model, messages, temperature, max_tokens):
+    async def chat_stream(self, model, messages, temperature, max_tokens, deadline=None):
         # Yield chunk by chunk
         words = self.response_text.split(" ")
         for i, word in enumerate(words):
@@ -57,7 +58,7 @@ class MockLLMClient:
             }
 
 def test_query_normal_response(client):
-    with patch("app.routes.query.search_similar") as mock_search, \
+    with patch("app.routes.query.asearch_similar", new_callable=AsyncMock) as mock_search, \
          patch("app.routes.query.get_llm_client") as mock_get_llm:
         mock_search.return_value = MOCK_CHUNKS
         mock_get_llm.return_value = MockLLMClient("The annual leave policy is 15 days.")
@@ -74,7 +75,7 @@ def test_query_normal_response(client):
         assert data["sources"][0]["source_id"] == "leave_policy.pdf"
 
 def test_query_dont_know_response(client):
-    with patch("app.routes.query.search_similar") as mock_search, \
+    with patch("app.routes.query.asearch_similar", new_callable=AsyncMock) as mock_search, \
          patch("app.routes.query.get_llm_client") as mock_get_llm:
         mock_search.return_value = MOCK_CHUNKS
         headers = {"Authorization": "Bearer local-key"}
@@ -97,7 +98,7 @@ def test_query_dont_know_response(client):
         assert data["sources"] == []
 
 def test_chat_completions_non_streaming_normal(client):
-    with patch("app.routes.stream.search_similar") as mock_search, \
+    with patch("app.routes.stream.asearch_similar", new_callable=AsyncMock) as mock_search, \
          patch("app.routes.stream.get_llm_client") as mock_get_llm:
         mock_search.return_value = MOCK_CHUNKS
         mock_get_llm.return_value = MockLLMClient("The annual leave policy is 15 days.")
@@ -119,7 +120,7 @@ def test_chat_completions_non_streaming_normal(client):
         assert "leave_policy.pdf" in content
 
 def test_chat_completions_non_streaming_dont_know(client):
-    with patch("app.routes.stream.search_similar") as mock_search, \
+    with patch("app.routes.stream.asearch_similar", new_callable=AsyncMock) as mock_search, \
          patch("app.routes.stream.get_llm_client") as mock_get_llm:
         mock_search.return_value = MOCK_CHUNKS
         mock_get_llm.return_value = MockLLMClient("I don't know what the policy says.")
@@ -141,7 +142,7 @@ def test_chat_completions_non_streaming_dont_know(client):
         assert "leave_policy.pdf" not in content
 
 def test_chat_completions_streaming_normal(client):
-    with patch("app.routes.stream.search_similar") as mock_search, \
+    with patch("app.routes.stream.asearch_similar", new_callable=AsyncMock) as mock_search, \
          patch("app.routes.stream.get_llm_client") as mock_get_llm:
         mock_search.return_value = MOCK_CHUNKS
         mock_get_llm.return_value = MockLLMClient("The annual leave policy is 15 days.")
@@ -174,7 +175,7 @@ def test_chat_completions_streaming_normal(client):
         assert "leave_policy.pdf" in full_content
 
 def test_chat_completions_streaming_dont_know(client):
-    with patch("app.routes.stream.search_similar") as mock_search, \
+    with patch("app.routes.stream.asearch_similar", new_callable=AsyncMock) as mock_search, \
          patch("app.routes.stream.get_llm_client") as mock_get_llm:
         mock_search.return_value = MOCK_CHUNKS
         mock_get_llm.return_value = MockLLMClient("I do not know the answer.")
@@ -0,0 +1,89 @@
+import threading
+import numpy as np
+from types import SimpleNamespace
+
+try:
+    from app.services.embed_server import EmbeddingServer, EmbedServerClient
+    from app.services.embedding_batcher import EmbeddingBatcher
+except ModuleNotFoundError:
+    from rag_api.app.services.embed_server import EmbeddingServer, EmbedServerClient
+    from rag_api.app.services.embedding_batcher import EmbeddingBatcher
+
+
+def fake_embed(texts, mode="hybrid"):
+    dense = None
+    if mode != "sparse":
+        dense = np.array([[float(len(t)), 1.0, 2.0] for t in texts], dtype=np.float32)
+    sparse = None
+    if mode != "dense":
+        sparse = [
+            SimpleNamespace(indices=np.arange(len(t)), values=np.full(len(t), 0.5, dtype=np.float32))
+            for t in texts
+        ]
+    return dense, sparse
+
+
+def start_server(path):
+    batcher = EmbeddingBatcher(fake_embed, window_ms=5)
+    server = EmbeddingServer(str(path), batcher)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, batcher
+
+
+def test_embed_server_roundtrip_via_shared_memory(tmp_path):
+    server, batcher = start_server(tmp_path / "embed.sock")
+    client = EmbedServerClient(str(tmp_path / "embed.sock"), pool_size=2)
+    try:
+        dense, sparse = client.embed(["hi", "hello"], "hybrid")
+        assert dense.shape == (2, 3)
+        assert dense[1, 0] == 5.0
+        assert sparse[0].indices.tolist() == [0, 1]
+        assert np.allclose(sparse[1].values, 0.5)
+
+        dense, sparse = client.embed(["keyword"], "sparse")
+        assert dense is None
+        assert len(sparse[0].indices) == 7
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+        batcher.stop()
+
+
+def test_embed_server_falls_back_to_inline_dense_for_large_batches(tmp_path):
+    server, batcher = start_server(tmp_path / "embed.sock")
+    # Buffer only fits one row
+    client = EmbedServerClient(str(tmp_path / "embed.sock"), shm_bytes=12)
+    try:
+        dense, _ = client.embed(["a", "bb", "ccc"], "dense")
+        assert dense[:, 0].tolist() == [1.0, 2.0, 3.0]
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+        batcher.stop()
+
+
+def test_embed_server_batches_across_clients(tmp_path):
+    server, batcher = start_server(tmp_path / "embed.sock")
+    clients = [EmbedServerClient(str(tmp_path / "embed.sock")) for _ in range(4)]
+    results = []
+
+    def call(c, i):
+        results.append(c.embed([f"query {i}"], "dense")[0][0, 0])
+
+    threads = [threading.Thread(target=call, args=(c, i)) for i, c in enumerate(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    try:
+        assert sorted(results) == [7.0] * 4
+        assert batcher.stats()["items"] == 4
+    finally:
+        for c in clients:
+            c.close()
+        server.shutdown()
+        server.server_close()
+        batcher.stop()
@@ -0,0 +1,89 @@
+import threading
+import numpy as np
+import pytest
+
+try:
+    from app.services.embedding_batcher import EmbeddingBatcher
+except ModuleNotFoundError:
+    from rag_api.app.services.embedding_batcher import EmbeddingBatcher
+
+
+def fake_embed(calls):
+    def _embed(texts, mode="hybrid"):
+        calls.append(list(texts))
+        dense = np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+        sparse = [f"sparse:{t}" for t in texts]
+        return dense, sparse
+    return _embed
+
+
+def test_batcher_coalesces_concurrent_queries():
+    calls = []
+    batcher = EmbeddingBatcher(fake_embed(calls), window_ms=50, max_batch_size=16)
+    texts = [f"q{'x' * i}" for i in range(8)]
+    results = {}
+
+    def worker(t):
+        results[t] = batcher.submit(t).result(timeout=5)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in texts]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    batcher.stop()
+
+    # Every caller gets its own row back
+    for t in texts:
+        dense, sparse = results[t]
+        assert dense[0] == len(t)
+        assert sparse == f"sparse:{t}"
+
+    # Far fewer model passes than queries
+    assert len(calls) < len(texts)
+    stats = batcher.stats()
+    assert stats["items"] == len(texts)
+    assert stats["batches"] == len(calls)
+    assert stats["max_batch_size"] >= 2
+    assert sum(stats["batch_size_histogram"].values()) == stats["batches"]
+
+
+def test_batcher_respects_max_batch_size():
+    calls = []
+    batcher = EmbeddingBatcher(fake_embed(calls), window_ms=50, max_batch_size=2)
+    futures = [batcher.submit(f"text {i}") for i in range(5)]
+    for f in futures:
+        f.result(timeout=5)
+    batcher.stop()
+    assert all(len(c) <= 2 for c in calls)
+
+
+def test_batcher_propagates_errors():
+    def failing(texts, mode="hybrid"):
+        raise RuntimeError("model crashed")
+
+    batcher = EmbeddingBatcher(failing, window_ms=0)
+    with pytest.raises(RuntimeError):
+        batcher.submit("hello").result(timeout=5)
+    batcher.stop()
+    assert batcher.stats()["errors"] == 1
+
+
+def test_batcher_groups_by_retrieval_mode():
+    calls = []
+
+    def embed(texts, mode):
+        calls.append((mode, list(texts)))
+        dense = None if mode == "sparse" else np.ones((len(texts), 2), dtype=np.float32)
+        sparse = None if mode == "dense" else [f"sparse:{t}" for t in texts]
+        return dense, sparse
+
+    batcher = EmbeddingBatcher(embed, window_ms=50)
+    f_sparse = batcher.submit("fmla", "sparse")
+    f_hybrid = batcher.submit("what is the leave policy?", "hybrid")
+    assert f_sparse.result(timeout=5) == (None, "sparse:fmla")
+    dense, sparse = f_hybrid.result(timeout=5)
+    assert dense.shape == (2,)
+    assert sparse == "sparse:what is the leave policy?"
+    batcher.stop()
+    assert {mode for mode, _ in calls} == {"sparse", "hybrid"}
@@ -0,0 +1,50 @@
+import time
+import numpy as np
+from types import SimpleNamespace
+
+try:
+    from app.utils.embedding_cache import EmbeddingCache
+except ModuleNotFoundError:
+    from rag_api.app.utils.embedding_cache import EmbeddingCache
+
+
+def make_sparse(indices, values):
+    return SimpleNamespace(indices=np.array(indices, dtype=np.int64), values=np.array(values, dtype=np.float32))
+
+
+def test_embedding_cache_roundtrip_and_stats():
+    cache = EmbeddingCache(maxsize=4, ttl_seconds=60)
+    dense = np.array([0.6, 0.8], dtype=np.float32)
+    cache.set("what is the leave policy?", dense, make_sparse([3, 7], [0.5, 1.5]))
+
+    assert cache.get("unknown question") is None
+    hit = cache.get("what is the leave policy?")
+    assert hit is not None
+    q_dense, q_sparse = hit
+    assert np.allclose(q_dense, dense)
+    assert q_sparse.indices.tolist() == [3, 7]
+    assert np.allclose(q_sparse.values, [0.5, 1.5])
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["dense_bytes"] == 4 * 2 * 4
+
+
+def test_embedding_cache_lru_eviction_reuses_slots():
+    cache = EmbeddingCache(maxsize=2, ttl_seconds=60, dtype="float16")
+    for i in range(3):
+        cache.set(f"q{i}", np.array([float(i), 1.0]), make_sparse([i], [1.0]))
+    # Oldest entry was evicted and its slot reused
+    assert cache.get("q0") is None
+    assert np.allclose(cache.get("q2")[0], [2.0, 1.0])
+    assert cache.stats()["size"] == 2
+
+
+def test_embedding_cache_ttl_expiry():
+    cache = EmbeddingCache(maxsize=2, ttl_seconds=0)
+    cache.set("q", np.array([1.0, 0.0]), make_sparse([1], [1.0]))
+    time.sleep(0.01)
+    assert cache.get("q") is None
+    assert cache.stats()["size"] == 0
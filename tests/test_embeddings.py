@@ -12,4 +12,54 @@ def test_embedding_shape_and_norm():
     # Verify sparse
     assert len(sparse) == 2
     assert hasattr(sparse[0], "indices")
-    assert hasattr(sparse[0], "values")
\ No newline at end of file
+    assert hasattr(sparse[0], "values")
+
+def test_parallel_mode_runs_dense_and_sparse_concurrently():
+    import threading
+    from unittest.mock import patch, MagicMock
+    from rag_api.app.services import embeddings
+
+    # Each model blocks until the other one has started, so this only passes when they overlap
+    barrier = threading.Barrier(2, timeout=5)
+
+    class FakeDense:
+        def embed(self, texts, batch_size=32):
+            barrier.wait()
+            return [np.array([3.0, 4.0]) for _ in texts]
+
+    class FakeSparse:
+        def embed(self, texts, batch_size=32):
+            barrier.wait()
+            return [MagicMock(indices=np.array([1]), values=np.array([0.5])) for _ in texts]
+
+    with patch.object(embeddings, "get_dense_model", return_value=FakeDense()), \
+         patch.object(embeddings, "get_sparse_model", return_value=FakeSparse()), \
+         patch.object(embeddings.settings, "EMBED_PARALLEL", True):
+        dense, sparse = embeddings.embed_texts(["a", "b"])
+
+    assert dense.shape == (2, 2)
+    assert np.allclose(dense[0], [0.6, 0.8])
+    assert len(sparse) == 2
+
+
+def test_split_threads():
+    from rag_api.app.services.embeddings import _split_threads
+    assert _split_threads(1) == (1, 1)
+    dense, sparse = _split_threads(8)
+    assert dense + sparse == 8
+    assert dense > sparse >= 1
+
+
+def test_single_model_modes_only_load_what_they_need():
+    from unittest.mock import patch, MagicMock
+    from rag_api.app.services import embeddings
+
+    fake_sparse = MagicMock()
+    fake_sparse.embed.return_value = [MagicMock(indices=np.array([1]), values=np.array([0.5]))]
+    with patch.object(embeddings, "get_dense_model") as mock_dense, \
+         patch.object(embeddings, "get_sparse_model", return_value=fake_sparse):
+        dense, sparse = embeddings.embed_texts(["fmla"], mode="sparse")
+
+    mock_dense.assert_not_called()
+    assert dense is None
+    assert len(sparse) == 1
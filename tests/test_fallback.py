@@ -1,13 +1,14 @@
 import pytest
 import json
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from fastapi.testclient import TestClient
 
 @pytest.fixture(autouse=True)
 def mock_lifespan_and_deps():
     """Mock core components to prevent starting real model loading or Qdrant connections."""
     with patch("rag_api.app.main.get_models"), \
-         patch("app.services.qdrant_client.get_qdrant") as mock_qdrant:
+         patch("app.services.qdrant_client.get_qdrant") as mock_qdrant, \
+         patch("app.services.semantic_cache.aembed_query", new_callable=AsyncMock, side_effect=RuntimeError("no embedding model in tests")):
         yield mock_qdrant
 
 @pytest.fixture
@@ -16,7 +17,7 @@ def client():
     from rag_api.app.main import app
     return TestClient(app)
 
-@patch("rag_api.app.routes.query.search_similar")
+@patch("app.routes.query.asearch_similar", new_callable=AsyncMock)
 def test_query_endpoint_fallback(mock_search, client):
     # Mock search_similar to raise an exception simulating database failure
     mock_search.side_effect = Exception("Qdrant collection not found")
@@ -32,7 +33,7 @@ def test_query_endpoint_fallback(mock_search, client):
     assert data["sources"] == []
     assert data["usage"]["top_k"] == 3
 
-@patch("rag_api.app.routes.stream.search_similar")
+@patch("app.routes.stream.asearch_similar", new_callable=AsyncMock)
 def test_stream_endpoint_fallback(mock_search, client):
     mock_search.side_effect = Exception("Qdrant collection not found")
 
@@ -63,7 +64,7 @@ def test_stream_endpoint_fallback(mock_search, client):
     complete_data = json.loads(events[1]["data"])
     assert complete_data["complete"] is True
 
-@patch("rag_api.app.routes.stream.search_similar")
+@patch("app.routes.stream.asearch_similar", new_callable=AsyncMock)
 def test_chat_completions_non_streaming_fallback(mock_search, client):
     mock_search.side_effect = Exception("Qdrant collection not found")
 
@@ -81,7 +82,7 @@ def test_chat_completions_non_streaming_fallback(mock_search, client):
     assert data["choices"][0]["message"]["content"] == "I am sorry, but the document database is temporarily unavailable. Please try again later."
     assert data["choices"][0]["finish_reason"] == "stop"
 
-@patch("rag_api.app.routes.stream.search_similar")
+@patch("app.routes.stream.asearch_similar", new_callable=AsyncMock)
 def test_chat_completions_streaming_fallback(mock_search, client):
     mock_search.side_effect = Exception("Qdrant collection not found")
 
@@ -112,3 +113,20 @@ def test_chat_completions_streaming_fallback(mock_search, client):
     assert "I am sorry, but the document database is temporarily unavailable" in chunks[1]["choices"][0]["delta"]["content"]
     # Chunk 3: Stop
     assert chunks[2]["choices"][0]["finish_reason"] == "stop"
+
+
+@patch("app.routes.query.get_llm_client")
+@patch("app.routes.query.asearch_similar", new_callable=AsyncMock)
+def test_query_endpoint_llm_unavailable(mock_search, mock_get_llm, client):
+    from app.utils.resilience import CircuitOpenError
+
+    mock_search.return_value = [{"source_id": "doc1", "chunk_id": "c1", "text": "leave policy"}]
+    mock_get_llm.return_value.chat_once = AsyncMock(side_effect=CircuitOpenError("llm circuit breaker is open"))
+
+    headers = {"Authorization": "Bearer local-key"}
+    response = client.post("/query", json={"question": "What is the policy on leave?"}, headers=headers)
+    assert response.status_code == 200
+
+    data = response.json()
+    assert "language model is temporarily unavailable" in data["answer"]
+    assert data["sources"] == []
@@ -0,0 +1,181 @@
+import json
+import time
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock
+from fastapi.testclient import TestClient
+
+try:
+    from app.services.llm import AzureOpenAIClient
+    from app.utils.generation_metrics import GenerationMetrics, GenerationTimer
+except ModuleNotFoundError:
+    from rag_api.app.services.llm import AzureOpenAIClient
+    from rag_api.app.utils.generation_metrics import GenerationMetrics, GenerationTimer
+
+HEADERS = {"Authorization": "Bearer local-key"}
+
+MOCK_CHUNKS = [
+    {
+        "source_id": "leave_policy.pdf",
+        "chunk_id": "chunk_1",
+        "text": "The annual leave is 15 days.",
+        "source_path": "data/docs/leave_policy.pdf",
+        "page": 1,
+        "score": 0.95,
+    }
+]
+
+
+class OllamaLikeLLM:
+    """Streams three tokens and ends with Ollama's final frame."""
+
+    async def chat_once(self, model, messages, temperature, max_tokens, deadline=None):
+        return {
+            "message": {"content": "You get 15 days."},
+            "done": True,
+            "prompt_eval_count": 120,
+            "prompt_eval_duration": 80_000_000,
+            "eval_count": 6,
+            "eval_duration": 200_000_000,
+        }
+
+    async def chat_stream(self, model, messages, temperature, max_tokens, deadline=None):
+        for word in ["You get ", "15 days ", "of annual leave."]:
+            yield {"message": {"content": word}, "done": False}
+        yield {"message": {"content": ""}, "done": True, "prompt_eval_count": 120, "eval_count": 3}
+
+
+def test_timer_reports_provider_counts_and_speed():
+    timer = GenerationTimer()
+    for _ in range(3):
+        timer.token()
+        time.sleep(0.01)
+    timer.finish({
+        "done": True, "prompt_eval_count": 50, "eval_count": 30,
+        "eval_duration": 1_500_000_000, "prompt_eval_duration": 42_500_000,
+    })
+    usage = timer.usage()
+    assert (usage["prompt_tokens"], usage["completion_tokens"], usage["total_tokens"]) == (50, 30, 80)
+    assert usage["prompt_eval_ms"] == 42.5
+    assert usage["tokens_per_second"] == 20.0
+    assert usage["inter_token_ms"] >= 5
+    assert usage["ttft_ms"] <= usage["generation_ms"]
+
+
+def test_timer_counts_events_when_provider_reports_nothing():
+    timer = GenerationTimer()
+    timer.token()
+    timer.token()
+    timer.finish(None)
+    usage = timer.usage()
+    assert usage["completion_tokens"] == 2 and usage["prompt_tokens"] == 0
+
+
+def test_metrics_aggregate_recent_generations():
+    metrics = GenerationMetrics(window=2)
+    for tps in (10.0, 20.0, 30.0):
+        metrics.record({"prompt_tokens": 5, "completion_tokens": 1, "tokens_per_second": tps})
+    stats = metrics.stats()
+    assert stats["generations"] == 3 and stats["prompt_tokens"] == 15
+    assert stats["tokens_per_second"]["mean"] == 25.0
+    assert stats["ttft_ms"]["p50"] is None
+
+
+def test_azure_stream_requests_and_forwards_usage():
+    def chunk(content=None, usage=None):
+        choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+        return SimpleNamespace(choices=choices, usage=usage)
+
+    async def stream():
+        yield chunk("Hi")
+        yield chunk(usage=SimpleNamespace(
+            prompt_tokens=42, completion_tokens=1, prompt_tokens_details=SimpleNamespace(cached_tokens=32)
+        ))
+
+    client = AzureOpenAIClient(api_key="k", endpoint="https://example.openai.azure.com", api_version="2024-10-21")
+    create = AsyncMock(return_value=stream())
+
+    async def collect():
+        with patch.object(client.client.chat.completions, "create", create):
+            return [ev async for ev in client.chat_stream("gpt", [], 0.0, 10)]
+
+    events = asyncio.run(collect())
+    asyncio.run(client.aclose())
+    assert create.call_args.kwargs["stream_options"] == {"include_usage": True}
+    assert events[-1]["done"] and events[-1]["prompt_eval_count"] == 42 and events[-1]["eval_count"] == 1
+    assert events[-1]["prompt_cached_count"] == 32
+
+
+def test_azure_stream_without_usage_support_counts_events():
+    async def stream():
+        for word in ["Hi", " there"]:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))], usage=None)
+
+    client = AzureOpenAIClient(api_key="k", endpoint="https://example.openai.azure.com", api_version="2024-02-01")
+    create = AsyncMock(return_value=stream())
+
+    async def collect():
+        with patch.object(client.client.chat.completions, "create", create):
+            return [ev async for ev in client.chat_stream("gpt", [], 0.0, 10)]
+
+    events = asyncio.run(collect())
+    asyncio.run(client.aclose())
+    assert "stream_options" not in create.call_args.kwargs
+
+    timer = GenerationTimer()
+    for ev in events:
+        if ev.get("done"):
+            timer.finish(ev)
+        elif ev["message"]["content"]:
+            timer.token()
+    assert timer.usage()["completion_tokens"] == 2
+
+
+@pytest.fixture
+def client():
+    from app.utils.ttlcache import answer_cache, retrieval_cache
+    answer_cache.clear()
+    retrieval_cache.clear()
+    with patch("rag_api.app.main.get_models"), \
+         patch("app.services.qdrant_client.get_qdrant"), \
+         patch("app.services.semantic_cache.aembed_query", new_callable=AsyncMock, side_effect=RuntimeError("no embedding model in tests")):
+        from rag_api.app.main import app
+        yield TestClient(app)
+    answer_cache.clear()
+    retrieval_cache.clear()
+
+
+def test_chat_completions_report_real_usage(client):
+    def ask(question, **extra):
+        payload = {"model": "test-model", "messages": [{"role": "user", "content": question}], **extra}
+        return client.post("/v1/chat/completions", json=payload, headers=HEADERS)
+
+    with patch("app.routes.stream.asearch_similar", new_callable=AsyncMock, return_value=MOCK_CHUNKS), \
+         patch("app.routes.stream.get_llm_client", return_value=OllamaLikeLLM()):
+        once = ask("How much leave do I get?").json()
+        streamed = ask("What is the leave policy?", stream=True, stream_options={"include_usage": True}).text
+
+    assert once["usage"]["prompt_tokens"] == 120
+    assert once["usage"]["completion_tokens"] == 6
+    assert once["usage"]["tokens_per_second"] == 30.0
+    assert once["usage"]["prompt_eval_ms"] == 80.0
+    assert client.get("/metrics", headers=HEADERS).json()["generation"]["prompt_eval_ms"]["p50"] is not None
+
+    frames = [
+        json.loads(line[6:])
+        for line in streamed.split("\n")
+        if line.startswith("data: ") and line[6:].strip() != "[DONE]"
+    ]
+    final = frames[-1]
+    assert final["choices"] == []
+    assert final["usage"]["total_tokens"] == 123
+    assert "ttft_ms" in final["usage"] and "inter_token_ms" in final["usage"]
+
+
+def test_query_usage_includes_tokens(client):
+    with patch("app.routes.query.asearch_similar", new_callable=AsyncMock, return_value=MOCK_CHUNKS), \
+         patch("app.routes.query.get_llm_client", return_value=OllamaLikeLLM()):
+        data = client.post("/query", json={"question": "How much leave?"}, headers=HEADERS).json()
+    assert data["usage"]["prompt_tokens"] == 120
+    assert data["usage"]["completion_tokens"] == 6
@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+try:
+    from app.services import index_version as iv
+    from app.utils.ttlcache import answer_cache
+except ModuleNotFoundError:
+    from rag_api.app.services import index_version as iv
+    from rag_api.app.utils.ttlcache import answer_cache
+
+
+def fake_client(points_count, alias_target=None, size=1024):
+    client = MagicMock()
+    aliases = []
+    if alias_target:
+        aliases.append(SimpleNamespace(alias_name=iv.settings.QDRANT_COLLECTION, collection_name=alias_target))
+    client.get_aliases = AsyncMock(return_value=SimpleNamespace(aliases=aliases))
+    params = SimpleNamespace(model_dump=lambda mode=None: {"vectors": {"dense": {"size": size}}})
+    client.get_collection = AsyncMock(
+        return_value=SimpleNamespace(points_count=points_count, config=SimpleNamespace(params=params))
+    )
+    return client
+
+
+def fingerprint(client):
+    return asyncio.run(iv.compute_fingerprint(client))
+
+
+def test_fingerprint_tracks_collection_state():
+    base = fingerprint(fake_client(100))
+    assert fingerprint(fake_client(100)) == base
+    assert fingerprint(fake_client(101)) != base
+    assert fingerprint(fake_client(100, size=768)) != base
+    assert fingerprint(fake_client(100, alias_target="corpus_blue")) != fingerprint(fake_client(100, alias_target="corpus_green"))
+
+
+def test_alias_target_is_fingerprinted():
+    client = fake_client(5, alias_target="corpus_green")
+    fingerprint(client)
+    client.get_collection.assert_awaited_once_with("corpus_green")
+
+
+def test_version_changes_purge_local_caches_and_request_warm():
+    version = iv.IndexVersion("v1")
+    assert version.current == "v1"
+
+    async def scenario():
+        await answer_cache.set("k", "answer")
+        first = await iv.check_index_version(fake_client(10))
+        assert len(answer_cache) == 0
+        await answer_cache.set("k", "answer")
+        same = await iv.check_index_version(fake_client(10))
+        return first, same
+
+    with patch.object(iv, "index_version", version), \
+         patch.object(iv.cache_warmer, "request_warm") as mock_warm:
+        first, same = asyncio.run(scenario())
+
+    assert first and not same
+    assert version.current.startswith("v1-")
+    assert len(answer_cache) == 1
+    mock_warm.assert_called_once()
+    answer_cache.clear()
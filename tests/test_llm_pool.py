@@ -0,0 +1,87 @@
+import json
+import asyncio
+import httpx
+from unittest.mock import patch
+
+try:
+    from app.services import llm
+except ModuleNotFoundError:
+    from rag_api.app.services import llm
+
+
+def test_http_client_uses_pool_settings():
+    with patch.object(llm.settings, "LLM_POOL_MAX_CONNECTIONS", 7), \
+         patch.object(llm.settings, "LLM_POOL_MAX_KEEPALIVE", 3), \
+         patch.object(llm.settings, "LLM_POOL_TIMEOUT", 1.5):
+        client = llm.build_llm_http_client()
+    pool = client._transport._pool
+    assert pool._max_connections == 7
+    assert pool._max_keepalive_connections == 3
+    assert client.timeout.pool == 1.5
+    assert client.timeout.read == llm.settings.LLM_READ_TIMEOUT
+    asyncio.run(client.aclose())
+
+
+def test_ollama_warmup_opens_connections_and_client_closes():
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        return httpx.Response(200, json={"version": "test"})
+
+    async def scenario():
+        client = llm.OllamaClient("http://ollama:11434/")
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        opened = await client.warmup(3)
+        await client.aclose()
+        return opened, client._client.is_closed
+
+    with patch.object(llm.settings, "LLM_HTTP2", False):
+        opened, closed = asyncio.run(scenario())
+    assert opened == 3
+    assert seen == ["/api/version"] * 3
+    assert closed
+
+
+def test_close_llm_client_resets_singleton():
+    with patch.object(llm.settings, "LLM_PROVIDER", "ollama"), patch.object(llm, "_llm_client", None):
+        first = llm.get_llm_client()
+        asyncio.run(llm.close_llm_client())
+        assert first.inner._client.is_closed
+        assert llm.get_llm_client() is not first
+        asyncio.run(llm.close_llm_client())
+
+
+def test_ollama_sends_keep_alive_and_num_ctx_and_keeps_warm():
+    bodies = []
+
+    def handler(request):
+        bodies.append((request.url.path, json.loads(request.content)))
+        return httpx.Response(200, json={"message": {"content": "ok"}, "done": True})
+
+    async def scenario():
+        client = llm.OllamaClient("http://ollama:11434")
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        await client.chat_once("m", [{"role": "user", "content": "hi"}], 0.1, 16)
+        await client.keep_warm("m")
+        await client.aclose()
+
+    with patch.object(llm.settings, "OLLAMA_KEEP_ALIVE", "1h"), patch.object(llm.settings, "OLLAMA_NUM_CTX", 8192):
+        asyncio.run(scenario())
+    (_, chat), (path, ping) = bodies
+    assert chat["keep_alive"] == "1h" and chat["options"]["num_ctx"] == 8192
+    assert path == "/api/chat" and ping["messages"] == [] and ping["keep_alive"] == "1h"
+
+
+def test_keep_warm_pings_before_ollama_unloads_the_model():
+    assert llm.settings.LLM_KEEP_WARM_SECONDS > 0  # on by default
+    cases = [
+        ("30m", 600, 600), ("5m", 600, 150), ("1h30m", 3600, 2700),
+        ("300", 600, 150), ("-1", 600, 600), (None, 600, 600),
+    ]
+    for keep_alive, seconds, expected in cases:
+        with patch.object(llm.settings, "OLLAMA_KEEP_ALIVE", keep_alive), \
+             patch.object(llm.settings, "LLM_KEEP_WARM_SECONDS", seconds):
+            assert llm.keep_warm_interval() == expected, keep_alive
+    with patch.object(llm.settings, "LLM_KEEP_WARM_SECONDS", 0):
+        assert llm.keep_warm_interval() == 0
@@ -0,0 +1,162 @@
+import json
+import time
+import asyncio
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from app.services.llm import OllamaClient
+    from app.services.llm_router import LLMBackend, LLMRouter
+except ModuleNotFoundError:
+    from rag_api.app.services.llm import OllamaClient
+    from rag_api.app.services.llm_router import LLMBackend, LLMRouter
+
+
+class FakeOllama(ThreadingHTTPServer):
+    """Minimal Ollama: /api/version and streaming or one-shot /api/chat."""
+
+    daemon_threads = True
+
+    def __init__(self, name, fail=False, delay=0.0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.name = name
+        self.fail = fail
+        self.delay = delay
+        self.chats = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.server.fail:
+            return self._json(500, {"error": "down"})
+        self._json(200, {"version": "fake"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.server.fail:
+            return self._json(500, {"error": "model failed to load"})
+        with self.server.lock:
+            self.server.chats += 1
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        try:
+            time.sleep(self.server.delay)
+            words = [f"{self.server.name} ", "says ", "hi"]
+            if not body.get("stream"):
+                return self._json(200, {"message": {"role": "assistant", "content": "".join(words)}, "done": True})
+            lines = [json.dumps({"message": {"content": w}, "done": False}) for w in words]
+            lines.append(json.dumps({"message": {"content": ""}, "done": True}))
+            data = ("\n".join(lines) + "\n").encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def start(*args, **kwargs):
+        server = FakeOllama(*args, **kwargs)
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def router_for(*servers, max_concurrency=4):
+    return LLMRouter([LLMBackend(s.name, OllamaClient(s.url), max_concurrency=max_concurrency) for s in servers])
+
+
+async def stream_text(router):
+    parts = []
+    async for ev in router.chat_stream("m", [{"role": "user", "content": "q"}], 0.0, 16):
+        parts.append(ev.get("message", {}).get("content", ""))
+    return "".join(parts)
+
+
+def test_stream_fails_over_before_first_token(servers):
+    bad, good = servers("bad", fail=True), servers("good")
+    router = router_for(bad, good)
+
+    async def scenario():
+        texts = [await stream_text(router) for _ in range(2)]
+        await router.aclose()
+        return texts
+
+    assert asyncio.run(scenario()) == ["good says hi", "good says hi"]
+    stats = router.stats()
+    assert stats["bad"]["failovers"] >= 1
+    assert stats["good"]["served"] == 2
+    assert all(s["outstanding"] == 0 for s in stats.values())
+
+
+def test_chat_once_fails_over(servers):
+    bad, good = servers("bad", fail=True), servers("good")
+    router = router_for(bad, good)
+
+    async def scenario():
+        resp = await router.chat_once("m", [{"role": "user", "content": "q"}], 0.0, 16)
+        await router.aclose()
+        return resp
+
+    assert asyncio.run(scenario())["message"]["content"] == "good says hi"
+
+
+def test_least_outstanding_balancing_and_concurrency_caps(servers):
+    a, b = servers("a", delay=0.1), servers("b", delay=0.1)
+    router = router_for(a, b, max_concurrency=1)
+
+    async def scenario():
+        texts = await asyncio.gather(*(stream_text(router) for _ in range(4)))
+        await router.aclose()
+        return texts
+
+    texts = asyncio.run(scenario())
+    assert sorted(t.split()[0] for t in texts) == ["a", "a", "b", "b"]
+    assert a.max_active == 1 and b.max_active == 1
+
+
+def test_unhealthy_backends_are_avoided(servers):
+    flaky, good = servers("flaky"), servers("good")
+    router = router_for(flaky, good)
+
+    async def scenario():
+        flaky.fail = True
+        await router.check_health()
+        flaky.fail = False  # still marked unhealthy until the next check
+        text = await stream_text(router)
+        await router.aclose()
+        return text
+
+    assert asyncio.run(scenario()) == "good says hi"
+    assert not router.stats()["flaky"]["healthy"]
+    assert flaky.chats == 0
@@ -0,0 +1,166 @@
+import asyncio
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from rag_api.app.services.local_index import LocalVectorIndex
+
+
+def unit(v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+class FakeScrollClient:
+    """Pages through a fixed set of points the way `QdrantClient.scroll` does."""
+
+    def __init__(self, points, page=2, count=None):
+        self.points = points
+        self.page = page
+        self.reported = len(points) if count is None else count
+
+    def count(self, collection_name, exact=True):
+        return SimpleNamespace(count=self.reported)
+
+    def scroll(self, collection_name, limit, offset=None, with_payload=True, with_vectors=None):
+        start = offset or 0
+        end = start + min(limit, self.page)
+        batch = [
+            SimpleNamespace(vector={"dense": vec.tolist()}, payload=payload)
+            for vec, payload in self.points[start:end]
+        ]
+        return batch, (end if end < len(self.points) else None)
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    return [
+        (unit(rng.normal(size=16)), {"source_id": f"doc{i}", "text": f"chunk {i}"})
+        for i in range(7)
+    ]
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_refresh_and_search(tmp_path, points, dtype):
+    index = LocalVectorIndex(str(tmp_path), dtype=dtype)
+    assert not index.ready
+    assert index.refresh(FakeScrollClient(points)) == len(points)
+
+    results = index.search(points[3][0], top_k=3)
+    assert [r["source_id"] for r in results][0] == "doc3"
+    assert len(results) == 3
+    assert results[0]["score"] == pytest.approx(1.0, abs=0.02)
+    assert results[0]["score"] >= results[1]["score"] >= results[2]["score"]
+
+
+def test_snapshot_survives_restart_and_old_generations_are_pruned(tmp_path, points):
+    index = LocalVectorIndex(str(tmp_path))
+    index.refresh(FakeScrollClient(points))
+    first = index.generation
+    index.refresh(FakeScrollClient(points[:4]))
+    assert index.generation != first
+    assert not (tmp_path / first).exists()
+
+    reloaded = LocalVectorIndex(str(tmp_path))
+    assert reloaded.load()
+    assert len(reloaded) == 4
+    assert reloaded.search(points[1][0], top_k=1)[0]["source_id"] == "doc1"
+
+
+def test_refresh_respects_max_points(tmp_path, points):
+    index = LocalVectorIndex(str(tmp_path), max_points=5)
+    assert index.refresh(FakeScrollClient(points)) == 5
+
+
+def test_asearch_similar_falls_back_to_local_index(tmp_path, points):
+    from rag_api.app.services import retriever
+
+    index = LocalVectorIndex(str(tmp_path))
+    index.refresh(FakeScrollClient(points))
+
+    client = MagicMock()
+    client.query_points = AsyncMock(side_effect=ConnectionError("qdrant down"))
+
+    with patch.object(retriever, "local_index", index), \
+         patch.object(retriever.settings, "LOCAL_INDEX_ENABLED", True), \
+         patch.object(retriever, "get_async_qdrant", return_value=client), \
+         patch.object(retriever, "aensure_collection", new_callable=AsyncMock), \
+         patch.object(retriever, "aembed_query", new_callable=AsyncMock) as mock_aembed:
+        mock_aembed.return_value = (points[5][0], None)
+        results = asyncio.run(retriever.asearch_similar("query", top_k=2, mode="dense"))
+
+    assert results[0]["source_id"] == "doc5"
+    assert index.searches == 1
+
+
+def test_asearch_similar_raises_without_local_index():
+    from rag_api.app.services import retriever
+
+    client = MagicMock()
+    client.query_points = AsyncMock(side_effect=ConnectionError("qdrant down"))
+
+    with patch.object(retriever.settings, "LOCAL_INDEX_ENABLED", False), \
+         patch.object(retriever, "get_async_qdrant", return_value=client), \
+         patch.object(retriever, "aensure_collection", new_callable=AsyncMock), \
+         patch.object(retriever, "aembed_query", new_callable=AsyncMock, return_value=(np.ones(4), None)):
+        with pytest.raises(ConnectionError):
+            asyncio.run(retriever.asearch_similar("query", top_k=2, mode="dense"))
+
+
+def test_workers_sharing_a_path_take_turns_and_keep_current(tmp_path, points):
+    worker_a = LocalVectorIndex(str(tmp_path))
+    worker_b = LocalVectorIndex(str(tmp_path))
+    worker_a.refresh(FakeScrollClient(points))
+
+    # While A holds the refresh lock, B keeps the snapshot CURRENT names instead of writing one
+    with worker_a._refresh_lock() as acquired:
+        assert acquired
+        assert worker_b.refresh(FakeScrollClient(points[:4])) == len(points)
+    assert worker_b.generation == worker_a.generation
+
+    # A fresh generation is adopted rather than rebuilt
+    assert worker_b.refresh(FakeScrollClient(points[:4]), min_interval=3600) == len(points)
+
+    # B's refresh never deletes what CURRENT points at, and A can still load it
+    worker_b.refresh(FakeScrollClient(points[:4]))
+    assert (tmp_path / worker_b.generation).exists()
+    assert worker_a.load() and len(worker_a) == 4
+
+
+def test_load_follows_current_when_generation_is_pruned_mid_load(tmp_path, points):
+    index = LocalVectorIndex(str(tmp_path))
+    index.refresh(FakeScrollClient(points))
+    stale = index.generation
+    newer = LocalVectorIndex(str(tmp_path))
+    real = LocalVectorIndex._load_generation
+
+    def racing(self, generation):
+        if generation == stale:
+            newer.refresh(FakeScrollClient(points[:4]))  # switches CURRENT and prunes `stale`
+            raise FileNotFoundError(generation)
+        return real(self, generation)
+
+    with patch.object(LocalVectorIndex, "_load_generation", racing):
+        assert index.load()
+    assert index.generation == newer.generation and len(index) == 4
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_refresh_truncates_rows_when_points_were_deleted_since_the_count(tmp_path, points, dtype):
+    index = LocalVectorIndex(str(tmp_path), dtype=dtype)
+    assert index.refresh(FakeScrollClient(points, count=len(points) + 3)) == len(points)
+    assert np.load(tmp_path / index.generation / "vectors.npy", mmap_mode="r").shape == (len(points), 16)
+    assert index.search(points[6][0], top_k=1)[0]["source_id"] == "doc6"
+
+    # Points added since the count wait for the next refresh
+    assert index.refresh(FakeScrollClient(points, count=4)) == 4
+
+
+def test_search_in_flight_keeps_the_old_generation_readable(tmp_path, points):
+    index = LocalVectorIndex(str(tmp_path))
+    index.refresh(FakeScrollClient(points))
+    with index.lock:
+        old_payloads, old_offsets = index._payloads, index._offsets
+    index.refresh(FakeScrollClient(points[:4]))
+    assert b"doc6" in old_payloads[old_offsets[6]:old_offsets[7]]
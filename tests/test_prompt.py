@@ -0,0 +1,27 @@
+try:
+    from app.services.prompt import SYSTEM_PROMPT, build_messages
+except ModuleNotFoundError:
+    from rag_api.app.services.prompt import SYSTEM_PROMPT, build_messages
+
+
+CHUNKS = [
+    {"source_id": "b.pdf", "chunk_id": "b_2", "text": "Sick leave is 10 days.", "score": 0.9},
+    {"source_id": "a.pdf", "chunk_id": "a_1", "text": "Annual leave is 15 days.", "score": 0.8},
+]
+
+
+def test_same_chunks_render_the_same_prompt_whatever_their_scores():
+    reordered = [{**CHUNKS[1], "score": 0.95}, CHUNKS[0]]
+    first = build_messages("How much leave?", CHUNKS)
+    second = build_messages("How much leave?", reordered)
+    assert first == second
+    assert first[1]["content"].index("Annual leave") < first[1]["content"].index("Sick leave")
+
+
+def test_system_prompt_is_constant_and_question_comes_last():
+    messages = build_messages("How much leave?", CHUNKS)
+    other = build_messages("Who approves leave?", CHUNKS[:1])
+    assert messages[0]["content"] == other[0]["content"] == SYSTEM_PROMPT
+    user = messages[1]["content"]
+    assert user.endswith("Question: How much leave?")
+    assert not any(line.startswith(" ") for line in user.splitlines())
@@ -0,0 +1,136 @@
+import asyncio
+import time
+import numpy as np
+import pytest
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+try:
+    from app.utils.resilience import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, deadline_timeout
+    from app.services.llm import GuardedLLMClient
+    from app.services import retriever
+except ModuleNotFoundError:
+    from rag_api.app.utils.resilience import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, deadline_timeout
+    from rag_api.app.services.llm import GuardedLLMClient
+    from rag_api.app.services import retriever
+
+
+def fail(breaker):
+    with pytest.raises(ConnectionError):
+        with breaker:
+            raise ConnectionError("down")
+
+
+def test_breaker_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    for _ in range(3):
+        fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        with breaker:
+            pass
+    assert breaker.stats()["rejected"] == 1
+    assert breaker.stats()["trips"] == 1
+
+
+def test_breaker_half_opens_and_recovers():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    fail(breaker)
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with breaker:
+        # Only one probe at a time while half-open
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    fail(breaker)
+    time.sleep(0.06)
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_deadline_budget():
+    deadline = Deadline(10)
+    assert deadline.timeout(cap=2) == 2
+    assert 9 < deadline.timeout() <= 10
+    with pytest.raises(DeadlineExceeded):
+        Deadline(0).timeout()
+
+
+class SlowLLM:
+    def __init__(self, first_token_delay):
+        self.delay = first_token_delay
+
+    async def chat_once(self, model, messages, temperature, max_tokens):
+        await asyncio.sleep(self.delay)
+        return {"message": {"content": "ok"}}
+
+    async def chat_stream(self, model, messages, temperature, max_tokens):
+        await asyncio.sleep(self.delay)
+        for tok in ["a", "b"]:
+            yield {"message": {"content": tok}}
+
+
+async def collect(client, deadline):
+    return [ev async for ev in client.chat_stream("m", [], 0.0, 10, deadline=deadline)]
+
+
+def test_guarded_stream_enforces_deadline_to_first_token():
+    breaker = CircuitBreaker("llm", failure_threshold=2, reset_timeout=60)
+    client = GuardedLLMClient(SlowLLM(0.5), breaker)
+    for _ in range(3):
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(collect(client, Deadline(0.05)))
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(client.chat_once("m", [], 0.0, 10, deadline=Deadline(0.05)))
+    # The requests ran out of time, the LLM didn't fail
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_only_the_per_call_cap_counts_as_a_failure():
+    breaker = CircuitBreaker("qdrant", failure_threshold=1, reset_timeout=60)
+
+    async def call(deadline, cap):
+        with breaker:
+            async with deadline_timeout(deadline, cap):
+                await asyncio.sleep(0.5)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(call(Deadline(0.02), cap=5))
+    assert breaker.state == CircuitBreaker.CLOSED
+    with pytest.raises(TimeoutError) as info:
+        asyncio.run(call(Deadline(5), cap=0.02))
+    assert not isinstance(info.value, DeadlineExceeded)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_tight_deadline_does_not_trip_the_qdrant_breaker():
+    breaker = CircuitBreaker("qdrant", failure_threshold=1, reset_timeout=60)
+
+    async def slow_query(**kwargs):
+        await asyncio.sleep(0.5)
+
+    client = MagicMock(query_points=slow_query)
+    with patch.object(retriever, "qdrant_breaker", breaker), \
+         patch.object(retriever, "_local_index_available", return_value=False), \
+         patch.object(retriever, "get_async_qdrant", return_value=client), \
+         patch.object(retriever, "aensure_collection", new_callable=AsyncMock), \
+         patch.object(retriever, "aembed_query", new_callable=AsyncMock, return_value=(np.array([0.1, 0.2]), None)):
+        for _ in range(3):
+            with pytest.raises(DeadlineExceeded):
+                asyncio.run(retriever.asearch_similar("query", top_k=1, mode="dense", deadline=Deadline(0.05)))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_guarded_client_passes_through_when_healthy():
+    breaker = CircuitBreaker("llm", failure_threshold=1, reset_timeout=60)
+    client = GuardedLLMClient(SlowLLM(0), breaker)
+    events = asyncio.run(collect(client, Deadline(5)))
+    assert [e["message"]["content"] for e in events] == ["a", "b"]
+    resp = asyncio.run(client.chat_once("m", [], 0.0, 10, deadline=Deadline(5)))
+    assert resp["message"]["content"] == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -87,3 +87,94 @@ def test_search_similar_handles_query_response_object(mock_qdrant, mock_settings
     
     assert len(results) == 1
     assert results[0]["source_id"] == "doc4"
+
+def test_asearch_similar_uses_async_client(mock_settings):
+    import asyncio
+    from unittest.mock import AsyncMock
+    from rag_api.app.services.retriever import asearch_similar
+
+    mock_point = MagicMock()
+    mock_point.payload = {"source_id": "doc5", "text": "content"}
+    mock_point.score = 0.7
+
+    mock_client = MagicMock()
+    mock_client.query_points = AsyncMock(return_value=[mock_point])
+
+    dense_mock = MagicMock(tolist=lambda: [0.1, 0.2])
+    sparse_mock = MagicMock()
+    sparse_mock.indices.tolist.return_value = [1, 2]
+    sparse_mock.values.tolist.return_value = [0.5, 0.6]
+
+    with patch("rag_api.app.services.retriever.get_async_qdrant", return_value=mock_client), \
+         patch("rag_api.app.services.retriever.aensure_collection", new_callable=AsyncMock), \
+         patch("rag_api.app.services.retriever.aembed_query", new_callable=AsyncMock) as mock_aembed:
+        mock_aembed.return_value = (dense_mock, sparse_mock)
+        results = asyncio.run(asearch_similar("query", top_k=1))
+
+    assert len(results) == 1
+    assert results[0]["source_id"] == "doc5"
+    assert results[0]["score"] == 0.7
+    mock_client.query_points.assert_awaited_once()
+
+
+def test_search_similar_dense_only_mode(mock_qdrant, mock_settings, mock_embed):
+    mock_qdrant.query_points.return_value = []
+    search_similar("query", top_k=3, mode="dense")
+
+    mock_embed.assert_called_once_with("query", "dense")
+    kwargs = mock_qdrant.query_points.call_args.kwargs
+    assert kwargs["using"] == "dense"
+    assert "prefetch" not in kwargs
+
+
+def test_search_similar_sparse_only_mode(mock_qdrant, mock_settings, mock_embed):
+    mock_qdrant.query_points.return_value = []
+    search_similar("query", top_k=3, mode="sparse")
+
+    kwargs = mock_qdrant.query_points.call_args.kwargs
+    assert kwargs["using"] == "sparse"
+    assert kwargs["query"].indices == [1, 2]
+
+
+def test_auto_mode_routes_keyword_queries_to_sparse():
+    from rag_api.app.services.retrieval_modes import resolve_retrieval_mode
+    assert resolve_retrieval_mode("FMLA policy", "auto") == "sparse"
+    assert resolve_retrieval_mode("What is the leave policy for part-time staff?", "auto") == "hybrid"
+    assert resolve_retrieval_mode("how to request leave", "auto") == "hybrid"
+    assert resolve_retrieval_mode("anything", "dense") == "dense"
+    with pytest.raises(ValueError):
+        resolve_retrieval_mode("anything", "bogus")
+
+
+def test_upsert_payloads_dedups_by_id_and_batches(mock_qdrant, mock_settings):
+    import uuid
+    import numpy as np
+    from rag_api.app.services.retriever import upsert_payloads
+
+    mock_settings.UPSERT_BATCH_SIZE = 2
+    mock_settings.UPSERT_CONCURRENCY = 2
+    mock_settings.UPSERT_WAIT = False
+
+    payloads = [{"hash": f"h{i}", "text": f"chunk {i}"} for i in range(5)]
+    existing_id = str(uuid.uuid5(uuid.NAMESPACE_URL, "h1"))
+    mock_qdrant.retrieve.side_effect = lambda collection_name, ids, **kw: [
+        MagicMock(id=existing_id) for i in ids if i == existing_id
+    ]
+    dense = np.random.rand(5, 4).astype(np.float32)
+    sparse = [MagicMock(indices=np.array([i]), values=np.array([1.0])) for i in range(5)]
+
+    with patch("rag_api.app.services.retriever.ensure_collection"):
+        inserted = upsert_payloads(payloads, (dense, sparse))
+
+    assert inserted == 4
+    # 5 IDs looked up in batches of 2, no per-payload scroll
+    assert mock_qdrant.retrieve.call_count == 3
+    mock_qdrant.scroll.assert_not_called()
+    # 4 new points upserted in batches of 2, without waiting for indexing
+    assert mock_qdrant.upsert.call_count == 2
+    sent = [p for call in mock_qdrant.upsert.call_args_list for p in call.kwargs["points"]]
+    assert existing_id not in {p["id"] for p in sent}
+    assert all(call.kwargs["wait"] is False for call in mock_qdrant.upsert.call_args_list)
+    # Batches run concurrently, so match points by id rather than by send order
+    sent_by_id = {p["id"]: p for p in sent}
+    assert np.allclose(sent_by_id[str(uuid.uuid5(uuid.NAMESPACE_URL, "h0"))]["vector"]["dense"], dense[0])
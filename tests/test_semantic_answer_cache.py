@@ -0,0 +1,142 @@
+import json
+import numpy as np
+import pytest
+from unittest.mock import patch, AsyncMock
+from fastapi.testclient import TestClient
+
+HEADERS = {"Authorization": "Bearer local-key"}
+
+MOCK_CHUNKS = [
+    {
+        "source_id": "leave_policy.pdf",
+        "chunk_id": "chunk_1",
+        "text": "The annual leave is 15 days.",
+        "source_path": "data/docs/leave_policy.pdf",
+        "page": 1,
+        "score": 0.95,
+    }
+]
+
+# Paraphrases of one question map to (almost) the same vector; anything else is orthogonal
+VECTORS = {
+    "how many days of annual leave do i get?": np.array([1.0, 0.0, 0.0], dtype=np.float32),
+    "how many annual leave days do i get?": np.array([0.999, 0.04, 0.0], dtype=np.float32),
+    "what is the dress code?": np.array([0.0, 0.0, 1.0], dtype=np.float32),
+    "and what about the second one?": np.array([0.0, 1.0, 0.0], dtype=np.float32),
+}
+
+
+async def fake_aembed_query(text, mode="hybrid", deadline=None):
+    v = VECTORS[text.lower()]
+    return v / np.linalg.norm(v), None
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def chat_once(self, model, messages, temperature, max_tokens, deadline=None):
+        self.calls += 1
+        return {"message": {"content": "You get 15 days of annual leave."}}
+
+    async def chat_stream(self, model, messages, temperature, max_tokens, deadline=None):
+        self.calls += 1
+        for word in ["You get ", "15 days ", "of annual leave."]:
+            yield {"message": {"content": word}}
+
+
+@pytest.fixture(autouse=True)
+def deps():
+    from app.utils.ttlcache import answer_cache, retrieval_cache
+    answer_cache.clear()
+    retrieval_cache.clear()
+    with patch("rag_api.app.main.get_models"), \
+         patch("app.services.qdrant_client.get_qdrant"), \
+         patch("app.services.semantic_cache.aembed_query", side_effect=fake_aembed_query):
+        yield
+    answer_cache.clear()
+    retrieval_cache.clear()
+
+
+@pytest.fixture
+def client():
+    from rag_api.app.main import app
+    return TestClient(app)
+
+
+def test_query_paraphrase_served_from_semantic_cache(client):
+    llm = CountingLLM()
+    with patch("app.routes.query.asearch_similar", new_callable=AsyncMock, return_value=MOCK_CHUNKS) as mock_search, \
+         patch("app.routes.query.get_llm_client", return_value=llm):
+        first = client.post("/query", json={"question": "How many days of annual leave do I get?"}, headers=HEADERS).json()
+        second = client.post("/query", json={"question": "How many annual leave days do I get?"}, headers=HEADERS).json()
+        other = client.post("/query", json={"question": "What is the dress code?"}, headers=HEADERS).json()
+
+    assert second["answer"] == first["answer"]
+    assert second["sources"] == first["sources"]
+    assert second["usage"]["cached"] is True
+    assert "cached" not in other["usage"]
+    assert llm.calls == 2
+    assert mock_search.await_count == 2
+
+
+def test_chat_completions_paraphrase_skips_retrieval_and_llm(client):
+    llm = CountingLLM()
+
+    def ask(question, stream):
+        payload = {"model": "test-model", "messages": [{"role": "user", "content": question}], "stream": stream}
+        return client.post("/v1/chat/completions", json=payload, headers=HEADERS)
+
+    from app.services.prompt import context_packer
+
+    with patch("app.routes.stream.asearch_similar", new_callable=AsyncMock, return_value=MOCK_CHUNKS) as mock_search, \
+         patch("app.routes.stream.get_llm_client", return_value=llm), \
+         patch.object(context_packer, "pack", wraps=context_packer.pack) as mock_pack:
+        streamed = ask("How many days of annual leave do I get?", stream=True).text
+        resp = ask("How many annual leave days do I get?", stream=False).json()
+
+    deltas = [
+        json.loads(line[6:])["choices"][0]["delta"].get("content", "")
+        for line in streamed.split("\n")
+        if line.startswith("data: ") and line[6:].strip() != "[DONE]"
+    ]
+    assert resp["choices"][0]["message"]["content"] == "".join(deltas)
+    assert llm.calls == 1
+    assert mock_search.await_count == 1
+    assert mock_pack.call_count == 1  # the semantic hit packs no context
+
+
+def test_semantic_cache_scoped_by_model(client):
+    llm = CountingLLM()
+
+    def ask(model):
+        payload = {"model": model, "messages": [{"role": "user", "content": "How many days of annual leave do I get?"}]}
+        return client.post("/v1/chat/completions", json=payload, headers=HEADERS)
+
+    with patch("app.routes.stream.asearch_similar", new_callable=AsyncMock, return_value=MOCK_CHUNKS), \
+         patch("app.routes.stream.get_llm_client", return_value=llm):
+        ask("model-a")
+        ask("model-b")
+        ask("model-a")
+
+    assert llm.calls == 2
+
+
+def test_semantic_cache_scoped_by_chat_history(client):
+    llm = CountingLLM()
+
+    def ask(history):
+        content = f"<chat_history>\n{history}\nUSER: And what about the second one?\n</chat_history>"
+        payload = {"model": "test-model", "messages": [{"role": "user", "content": content}]}
+        return client.post("/v1/chat/completions", json=payload, headers=HEADERS)
+
+    leave = "USER: List the leave types.\nASSISTANT: Annual and sick leave."
+    dress = "USER: List the dress codes.\nASSISTANT: Casual and formal."
+    with patch("app.routes.stream.asearch_similar", new_callable=AsyncMock, return_value=MOCK_CHUNKS), \
+         patch("app.routes.stream.get_llm_client", return_value=llm):
+        ask(leave)
+        ask(dress)
+        ask(leave + "  ")
+
+    # Same last message after different turns is a different question; the same turns reuse the answer
+    assert llm.calls == 2
@@ -0,0 +1,69 @@
+import asyncio
+
+try:
+    from app.utils.singleflight import SingleFlight
+except ModuleNotFoundError:
+    from rag_api.app.utils.singleflight import SingleFlight
+
+
+def test_identical_requests_share_one_generation():
+    flights = SingleFlight()
+    calls = []
+
+    async def producer():
+        calls.append(1)
+        for delta in ["Hel", "lo", " world"]:
+            yield delta
+            await asyncio.sleep(0.01)
+
+    async def consume(delay):
+        await asyncio.sleep(delay)
+        flight, leader = flights.join("key", producer)
+        return leader, "".join([d async for d in flight.subscribe()])
+
+    async def scenario():
+        # The late joiner arrives after some deltas were already emitted
+        return await asyncio.gather(consume(0), consume(0.015), consume(0))
+
+    results = asyncio.run(scenario())
+    assert calls == [1]
+    assert [leader for leader, _ in results] == [True, False, False]
+    assert all(text == "Hello world" for _, text in results)
+    assert flights.stats() == {"in_flight": 0, "started": 1, "coalesced": 2}
+
+
+def test_generation_survives_leader_disconnect_and_key_is_released():
+    flights = SingleFlight()
+
+    async def producer():
+        yield "a"
+        await asyncio.sleep(0.01)
+        yield "b"
+
+    async def scenario():
+        flight, _ = flights.join("key", producer)
+        async for _ in flight.subscribe():
+            break  # the leader's client goes away after the first delta
+        follower, leader = flights.join("key", producer)
+        text = "".join([d async for d in follower.subscribe()])
+        return leader, text, flights.join("key", producer)[1]
+
+    leader, text, restarted = asyncio.run(scenario())
+    assert not leader
+    assert text == "ab"
+    assert restarted
+
+
+def test_failed_producer_finishes_the_flight():
+    flights = SingleFlight()
+
+    async def producer():
+        yield "partial"
+        raise RuntimeError("boom")
+
+    async def scenario():
+        flight, _ = flights.join("key", producer)
+        return [d async for d in flight.subscribe()]
+
+    assert asyncio.run(scenario()) == ["partial"]
+    assert flights.stats()["in_flight"] == 0
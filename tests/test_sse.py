@@ -0,0 +1,37 @@
+import json
+
+try:
+    from app.utils.sse import ChunkEncoder, ORJSONResponse, SSE_DONE, sse_frame
+except ModuleNotFoundError:
+    from rag_api.app.utils.sse import ChunkEncoder, ORJSONResponse, SSE_DONE, sse_frame
+
+
+def expected(delta, finish_reason=None):
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion.chunk",
+        "created": 1700000000,
+        "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def test_chunks_match_openai_schema():
+    encoder = ChunkEncoder("chatcmpl-1", "gpt-4o-mini", created=1700000000)
+    assert json.loads(encoder.role()) == expected({"role": "assistant"})
+    assert json.loads(encoder.stop()) == expected({}, "stop")
+    text = 'Quote " backslash \\ newline \n unicode é 日本  '
+    assert json.loads(encoder.content(text)) == expected({"content": text})
+
+
+def test_sse_framing():
+    encoder = ChunkEncoder("chatcmpl-1", "m")
+    frame = sse_frame(encoder.content("hi"))
+    assert frame.startswith(b"data: {") and frame.endswith(b"}\n\n")
+    assert SSE_DONE == b"data: [DONE]\n\n"
+
+
+def test_orjson_response_renders_bytes():
+    response = ORJSONResponse(content={"answer": "é", "n": 1})
+    assert json.loads(response.body) == {"answer": "é", "n": 1}
+    assert response.media_type == "application/json"
@@ -1,10 +1,13 @@
 import pytest
 import asyncio
+import numpy as np
 
 try:
     from app.utils.ttlcache import SemanticTTLCache
+    from app.utils.caching import make_cache_key
 except ModuleNotFoundError:
     from rag_api.app.utils.ttlcache import SemanticTTLCache
+    from rag_api.app.utils.caching import make_cache_key
 
 
 def test_ttlcache_dict_key():
@@ -50,3 +53,161 @@ def test_ttlcache_string_key():
         assert val == "test_value"
 
     asyncio.run(run_test())
+
+
+def _unit(v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_semantic_lookup_scoped_by_context():
+    cache = SemanticTTLCache(maxsize=10, ttl_seconds=60, similarity_threshold=0.95)
+    base = _unit([1.0, 0.0, 0.0, 0.0])
+    near = _unit([1.0, 0.1, 0.0, 0.0])
+    far = _unit([0.0, 1.0, 0.0, 0.0])
+
+    async def run_test():
+        await cache.set("k1", "answer 1", emb=base, context_str="model=a")
+        await cache.set("k2", "answer 2", emb=far, context_str="model=a")
+        assert await cache.get_semantically(near, "model=a") == "answer 1"
+        # Same question under a different context never matches
+        assert await cache.get_semantically(near, "model=b") is None
+        assert await cache.get_semantically(_unit([0, 0, 1.0, 0]), "model=a") is None
+
+    asyncio.run(run_test())
+
+
+def test_semantic_entries_evicted_with_lru():
+    cache = SemanticTTLCache(maxsize=3, ttl_seconds=60, similarity_threshold=0.99, shards=1)
+    vecs = [_unit(np.eye(4)[i]) for i in range(4)]
+
+    async def run_test():
+        for i, v in enumerate(vecs):
+            await cache.set(f"k{i}", f"v{i}", emb=v, context_str="ctx")
+        # k0 fell out; its row was reused and the others still resolve
+        assert await cache.get_semantically(vecs[0], "ctx") is None
+        for i in range(1, 4):
+            assert await cache.get_semantically(vecs[i], "ctx") == f"v{i}"
+        await cache.set("k2", "v2b", emb=vecs[2], context_str="ctx")
+        assert await cache.get_semantically(vecs[2], "ctx") == "v2b"
+        partitions = cache.shards[0].partitions
+        assert len(partitions[next(iter(partitions))]) == 3
+
+    asyncio.run(run_test())
+
+
+def test_semantic_ann_index_finds_near_duplicates():
+    rng = np.random.default_rng(1)
+    cache = SemanticTTLCache(maxsize=5000, ttl_seconds=60, similarity_threshold=0.96, ann_tables=4, ann_min_size=100)
+    vecs = [_unit(rng.standard_normal(64)) for _ in range(3000)]
+
+    async def run_test():
+        for i, v in enumerate(vecs):
+            await cache.set(f"k{i}", i, emb=v, context_str="ctx")
+        hits = 0
+        for i in range(0, 3000, 30):
+            noisy = _unit(vecs[i] + 0.02 * rng.standard_normal(64))
+            hits += (await cache.get_semantically(noisy, "ctx")) == i
+        assert hits >= 95
+
+    asyncio.run(run_test())
+
+
+def test_expiry_pops_only_expired_entries():
+    cache = SemanticTTLCache(maxsize=100, ttl_seconds=60, shards=4)
+
+    async def run_test():
+        for i in range(10):
+            await cache.set(f"k{i}", i, emb=np.eye(10)[i], context_str="ctx")
+        # Backdate the first three entries' expiry, as if their TTL had run out
+        for shard in cache.shards:
+            for k in list(shard.expiry):
+                if k in ("k0", "k1", "k2"):
+                    shard.expiry[k] = 0.0
+                    shard.expiry.move_to_end(k, last=False)
+        assert await cache.get("k0") is None
+        assert await cache.get_semantically(np.eye(10)[1], "ctx") is None
+        assert await cache.get("k5") == 5
+        assert await cache.get_semantically(np.eye(10)[7], "ctx") == 7
+        assert len(cache) == 7
+
+    asyncio.run(run_test())
+
+
+def test_sharded_cache_bounds_total_size():
+    cache = SemanticTTLCache(maxsize=64, ttl_seconds=60, shards=8)
+
+    async def run_test():
+        for i in range(1000):
+            await cache.set(f"key-{i}", i)
+        assert len(cache) <= 64
+        assert await cache.get("key-999") == 999
+
+    asyncio.run(run_test())
+
+
+def test_cache_key_is_fixed_size_digest():
+    messages = [{"role": "system", "content": "x" * 10000}, {"role": "user", "content": "hello"}]
+    key = make_cache_key("gpt-4", messages, 0.7, 100, "v2")
+    assert len(key) == 32
+    assert key == make_cache_key("gpt-4", [dict(m) for m in messages], 0.7, 100, "v2")
+    assert key != make_cache_key("gpt-4", messages, 0.7, 100, "v3")
+
+
+def test_byte_budget_evicts_lru_entries():
+    cache = SemanticTTLCache(maxsize=1000, ttl_seconds=60, shards=1, max_bytes=20_000)
+
+    async def run_test():
+        for i in range(20):
+            await cache.set(f"k{i}", "x" * 2000)
+        stats = cache.stats()
+        assert stats["bytes"] <= 20_000
+        assert 5 <= stats["entries"] < 20
+        # Oldest entries went first
+        assert await cache.get("k0") is None
+        assert await cache.get("k19") == "x" * 2000
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    asyncio.run(run_test())
+
+
+def test_entry_sizes_are_released_on_eviction():
+    cache = SemanticTTLCache(maxsize=4, ttl_seconds=60, shards=1)
+
+    async def run_test():
+        chunks = [{"text": "y" * 500, "source_id": "doc"}] * 3
+        for i in range(10):
+            await cache.set(f"k{i}", chunks, emb=np.ones(8), context_str="ctx")
+        per_entry = cache.stats()["bytes"] / 4
+        assert per_entry > 500
+        cache.clear()
+        assert cache.stats()["bytes"] == 0
+
+    asyncio.run(run_test())
+
+
+def test_stale_entries_are_served_and_refreshed_once():
+    cache = SemanticTTLCache(maxsize=10, ttl_seconds=0, stale_seconds=60)
+    refreshed = []
+
+    async def refresh():
+        await asyncio.sleep(0)
+        refreshed.append(1)
+        await cache.set("k", "fresh")
+
+    async def scenario():
+        await cache.set("k", "old", emb=[1.0, 0.0], context_str="ctx")
+        # Past the TTL: plain and semantic lookups miss, the stale path still serves it
+        assert await cache.get("k") is None
+        assert await cache.get_semantically([1.0, 0.0], "ctx") is None
+        assert await cache.get_allow_stale("k") == ("old", True)
+        assert cache.schedule_refresh("k", refresh)
+        assert not cache.schedule_refresh("k", refresh)
+        await asyncio.sleep(0.01)
+        return await cache.get_allow_stale("k")
+
+    # ttl_seconds=0 makes the refreshed value stale immediately too
+    assert asyncio.run(scenario()) == ("fresh", True)
+    assert refreshed == [1]
+    assert cache.stats()["stale_hits"] == 2
+    assert cache.stats()["refreshes"] == 1
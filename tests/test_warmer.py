@@ -0,0 +1,143 @@
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+
+try:
+    from app.services.warmer import CacheWarmer
+except ModuleNotFoundError:
+    from rag_api.app.services.warmer import CacheWarmer
+
+
+def test_top_questions_ranked_and_persisted(tmp_path):
+    warmer = CacheWarmer(str(tmp_path / "stats.json"), top_n=2)
+    for q in ["a", "b", "b", "b", "c", "c", "c", "c", "  "]:
+        warmer.record(q, model=None)
+    warmer.record("a", model="m")
+    assert [q for q, _ in warmer.top()] == ["c", "b"]
+    assert warmer.top(3)[2] == ("a", {"model": "m"})
+    warmer.save()
+
+    restarted = CacheWarmer(str(tmp_path / "stats.json"), top_n=1)
+    assert restarted.load() == 3
+    assert restarted.top() == [("c", {"model": None})]
+
+
+def test_tracking_is_bounded():
+    warmer = CacheWarmer("unused.json", max_tracked=4)
+    for _ in range(10):
+        warmer.record("hot")
+    for i in range(10):
+        warmer.record(f"cold{i}")
+    assert len(warmer.counts) <= 4
+    assert warmer.top(1)[0][0] == "hot"
+
+
+def test_warm_runs_top_questions_with_their_params():
+    warmer = CacheWarmer("unused.json", top_n=2, concurrency=1)
+    for q in ["x", "y", "y", "z", "z", "z"]:
+        warmer.record(q, temperature=0.5)
+    calls = []
+
+    async def warm_fn(question, **params):
+        calls.append((question, params))
+        if question == "y":
+            raise RuntimeError("llm down")
+        return True
+
+    assert asyncio.run(warmer.warm(warm_fn)) == 1
+    assert calls == [("z", {"temperature": 0.5}), ("y", {"temperature": 0.5})]
+    assert warmer.stats()["warmed"] == 1
+
+
+@pytest.fixture
+def clean_caches():
+    from app.utils.ttlcache import answer_cache, retrieval_cache
+    answer_cache.clear()
+    retrieval_cache.clear()
+    yield answer_cache
+    answer_cache.clear()
+    retrieval_cache.clear()
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def chat_stream(self, model, messages, temperature, max_tokens, deadline=None):
+        self.calls += 1
+        yield {"message": {"content": "Leave is 15 days."}}
+
+
+def test_warm_chat_answer_fills_answer_cache(clean_caches):
+    from app.routes import stream
+
+    llm = FakeLLM()
+    chunks = [{"source_id": "leave.pdf", "text": "Annual leave is 15 days.", "page": 2}]
+    with patch("app.routes.stream.asearch_similar", new_callable=AsyncMock, return_value=chunks), \
+         patch("app.routes.stream.get_llm_client", return_value=llm), \
+         patch("app.services.semantic_cache.aembed_query", new_callable=AsyncMock, side_effect=RuntimeError("no model")):
+        assert asyncio.run(stream.warm_chat_answer("How long is leave?"))
+        # Already cached and fresh: nothing to generate
+        assert not asyncio.run(stream.warm_chat_answer("How long is leave?"))
+
+    assert llm.calls == 1
+    assert len(clean_caches) == 1
+    (answer,) = [value for shard in clean_caches.shards for _, value, _ in shard.store.values()]
+    assert answer.startswith("Leave is 15 days.")
+    assert "leave.pdf" in answer
+
+
+def test_workers_merge_counts_into_the_shared_file(tmp_path):
+    path = str(tmp_path / "stats.json")
+    worker_a, worker_b = CacheWarmer(path), CacheWarmer(path)
+    for _ in range(3):
+        worker_a.record("a")
+    worker_b.record("a")
+    worker_b.record("b")
+    worker_a.save()
+    worker_b.save()
+    worker_a.save()  # nothing new: must not count "a" again
+
+    assert worker_b.counts["a"]["count"] == 4 and worker_b.counts["b"]["count"] == 1
+    restarted = CacheWarmer(path)
+    restarted.load()
+    assert restarted.counts == worker_b.counts
+    assert sorted(p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")) == []
+
+
+def test_only_one_worker_warms(tmp_path):
+    path = str(tmp_path / "stats.json")
+    leader, follower = CacheWarmer(path), CacheWarmer(path)
+    assert leader._try_lead() and not follower._try_lead()
+    leader._resign()
+    assert follower._try_lead()
+    follower._resign()
+
+
+def _run_workers(path, shared_cache):
+    calls = []
+
+    async def warm_fn(question, **params):
+        calls.append(question)
+        return True
+
+    async def scenario():
+        workers = [CacheWarmer(path, shared_cache=shared_cache, jitter_seconds=0.05) for _ in range(3)]
+        for w in workers:
+            w.record("hot")
+        tasks = [asyncio.create_task(w.run(warm_fn, save_seconds=0.05)) for w in workers]
+        await asyncio.sleep(0.3)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(scenario())
+    return calls
+
+
+def test_shared_cache_is_warmed_by_one_worker(tmp_path):
+    assert _run_workers(str(tmp_path / "stats.json"), shared_cache=True) == ["hot"]
+
+
+def test_in_process_caches_are_each_warmed(tmp_path):
+    assert _run_workers(str(tmp_path / "stats.json"), shared_cache=False) == ["hot"] * 3